@@ -0,0 +1,61 @@
+""" Measures memory held by resident articles and the cost of deduplicating them
+
+Run from the repository root: python -m benchmarks.bench_article_memory [--articles 1000000]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from main_reader.article import Article
+
+
+class LegacyArticle:
+    """The previous representation: plain class with a per-instance __dict__ and no __hash__"""
+
+    def __init__(self, title, link, date, source, image):
+        self.title = title
+        self.link = link
+        self.date = date
+        self.source = source
+        self.image = image
+
+
+def make_fields(count):
+    """Generates unique titles and links, sources and images are shared like in real feeds"""
+    source = 'Associated Press'
+    image = '---'
+    return [(f'Title of the article number {i}', f'https://news.example.com/2022/09/article-{i}.html',
+             f'2022-09-{i % 28 + 1:02d}T17:11:56Z', source, image) for i in range(count)]
+
+
+def measure(cls, fields):
+    """Returns bytes allocated for the articles themselves, the strings are allocated beforehand"""
+    gc.collect()
+    tracemalloc.start()
+    articles = [cls(*item) for item in fields]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return articles, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Article memory benchmark')
+    parser.add_argument('--articles', type=int, default=1000000, help='Number of resident articles')
+    args = parser.parse_args()
+
+    fields = make_fields(args.articles)
+    print(f'{"representation":<16}{"MiB":>10}{"bytes/article":>16}')
+    for name, cls in (('legacy', LegacyArticle), ('slotted', Article)):
+        articles, size = measure(cls, fields)
+        print(f'{name:<16}{size / 2 ** 20:>10.1f}{size / args.articles:>16.1f}')
+        del articles
+
+    articles = [Article(*item) for item in fields] * 2
+    started = time.perf_counter()
+    unique = set(articles)
+    print(f'set() dedup of {len(articles)} articles to {len(unique)}: {time.perf_counter() - started:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
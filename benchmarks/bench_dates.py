@@ -0,0 +1,55 @@
+""" Compares date parsing throughput of dateparser and main_reader.dates
+
+Run from the repository root: python -m benchmarks.bench_dates [--entries 10000]
+"""
+import argparse
+import datetime
+import email.utils
+import random
+import time
+
+
+FORMATS = {
+    'rfc822': email.utils.format_datetime,
+    'iso8601': lambda date: date.strftime('%Y-%m-%dT%H:%M:%SZ'),
+    'cache': str,
+    'odd': lambda date: date.strftime('%d %B %Y, %I:%M %p'),
+}
+
+
+def make_dates(count, kind, seed=0):
+    """Generates dates of one of the formats met in feeds and in the cache"""
+    rnd = random.Random(seed)
+    start = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+    formatter = FORMATS[kind]
+    return [formatter(start + datetime.timedelta(seconds=rnd.randrange(365 * 24 * 3600))) for _ in range(count)]
+
+
+def measure(parse, values):
+    """Returns entries parsed per second"""
+    started = time.perf_counter()
+    for value in values:
+        parse(value)
+    return len(values) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Date parsing benchmark')
+    parser.add_argument('--entries', type=int, default=10000, help='Number of dates to parse')
+    args = parser.parse_args()
+
+    import dateparser
+    from main_reader import dates
+
+    print(f'{"format":<10}{"dateparser s/10k":>18}{"parse_date s/10k":>18}{"speedup":>10}')
+    for kind in FORMATS:
+        values = make_dates(args.entries, kind)
+        dateparser.parse(values[0])
+        before = measure(dateparser.parse, values)
+        dates.parse_fallback.cache_clear()
+        after = measure(dates.parse_date, values)
+        print(f'{kind:<10}{10000 / before:>18.3f}{10000 / after:>18.3f}{after / before:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+""" Compares caching many feeds with the threads of Reader.fetch and with the process pool of --ingest
+
+Run from the repository root:
+python -m benchmarks.bench_ingest [--feeds 200] [--entries 200] [--processes 1 2 4]
+
+Feeds are generated and served from a local HTTP server, every run writes to a new cache.
+The process pool only pays off with several CPUs, on a single CPU it adds the cost of sending documents.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from unittest.mock import MagicMock
+
+from benchmarks import feedgen
+from main_reader import database
+from main_reader import helper
+from main_reader import ingest
+from main_reader.reader import Reader
+
+
+def write_feeds(directory, feeds, entries):
+    """Writes feeds with different entries, returns their names"""
+    names = []
+    for number in range(feeds):
+        name = f'feed-{number}.xml'
+        with open(os.path.join(directory, name), 'wb') as file:
+            file.write(feedgen.make_rss(feedgen.make_entries(entries, seed=number), 'rfc822', 'media'))
+        names.append(name)
+    return names
+
+
+def new_cache(directory, name):
+    """Connection to an empty cache"""
+    connection = database.connect(os.path.join(directory, name + '.db'))
+    helper.init_database(connection)
+    return connection
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk ingestion benchmark')
+    parser.add_argument('--feeds', type=int, default=200, help='Number of feeds')
+    parser.add_argument('--entries', type=int, default=200, help='Entries of every feed')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4], help='Sizes of the process pool')
+    parser.add_argument('--workers', type=int, default=8, help='Download threads')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    server, base_url = feedgen.serve(directory)
+    try:
+        urls = [base_url + name for name in write_feeds(directory, args.feeds, args.entries)]
+        print(f'{args.feeds} feeds x {args.entries} entries, {os.cpu_count()} CPU(s)')
+        print(f'{"mode":<24}{"seconds":>10}{"news/s":>10}')
+
+        connection = new_cache(directory, 'threads')
+        started = time.perf_counter()
+        reader = Reader(workers=args.workers, deduplicate=False, archive_payloads=False, logger=MagicMock(),
+                        connection=connection)
+        news = reader.fetch(urls)
+        seconds = time.perf_counter() - started
+        print(f'{"threads":<24}{seconds:>10.2f}{len(news) / seconds:>10.0f}')
+
+        for processes in args.processes:
+            connection = new_cache(directory, f'processes-{processes}')
+            started = time.perf_counter()
+            report = ingest.ingest(urls, connection, processes, args.workers)
+            seconds = time.perf_counter() - started
+            print(f'{f"ingest, {processes} process(es)":<24}{seconds:>10.2f}{report.rows / seconds:>10.0f}')
+    finally:
+        server.shutdown()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
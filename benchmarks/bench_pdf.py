@@ -0,0 +1,50 @@
+""" Compares wall time of the single render and the chunked process-pool render of the PDF export
+
+Run from the repository root: python -m benchmarks.bench_pdf [--articles 100 1000 10000] [--workers N]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from unittest.mock import MagicMock
+
+from main_reader import helper
+from main_reader.article import Article
+
+
+def make_news(count):
+    """Generates articles the way they come from a feed"""
+    return [Article(f'Title of the article number {i}', f'https://news.example.com/article-{i}.html',
+                    '2022-09-18T17:11:56Z', 'Associated Press', '---') for i in range(count)]
+
+
+def measure(news, workers, chunk_size):
+    """Returns seconds spent on the export to a temporary directory"""
+    path = tempfile.mkdtemp()
+    try:
+        started = time.perf_counter()
+        helper.save_news_pdf(news, path, MagicMock(), workers, chunk_size)
+        return time.perf_counter() - started
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PDF export benchmark')
+    parser.add_argument('--articles', type=int, nargs='+', default=[100, 1000, 10000], help='Sizes of exports')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes of the chunked render')
+    parser.add_argument('--chunk_size', type=int, default=helper.PDF_CHUNK_SIZE, help='News per chunk')
+    args = parser.parse_args()
+
+    helper.render_pdf(helper.HTML_HEAD + helper.HTML_FOOTER)
+    print(f'{"articles":>10}{"single s":>12}{f"{args.workers} workers s":>16}{"speedup":>10}')
+    for count in args.articles:
+        news = make_news(count)
+        single = measure(news, 1, args.chunk_size)
+        parallel = measure(news, args.workers, args.chunk_size)
+        print(f'{count:>10}{single:>12.2f}{parallel:>16.2f}{single / parallel:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
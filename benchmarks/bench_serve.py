@@ -0,0 +1,131 @@
+""" Load test of --serve: latency and throughput of the JSON API against a process started per query
+
+Run from the repository root:
+python -m benchmarks.bench_serve [--news 20000] [--clients 8] [--requests 500] [--url http://127.0.0.1:8080]
+
+Without --url a cache of generated news is created and served from this process on a free localhost port.
+Every client thread keeps one connection alive and asks for a mix of dates, sources and latest news.
+"""
+import argparse
+import http.client
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from unittest.mock import MagicMock
+
+from main_reader import database
+from main_reader import helper
+from main_reader import server
+from main_reader.article import Article
+
+FEEDS = 50
+DAYS = 30
+
+
+def make_cache(path, count):
+    """Writes generated news of FEEDS feeds over DAYS days"""
+    connection = database.connect(path)
+    helper.init_database(connection)
+    for feed in range(FEEDS):
+        news = [Article(f'Story {number} of feed {feed}', f'https://news.example.com/{feed}/{number}',
+                        f'2022-09-{1 + number % DAYS:02}T{number % 24:02}:00:00Z', f'Agency {feed % 7}', '---')
+                for number in range(count // FEEDS)]
+        helper.save_news(news, connection, f'https://feeds.example.com/{feed}.xml')
+    connection.close()
+
+
+def targets(seed):
+    """Endless mix of requests a dashboard sends"""
+    rnd = random.Random(seed)
+    while True:
+        choice = rnd.random()
+        if choice < 0.4:
+            yield '/news/latest?limit=20'
+        elif choice < 0.7:
+            yield f'/news?date=202209{rnd.randint(1, DAYS):02}&limit=50'
+        else:
+            yield f'/news?source=https://feeds.example.com/{rnd.randrange(FEEDS)}.xml&limit=50'
+
+
+def client(address, count, seed, latencies):
+    """Sends count requests over one keep-alive connection"""
+    connection = http.client.HTTPConnection(*address)
+    requests = targets(seed)
+    for _ in range(count):
+        started = time.perf_counter()
+        connection.request('GET', next(requests))
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+
+
+def load(address, clients, count):
+    """Runs the clients, returns seconds and latencies of all requests"""
+    latencies = []
+    threads = [threading.Thread(target=client, args=(address, count, seed, latencies)) for seed in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies
+
+
+def report(name, seconds, latencies):
+    """Prints throughput and latency percentiles"""
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f'{name:<28}{len(latencies) / seconds:>10.0f}{quantiles[49] * 1000:>10.2f}{quantiles[98] * 1000:>10.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of the JSON API')
+    parser.add_argument('--news', type=int, default=20000, help='Number of generated news')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent client connections')
+    parser.add_argument('--requests', type=int, default=500, help='Requests of every client')
+    parser.add_argument('--processes', type=int, default=10, help='Queries run as a new rss_reader process')
+    parser.add_argument('--url', help='Base url of a running server, the generated cache is used otherwise')
+    args = parser.parse_args()
+
+    print(f'{"mode":<28}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}')
+    if args.url:
+        parts = urllib.parse.urlsplit(args.url)
+        seconds, latencies = load((parts.hostname, parts.port or 80), args.clients, args.requests)
+        report('server', seconds, latencies)
+        return
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'news.db')
+    try:
+        make_cache(path, args.news)
+        for name, ttl in (('server, result cache off', 0), ('server', server.CACHE_TTL)):
+            api = server.Api(path, cache_ttl=ttl)
+            api_server = server.ApiServer(('127.0.0.1', 0), api, MagicMock())
+            threading.Thread(target=api_server.serve_forever, daemon=True).start()
+            try:
+                report(name, *load(api_server.server_address, args.clients, args.requests))
+            finally:
+                api_server.shutdown()
+                api_server.server_close()
+                api.close()
+
+        latencies = []
+        for day in range(args.processes):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, '-m', 'main_reader.rss_reader', '--db', path, '--json', '--limit', '50',
+                            '--date', f'202209{1 + day % DAYS:02}'], stdout=subprocess.DEVNULL, check=True)
+            latencies.append(time.perf_counter() - started)
+        report('process per query', sum(latencies), latencies)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+""" Times every stage of the reader on synthetic feeds and checks the timings against a baseline
+
+Run from the repository root:
+python -m benchmarks.bench_stages [--entries 100 1000] [--output results.json] [--baseline baseline.json]
+
+Timings are written as JSON. With --baseline the run fails with exit code 1 when a stage is slower than
+its baseline timing by more than --threshold times. Baselines are only comparable on the same machine.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from unittest.mock import MagicMock
+
+from benchmarks import feedgen
+from main_reader import database
+from main_reader import dates
+from main_reader import helper
+from main_reader import stream
+from main_reader import transport
+
+URL = 'https://news.example.com/rss'
+# Differences below this are noise of the timer and the scheduler, not regressions
+NOISE_SECONDS = 0.002
+
+
+def measure(function, repeat, setup=None):
+    """Runs the function repeat times, returns the best and the median seconds and the last result
+
+    setup runs before every run and is not timed.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return min(timings), statistics.median(timings), result
+
+
+class Stages:
+    """Stages of the reader run one after another on the same feed, every one gets the output of the previous"""
+
+    def __init__(self, document, directory, url=None, images=None):
+        self.document = document
+        self.directory = directory
+        self.url = url
+        self.images = images
+        self.entries = None
+        self.articles = None
+        self.connection = None
+
+    def fetch(self):
+        # Downloads the way the reader does, over the keep-alive transport, parsing is the next stage
+        with transport.get_transport().open(self.url) as response:
+            return response.read()
+
+    def parse(self):
+        import feedparser
+
+        self.entries = feedparser.parse(self.document)['entries']
+        return self.entries
+
+    def stream(self):
+        return list(helper.create_articles(stream.FeedStream(io.BytesIO(self.document))))
+
+    def dates(self):
+        dates.parse_fallback.cache_clear()
+        return [dates.parse_date(entry.get('published', '---')) for entry in self.entries]
+
+    def create_articles(self):
+        dates.parse_fallback.cache_clear()
+        self.articles = list(helper.create_articles(self.entries))
+        return self.articles
+
+    def before_save_news(self):
+        # Every run inserts all news, unchanged news are skipped and timed by save_news_unchanged
+        if self.connection is None:
+            self.connection = database.connect(os.path.join(self.directory, 'news.db'))
+            helper.init_database(self.connection)
+        with self.connection:
+            self.connection.execute('DELETE FROM news')
+
+    def save_news(self):
+        helper.save_news(self.articles, self.connection, URL)
+
+    def save_news_unchanged(self):
+        helper.save_news(self.articles, self.connection, URL)
+
+    def get_cashed_news(self):
+        days = sorted({article.date.strftime('%Y%m%d') for article in self.articles})
+        return [article for day in days for article in helper.get_cashed_news(day, self.connection, URL)]
+
+    def json(self):
+        return [helper.make_json(article) for article in self.articles]
+
+    def ndjson(self):
+        helper.write_news(self.articles, 'ndjson', io.StringIO())
+
+    def html(self):
+        helper.save_news_html(self.articles, self.directory, MagicMock(), images=self.images)
+
+    def pdf(self):
+        helper.save_news_pdf(self.articles, self.directory, MagicMock(), images=self.images)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+def run_scenario(count, feed_format, date_format, media, repeat, pdf_entries, url=None):
+    """Times every stage on a feed of count entries, returns timings by stage name"""
+    directory = tempfile.mkdtemp()
+    # Exports read images from local files as they do with the image cache, so no stage touches the network
+    images = None
+    if media != 'none':
+        images = feedgen.write_images(os.path.join(directory, 'images'),
+                                      [entry['image'] for entry in feedgen.make_entries(count)])
+    stages = Stages(feedgen.make_feed(count, feed_format, date_format, media), directory, url, images)
+    names = ['fetch'] if url else []
+    names += ['parse', 'stream', 'dates', 'create_articles', 'save_news', 'save_news_unchanged', 'get_cashed_news',
+              'json', 'ndjson', 'html']
+    if count <= pdf_entries:
+        names.append('pdf')
+    results = {}
+    try:
+        for name in names:
+            best, median, _ = measure(getattr(stages, name), repeat, getattr(stages, 'before_' + name, None))
+            results[name] = {'seconds': best, 'median': median, 'per_entry_us': best / count * 1e6}
+    finally:
+        stages.close()
+        shutil.rmtree(directory)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns descriptions of stages slower than the baseline by more than threshold times"""
+    regressions = []
+    for name, timing in results['stages'].items():
+        before = baseline.get('stages', {}).get(name)
+        if before is None:
+            continue
+        slower = timing['seconds'] - before['seconds']
+        if timing['seconds'] > before['seconds'] * threshold and slower > NOISE_SECONDS:
+            regressions.append(f'{name}: {before["seconds"] * 1000:.1f} ms -> {timing["seconds"] * 1000:.1f} ms '
+                               f'({timing["seconds"] / before["seconds"]:.2f}x)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-stage benchmark of the reader')
+    parser.add_argument('--entries', type=int, nargs='+', default=[100, 1000], help='Sizes of feeds')
+    parser.add_argument('--format', choices=['rss', 'atom'], nargs='+', default=['rss', 'atom'], help='Feed formats')
+    parser.add_argument('--dates', choices=list(feedgen.DATE_FORMATS), default='rfc822', help='Format of dates')
+    parser.add_argument('--media', choices=feedgen.MEDIA, default='media', help='How images are attached')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of every stage, the best one is reported')
+    parser.add_argument('--pdf_entries', type=int, default=100, help='The PDF export is timed up to this size')
+    parser.add_argument('--http', action='store_true', help='Also time fetching the feed from a local HTTP server')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.5, help='Allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    server = base_url = feed_directory = None
+    if args.http:
+        feed_directory = tempfile.mkdtemp()
+        server, base_url = feedgen.serve(feed_directory)
+
+    helper.render_pdf(helper.HTML_HEAD + helper.HTML_FOOTER)
+    results = {'python': platform.python_version(), 'platform': platform.platform(), 'dates': args.dates,
+               'media': args.media, 'repeat': args.repeat, 'stages': {}}
+    print(f'{"stage":<36}{"best ms":>10}{"median ms":>11}{"us/entry":>10}')
+    try:
+        for feed_format in args.format:
+            for count in args.entries:
+                url = None
+                if args.http:
+                    path = feedgen.write_feed(feed_directory, count, feed_format, args.dates, args.media)
+                    url = base_url + os.path.basename(path)
+                timings = run_scenario(count, feed_format, args.dates, args.media, args.repeat, args.pdf_entries,
+                                       url)
+                for stage, timing in timings.items():
+                    name = f'{feed_format}/{count}/{stage}'
+                    results['stages'][name] = timing
+                    print(f'{name:<36}{timing["seconds"] * 1000:>10.2f}{timing["median"] * 1000:>11.2f}'
+                          f'{timing["per_entry_us"]:>10.1f}')
+    finally:
+        if server:
+            server.shutdown()
+            shutil.rmtree(feed_directory)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f'Stages slower than the baseline by more than {args.threshold}x:', *regressions,
+                  sep='\n  ', file=sys.stderr)
+            raise SystemExit(1)
+        print(f'No stage is slower than the baseline by more than {args.threshold}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+""" Synthetic RSS 2.0 and Atom feeds for offline benchmarks
+
+Run from the repository root to write feeds to a directory and serve them:
+python -m benchmarks.feedgen DIRECTORY [--entries 1000] [--format rss] [--dates rfc822] [--media media] [--serve]
+"""
+import argparse
+import datetime
+import email.utils
+import functools
+import http.server
+import os
+import random
+import threading
+from xml.sax.saxutils import escape, quoteattr
+
+DATE_FORMATS = {
+    'rfc822': email.utils.format_datetime,
+    'iso8601': lambda date: date.strftime('%Y-%m-%dT%H:%M:%SZ'),
+    'odd': lambda date: date.strftime('%d %B %Y, %I:%M %p'),
+}
+MEDIA = ('media', 'enclosure', 'none')
+WORDS = ('markets', 'election', 'storm', 'court', 'league', 'vaccine', 'budget', 'strike', 'summit', 'launch',
+         'record', 'protest', 'merger', 'drought', 'festival', 'council', 'satellite', 'reform', 'trial', 'rally')
+START = datetime.datetime(2022, 9, 1, tzinfo=datetime.timezone.utc)
+
+
+def make_entries(count, seed=0):
+    """Generates titles, links, dates and image urls of entries, newest first like real feeds"""
+    rnd = random.Random(seed)
+    entries = []
+    for number in range(count):
+        title = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 12))).capitalize() + f' #{number}'
+        entries.append({
+            'title': title,
+            'link': f'https://news.example.com/{number // 100}/story-{number}.html?utm_source=rss',
+            'date': START + datetime.timedelta(minutes=count - number),
+            'image': f'https://img.example.com/{number % 50}.jpg',
+            'source': f'Agency {number % 7}',
+        })
+    return entries
+
+
+def make_rss(entries, dates='rfc822', media='media'):
+    """Renders entries as an RSS 2.0 document"""
+    format_date = DATE_FORMATS[dates]
+    items = []
+    for entry in entries:
+        if media == 'media':
+            image = f'<media:content url={quoteattr(entry["image"])} medium="image" width="360"/>'
+        elif media == 'enclosure':
+            image = f'<enclosure url={quoteattr(entry["image"])} type="image/jpeg" length="1000"/>'
+        else:
+            image = ''
+        items.append(f'<item><title>{escape(entry["title"])}</title><link>{escape(entry["link"])}</link>'
+                     f'<guid>{escape(entry["link"])}</guid><pubDate>{format_date(entry["date"])}</pubDate>'
+                     f'<source url="https://news.example.com/rss">{escape(entry["source"])}</source>{image}'
+                     f'<description>{escape(entry["title"])}. More on the story.</description></item>')
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/"><channel>'
+            '<title>Synthetic news</title><link>https://news.example.com/</link>'
+            '<description>Generated for benchmarks</description><ttl>15</ttl>'
+            + '\n'.join(items) + '</channel></rss>\n').encode('utf-8')
+
+
+def make_atom(entries, dates='iso8601', media='media'):
+    """Renders entries as an Atom document"""
+    format_date = DATE_FORMATS[dates]
+    items = []
+    for entry in entries:
+        if media == 'media':
+            image = f'<media:content url={quoteattr(entry["image"])} medium="image"/>'
+        elif media == 'enclosure':
+            image = f'<link rel="enclosure" href={quoteattr(entry["image"])} type="image/jpeg"/>'
+        else:
+            image = ''
+        items.append(f'<entry><title>{escape(entry["title"])}</title><link href={quoteattr(entry["link"])}/>'
+                     f'<id>{escape(entry["link"])}</id><published>{format_date(entry["date"])}</published>'
+                     f'<updated>{format_date(entry["date"])}</updated>'
+                     f'<source><title>{escape(entry["source"])}</title></source>{image}'
+                     f'<summary>{escape(entry["title"])}. More on the story.</summary></entry>')
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:media="http://search.yahoo.com/mrss/">'
+            '<title>Synthetic news</title><id>https://news.example.com/</id>'
+            f'<updated>{START.strftime("%Y-%m-%dT%H:%M:%SZ")}</updated>'
+            + '\n'.join(items) + '</feed>\n').encode('utf-8')
+
+
+def make_feed(count, feed_format='rss', dates='rfc822', media='media', seed=0):
+    """Generates a feed document of the given size and flavour"""
+    render = make_atom if feed_format == 'atom' else make_rss
+    return render(make_entries(count, seed), dates, media)
+
+
+def write_feed(directory, count, feed_format='rss', dates='rfc822', media='media'):
+    """Writes the feed to a file named by its parameters and returns the path"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{feed_format}-{dates}-{media}-{count}.xml')
+    with open(path, 'wb') as file:
+        file.write(make_feed(count, feed_format, dates, media))
+    return path
+
+
+def write_images(directory, urls, size=(360, 180)):
+    """Writes a small PNG for every image url, returns the mapping of urls to files the exports take"""
+    from PIL import Image
+
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for number, url in enumerate(dict.fromkeys(urls)):
+        path = os.path.join(directory, f'{number}.png')
+        Image.new('RGB', size, (number * 37 % 256, number * 91 % 256, 128)).save(path)
+        paths[url] = path
+    return paths
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves files without logging every request, keeping connections alive as feed servers do"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, with Nagle's algorithm every response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory, port=0):
+    """Serves the directory over HTTP on localhost in a daemon thread, returns the server and its base url"""
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic feed generator')
+    parser.add_argument('directory', help='Where feeds are written')
+    parser.add_argument('--entries', type=int, nargs='+', default=[1000], help='Numbers of entries')
+    parser.add_argument('--format', choices=['rss', 'atom'], default='rss', help='Feed format')
+    parser.add_argument('--dates', choices=list(DATE_FORMATS), default='rfc822', help='Format of entry dates')
+    parser.add_argument('--media', choices=MEDIA, default='media', help='How images are attached')
+    parser.add_argument('--serve', type=int, nargs='?', const=8000, help='Serve the directory on this port')
+    args = parser.parse_args()
+
+    for count in args.entries:
+        print(write_feed(args.directory, count, args.format, args.dates, args.media))
+    if args.serve is not None:
+        server, url = serve(args.directory, args.serve)
+        print(f'Serving {args.directory} at {url}, press Ctrl+C to stop')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
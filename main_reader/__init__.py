@@ -0,0 +1,18 @@
+""" RSS reader: command line tool and library API """
+from main_reader.errors import InvalidArgumentError
+from main_reader.errors import InvalidFeedError
+from main_reader.errors import NewsNotFoundError
+from main_reader.errors import ReaderError
+from main_reader.errors import SourceUnavailableError
+
+__all__ = ['Reader', 'ReaderError', 'InvalidArgumentError', 'SourceUnavailableError', 'InvalidFeedError',
+           'NewsNotFoundError']
+
+
+def __getattr__(name):
+    """Imports Reader on first use, so the command line does not load the library stack for --version"""
+    if name == 'Reader':
+        from main_reader.reader import Reader
+
+        return Reader
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
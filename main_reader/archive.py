@@ -0,0 +1,81 @@
+""" Archive of raw feed documents: every download is kept compressed in the cache to be parsed again
+
+A document is stored once by its hash, however many fetches returned it, next to the time of every fetch.
+Replaying the archive re-runs parsing and caching of news offline, e.g. after the extraction of a field
+changed, and gives a repeatable corpus of real feeds for benchmarks.
+"""
+import hashlib
+import time
+import zlib
+
+from main_reader import metrics
+
+LEVEL = 6
+
+
+class Payload:
+    """Archived document of a feed"""
+
+    def __init__(self, url, data, content_type=None, fetched=None):
+        self.url = url
+        self.data = data
+        self.content_type = content_type
+        self.fetched = fetched
+
+
+class PayloadArchive:
+    """Stores documents of feeds in the cache and reads them back"""
+
+    def __init__(self, connection, level=LEVEL):
+        self.connection = connection
+        self.level = level
+
+    def save(self, url, data, content_type=None, fetched=None):
+        """Archives one downloaded document"""
+        self.save_many([Payload(url, data, content_type, fetched)])
+
+    def save_many(self, payloads):
+        """Archives documents in one transaction"""
+        with self.connection:
+            self.write_many(payloads)
+
+    def write_many(self, payloads):
+        """Archives documents in the transaction of the caller, a document stored before is not compressed again"""
+        with metrics.stage('archive'):
+            for payload in payloads:
+                digest = hashlib.sha1(payload.data).hexdigest()
+                known = self.connection.execute('SELECT 1 FROM payloads WHERE hash=?', (digest,)).fetchone()
+                if not known:
+                    self.connection.execute('INSERT INTO payloads VALUES (?, ?, ?)',
+                                            (digest, len(payload.data), zlib.compress(payload.data, self.level)))
+                    metrics.count('payloads_archived')
+                fetched = int(time.time() if payload.fetched is None else payload.fetched)
+                self.connection.execute('INSERT OR IGNORE INTO feeds (url) VALUES (?)', (payload.url,))
+                self.connection.execute('INSERT INTO fetches VALUES ((SELECT id FROM feeds WHERE url=?), ?, ?, ?)',
+                                        (payload.url, fetched, digest, payload.content_type))
+
+    def fetches(self, urls=None):
+        """Lists (url, hash, fetched, content_type) of distinct documents of the feeds, all feeds by default
+
+        Every document of a feed is listed once, at its first fetch, and documents are ordered by that time.
+        """
+        sql = ('SELECT feeds.url, fetches.hash, min(fetches.fetched), fetches.content_type FROM fetches '
+               'JOIN feeds ON feeds.id = fetches.feed_id')
+        params = ()
+        if urls:
+            sql += f' WHERE feeds.url IN ({", ".join("?" * len(urls))})'
+            params = tuple(urls)
+        sql += ' GROUP BY fetches.feed_id, fetches.hash ORDER BY min(fetches.fetched), feeds.url'
+        return self.connection.execute(sql, params).fetchall()
+
+    def load(self, digest):
+        """Decompressed document of the hash"""
+        row = self.connection.execute('SELECT data FROM payloads WHERE hash=?', (digest,)).fetchone()
+        return zlib.decompress(row[0]) if row else None
+
+    def payloads(self, urls=None):
+        """Yields archived documents of the feeds in the order of fetches, decompressed one at a time"""
+        for url, digest, fetched, content_type in self.fetches(urls):
+            data = self.load(digest)
+            if data is not None:
+                yield Payload(url, data, content_type, fetched)
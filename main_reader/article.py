@@ -1,19 +1,41 @@
-import dateparser
+from main_reader import dates
+
+DATE_FORMAT = "%a, %d %B, %Y"
+
+_NOT_PARSED = object()
 
 
 class Article:
     """Creates a news instance with the necessary attributes"""
 
-    def __init__(self, title, link, date, source, image):
+    __slots__ = ('title', 'link', 'source', 'image', 'fingerprint', '_raw_date', '_date', '_date_str')
+
+    def __init__(self, title, link, date, source, image, fingerprint=None):
         self.title = title
         self.link = link
-        self.date = dateparser.parse(date)
         self.source = source
         self.image = image
+        # Hash of the feed entry the article was made of, None for articles of other origin
+        self.fingerprint = fingerprint
+        self._raw_date = date
+        self._date = _NOT_PARSED
+        self._date_str = None
+
+    @property
+    def date(self):
+        """Publication date, parsed on the first access"""
+        if self._date is _NOT_PARSED:
+            self._date = dates.parse_date(self._raw_date)
+            self._raw_date = None
+        return self._date
 
     def date_str(self, formatter):
         """Convert date to a string"""
-        return self.date.strftime(formatter)
+        if formatter != DATE_FORMAT:
+            return self.date.strftime(formatter)
+        if self._date_str is None:
+            self._date_str = self.date.strftime(DATE_FORMAT)
+        return self._date_str
 
     def __eq__(self, other):
         """Overrides the default implementation"""
@@ -21,11 +43,15 @@ class Article:
             return self.link == other.link
         return False
 
+    def __hash__(self):
+        """Articles are equal if their links are equal, so the hash is the hash of the link"""
+        return hash(self.link)
+
     def __str__(self):
         """Overrides the default implementation"""
         return 'Title: ' + self.title + '\n' \
                + 'Link: ' + self.link + '\n' \
-               + 'Date: ' + self.date_str("%a, %d %B, %Y") + '\n' \
+               + 'Date: ' + self.date_str(DATE_FORMAT) + '\n' \
                + 'Source: ' + self.source + '\n' \
                + 'Image: ' + self.image + '\n'
 
@@ -34,7 +60,7 @@ class Article:
         fields = {
             'Title': self.title,
             'Link': self.link,
-            'Date': self.date_str("%a, %d %B, %Y"),
+            'Date': self.date_str(DATE_FORMAT),
             'Source': self.source,
             'Image': self.image,
         }
@@ -1,21 +1,96 @@
+""" Colorized logging of the reader, written to stdout and to a rotating file by a background thread """
+import atexit
 import logging.handlers
+import os
+import pathlib
+import queue
 import sys
 
 from colored import fg, attr
 
+from main_reader import database
+
+LOG_ENV_VARIABLE = 'RSS_READER_LOG'
+LOG_NAME = 'logs.txt'
+MAX_BYTES = 2 ** 20
+BACKUP_COUNT = 3
+FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener = None
+_queue_handler = None
+
+
+def default_log_path(cache_path=None):
+    """The log file is taken from $RSS_READER_LOG, by default it is kept next to the news cache at cache_path"""
+    if os.environ.get(LOG_ENV_VARIABLE):
+        return pathlib.Path(os.environ[LOG_ENV_VARIABLE])
+    return pathlib.Path(cache_path or database.default_path()).parent / LOG_NAME
+
+
+class OutputFilter(logging.Filter):
+    """Keeps printed news out of the log file"""
+
+    def filter(self, record):
+        return not getattr(record, 'output', False)
+
+
+def install_handlers(path=None, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, cache_path=None):
+    """Puts one queue handler on the root logger, its listener thread writes records to stdout and the file
+
+    Calls after the first one return the running listener, so handlers are never added twice.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+    path = pathlib.Path(path or default_log_path(cache_path))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # The file is created by the first record, runs with disabled logging leave nothing behind
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                        encoding='utf-8', delay=True)
+    file_handler.setFormatter(logging.Formatter(FORMAT))
+    file_handler.addFilter(OutputFilter())
+    log_queue = queue.SimpleQueue()
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(sys.stdout), file_handler)
+    logging.getLogger().addHandler(_queue_handler)
+    _listener.start()
+    return _listener
+
+
+def flush():
+    """Waits until the listener has written every queued record"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+        _listener.start()
+
+
+def shutdown():
+    """Writes queued records, stops the listener and removes the queue handler"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    if _listener._thread is not None:
+        _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener = _queue_handler = None
+
+
+atexit.register(shutdown)
+
 
 class ColorizeLogger:
-    """Creates a logger item with the necessary attributes"""
+    """Creates a logger item with the necessary attributes
+
+    Messages are formatted only for enabled levels: pass arguments separately, as in logger.info('%s news', count).
+    """
 
-    def __init__(self, disable=50, is_colorize=False):
-        """Logger init"""
-        logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
+    def __init__(self, disable=50, is_colorize=False, log_path=None, cache_path=None):
+        """Logger init, without log_path the log is written next to the cache at cache_path"""
+        install_handlers(log_path, cache_path=cache_path)
         logger = logging.getLogger("")
         logger.setLevel(logging.INFO)
-        handler = logging.handlers.RotatingFileHandler('../logs.txt')
-        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
         logging.disable(disable)
         self.is_colorize = is_colorize
         self.logger = logger
@@ -25,28 +100,43 @@ class ColorizeLogger:
         self.error_color = '4'
         self.print_color = '5'
 
-    def debug(self, value):
+    def debug(self, value, *args):
         """Debug log"""
-        self.logger.debug(self.get_message(self.debug_color, value))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(self.get_message(self.debug_color, value, args))
 
-    def info(self, value):
+    def info(self, value, *args):
         """Debug info"""
-        self.logger.info(self.get_message(self.info_color, value))
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(self.get_message(self.info_color, value, args))
 
-    def warning(self, value):
+    def warning(self, value, *args):
         """Debug warning"""
-        self.logger.warning(self.get_message(self.warning_color, value))
+        if self.logger.isEnabledFor(logging.WARNING):
+            self.logger.warning(self.get_message(self.warning_color, value, args))
 
-    def error(self, value):
+    def error(self, value, *args):
         """Debug error"""
-        self.logger.error(self.get_message(self.error_color, value))
+        if self.logger.isEnabledFor(logging.ERROR):
+            self.logger.error(self.get_message(self.error_color, value, args))
 
     def print(self, value):
         """Debug print"""
-        print(self.get_message(self.print_color, value))
+        message = self.get_message(self.print_color, value)
+        if _listener is not None and self.logger.isEnabledFor(logging.INFO):
+            # Log records are written by the listener thread, printing through it keeps their order
+            self.logger.log(logging.CRITICAL, message, extra={'output': True})
+        else:
+            print(message)
+
+    def flush(self):
+        """Waits for queued records before writing to stdout directly"""
+        flush()
 
-    def get_message(self, color, value):
+    def get_message(self, color, value, args=()):
         """Initializes the color display of the value"""
+        if args:
+            value = value % args
         if self.is_colorize:
             return '%s %s %s' % (fg(color), value, attr(0))
         else:
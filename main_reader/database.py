@@ -0,0 +1,188 @@
+""" SQLite cache: location, connection settings and versioned schema migrations """
+import os
+import pathlib
+import sqlite3
+import sys
+
+DB_ENV_VARIABLE = 'RSS_READER_DB'
+DB_NAME = 'news.db'
+BUSY_TIMEOUT = 30
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA mmap_size=268435456',
+)
+
+INCREMENTAL_VACUUM = 2
+
+# INSERT OR REPLACE fires delete triggers only with this setting, the search index relies on them
+TRIGGER_PRAGMA = 'PRAGMA recursive_triggers=ON'
+
+# Every item upgrades the schema by one version, PRAGMA user_version keeps the applied version.
+# Version 1 adopts tables created by earlier releases, that is why it uses IF NOT EXISTS.
+MIGRATIONS = (
+    (
+        'CREATE TABLE IF NOT EXISTS news (title text, link text UNIQUE, full_date text, date text, source text, '
+        'image text, url text)',
+        'CREATE TABLE IF NOT EXISTS feeds (url text PRIMARY KEY, etag text, modified text)',
+    ),
+    (
+        'CREATE INDEX IF NOT EXISTS news_date_url ON news (date, url)',
+        'CREATE INDEX IF NOT EXISTS news_url_date ON news (url, date)',
+    ),
+    (
+        'CREATE TABLE fingerprints (link text PRIMARY KEY, canonical_url text, content_hash text, simhash integer, '
+        'day integer)',
+        'CREATE INDEX fingerprints_canonical_url ON fingerprints (canonical_url)',
+        'CREATE INDEX fingerprints_content_hash ON fingerprints (content_hash, day)',
+        'CREATE TABLE fingerprint_bands (key integer, day integer, link text)',
+        'CREATE INDEX fingerprint_bands_key_day ON fingerprint_bands (key, day)',
+        'CREATE INDEX fingerprint_bands_link ON fingerprint_bands (link)',
+    ),
+    (
+        'CREATE VIRTUAL TABLE news_fts USING fts5(title, source)',
+        'INSERT INTO news_fts (rowid, title, source) SELECT rowid, title, source FROM news',
+        'CREATE TRIGGER news_fts_insert AFTER INSERT ON news BEGIN '
+        'INSERT INTO news_fts (rowid, title, source) VALUES (new.rowid, new.title, new.source); END',
+        'CREATE TRIGGER news_fts_delete AFTER DELETE ON news BEGIN '
+        'DELETE FROM news_fts WHERE rowid = old.rowid; END',
+        'CREATE TRIGGER news_fts_update AFTER UPDATE OF title, source ON news BEGIN '
+        'UPDATE news_fts SET title = new.title, source = new.source WHERE rowid = new.rowid; END',
+    ),
+    (
+        'DROP INDEX IF EXISTS news_date_url',
+        'DROP INDEX IF EXISTS news_url_date',
+        'CREATE INDEX news_date_order ON news (date, full_date, link)',
+        'CREATE INDEX news_url_order ON news (url, date, full_date, link)',
+    ),
+    (
+        'CREATE TABLE images (url text PRIMARY KEY, digest text, path text, size integer, accessed real)',
+        'CREATE INDEX images_digest ON images (digest)',
+    ),
+    (
+        'ALTER TABLE news ADD COLUMN fingerprint text',
+    ),
+    # Feed urls and source names are kept once and referenced by integer keys. Dates are seconds since the
+    # epoch in UTC with the UTC offset of the feed, so published + utc_offset is the time on the feed's clock,
+    # which days and the order of cached news are taken by. News keep their rowids, the search index stays valid.
+    (
+        'CREATE TABLE sources (id integer PRIMARY KEY, name text UNIQUE NOT NULL)',
+        'CREATE TABLE feeds_v8 (id integer PRIMARY KEY, url text UNIQUE NOT NULL, etag text, modified text)',
+        'INSERT INTO feeds_v8 (url, etag, modified) SELECT url, etag, modified FROM feeds',
+        'INSERT OR IGNORE INTO feeds_v8 (url) SELECT DISTINCT url FROM news WHERE url IS NOT NULL',
+        'INSERT OR IGNORE INTO sources (name) SELECT DISTINCT source FROM news WHERE source IS NOT NULL',
+        'CREATE TABLE news_v8 (id integer PRIMARY KEY, link text UNIQUE, title text, published integer, '
+        'utc_offset integer, source_id integer REFERENCES sources (id), image text, '
+        'feed_id integer REFERENCES feeds (id), fingerprint text)',
+        "INSERT INTO news_v8 SELECT news.rowid, link, title, CAST(strftime('%s', full_date) AS integer), "
+        "CASE WHEN substr(full_date, -6, 1) IN ('+', '-') AND substr(full_date, -3, 1) = ':' "
+        "THEN (CASE substr(full_date, -6, 1) WHEN '-' THEN -60 ELSE 60 END) "
+        "* (substr(full_date, -5, 2) * 60 + substr(full_date, -2)) ELSE 0 END, "
+        'sources.id, image, feeds_v8.id, fingerprint FROM news '
+        'LEFT JOIN sources ON sources.name = news.source LEFT JOIN feeds_v8 ON feeds_v8.url = news.url',
+        'DROP TABLE news',
+        'ALTER TABLE news_v8 RENAME TO news',
+        'DROP TABLE feeds',
+        'ALTER TABLE feeds_v8 RENAME TO feeds',
+        'CREATE INDEX news_local_order ON news (published + utc_offset, link)',
+        'CREATE INDEX news_feed_order ON news (feed_id, published + utc_offset, link)',
+        'CREATE INDEX news_source ON news (source_id)',
+        'CREATE TRIGGER news_fts_insert AFTER INSERT ON news BEGIN '
+        'INSERT INTO news_fts (rowid, title, source) '
+        'VALUES (new.id, new.title, (SELECT name FROM sources WHERE id = new.source_id)); END',
+        'CREATE TRIGGER news_fts_delete AFTER DELETE ON news BEGIN '
+        'DELETE FROM news_fts WHERE rowid = old.id; END',
+        'CREATE TRIGGER news_fts_update AFTER UPDATE OF title, source_id ON news BEGIN '
+        'UPDATE news_fts SET title = new.title, source = (SELECT name FROM sources WHERE id = new.source_id) '
+        'WHERE rowid = new.id; END',
+    ),
+    # Raw feed documents, compressed and stored once however many fetches returned them
+    (
+        'CREATE TABLE payloads (hash text PRIMARY KEY, size integer, data blob)',
+        'CREATE TABLE fetches (feed_id integer REFERENCES feeds (id), fetched integer, hash text, '
+        'content_type text)',
+        'CREATE INDEX fetches_feed ON fetches (feed_id, fetched)',
+        'CREATE INDEX fetches_hash ON fetches (hash)',
+    ),
+    # Normalized titles, near-duplicate candidates of the similarity index are checked against them
+    (
+        'ALTER TABLE fingerprints ADD COLUMN title text',
+    ),
+    # Links of the last complete document of a feed, a not modified feed is served from them. Validators of
+    # earlier fetches come without links, so they are dropped and the next fetch reads the whole feed
+    (
+        'ALTER TABLE feeds ADD COLUMN links text',
+        'UPDATE feeds SET etag = NULL, modified = NULL',
+    ),
+)
+
+
+def default_path():
+    """Returns the cache location: RSS_READER_DB variable or news.db in the per-user cache directory"""
+    if os.environ.get(DB_ENV_VARIABLE):
+        return pathlib.Path(os.environ[DB_ENV_VARIABLE])
+    if sys.platform == 'win32':
+        cache_dir = pathlib.Path(os.environ.get('LOCALAPPDATA', pathlib.Path.home() / 'AppData' / 'Local'))
+    elif sys.platform == 'darwin':
+        cache_dir = pathlib.Path.home() / 'Library' / 'Caches'
+    else:
+        cache_dir = pathlib.Path(os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home() / '.cache')
+    return cache_dir / 'rss_reader' / DB_NAME
+
+
+def connect(path):
+    """Opens the cache, creating its directory, and applies connection settings"""
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(path), timeout=BUSY_TIMEOUT)
+    if not connection.execute('PRAGMA page_count').fetchone()[0]:
+        # A new file: switching to WAL writes the database header, auto_vacuum can only be chosen before that
+        connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    for pragma in PRAGMAS:
+        connection.execute(pragma)
+    connection.execute(TRIGGER_PRAGMA)
+    return connection
+
+
+def schema_version(connection):
+    """Returns the version of the schema applied to the cache"""
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(connection):
+    """Upgrades the cache schema in place, every version in its own transaction"""
+    connection.execute(TRIGGER_PRAGMA)
+    version = schema_version(connection)
+    if version == 0:
+        # For connections not opened by connect(). Takes effect only before the database header is written,
+        # older caches switch on their first compaction
+        connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    for number, statements in enumerate(MIGRATIONS[version:], version + 1):
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(connection) < number:
+                for statement in statements:
+                    connection.execute(statement)
+                connection.execute(f'PRAGMA user_version={number}')
+        except Exception:
+            connection.rollback()
+            raise
+        connection.commit()
+
+
+def compact(connection):
+    """Returns free pages to the file system, merges the search index and refreshes query planner statistics"""
+    if connection.execute('PRAGMA auto_vacuum').fetchone()[0] != INCREMENTAL_VACUUM:
+        # A cache created without auto_vacuum is rebuilt once, later compactions are incremental
+        connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        connection.execute('VACUUM')
+    else:
+        # Every step of the pragma frees one page and a cursor stops after the first one, a script runs all steps
+        connection.executescript('PRAGMA incremental_vacuum')
+    with connection:
+        connection.execute("INSERT INTO news_fts (news_fts) VALUES ('optimize')")
+    connection.execute('ANALYZE')
+    connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
@@ -0,0 +1,106 @@
+""" Fast parsing of article dates with dateparser as the last resort """
+import calendar
+import datetime
+import email.utils
+import functools
+import re
+import time
+
+FALLBACK_CACHE_SIZE = 4096
+
+RFC822_PATTERN = re.compile(r'(?:[A-Za-z]{3},\s*)?\d{1,2}\s+[A-Za-z]{3}\s+\d{2,4}\s+\d{1,2}:\d{2}(?::\d{2})?'
+                            r'(?:\s+(?:[+-]\d{4}|(?P<zone>[A-Za-z]{1,5})))?')
+
+
+def parse_date(value, parsed=None):
+    """Converts a date of an entry to datetime
+
+    RFC 822 (RSS) and ISO 8601 (Atom and the cache) strings are parsed strictly, keeping their UTC offset.
+    parsed is feedparser's struct of the same date, used when the string itself is not strict.
+    Anything else goes to dateparser through a memo cache.
+    """
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, time.struct_time):
+        return from_struct_time(value)
+
+    date = parse_strict(value)
+    if date is None and isinstance(parsed, time.struct_time) and not has_unknown_zone(value):
+        date = from_struct_time(parsed)
+    if date is None and isinstance(value, str):
+        date = parse_fallback(value)
+    return date
+
+
+def has_unknown_zone(value):
+    """Checks the value is an RFC 822 date in a zone email.utils does not know, feedparser takes such zones as UTC"""
+    match = RFC822_PATTERN.fullmatch(value.strip()) if isinstance(value, str) else None
+    if not match or not match.group('zone'):
+        return False
+    try:
+        return email.utils.parsedate_to_datetime(value).tzinfo is None
+    except (TypeError, ValueError):
+        return False
+
+
+def from_struct_time(value):
+    """Converts feedparser's struct (always in UTC) to an aware datetime"""
+    return datetime.datetime(*value[:6], tzinfo=datetime.timezone.utc)
+
+
+def parse_strict(value):
+    """Parses ISO 8601 and RFC 822 dates, returns None for other formats"""
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if not value:
+        return None
+
+    if value[0].isdigit():
+        iso_value = value[:-1] + '+00:00' if value[-1] in 'Zz' else value
+        try:
+            return datetime.datetime.fromisoformat(iso_value)
+        except ValueError:
+            pass
+
+    match = RFC822_PATTERN.fullmatch(value)
+    if match:
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        # email.utils knows only the zones of RFC 822, others such as CEST leave the date naive
+        if date.tzinfo is None and match.group('zone'):
+            return None
+        return date
+    return None
+
+
+def to_timestamp(date):
+    """Splits the date into seconds since the epoch and its UTC offset in seconds, naive dates are taken as UTC"""
+    if date is None:
+        return None, None
+    offset = date.utcoffset()
+    if offset is None:
+        return calendar.timegm(date.timetuple()), 0
+    return calendar.timegm(date.utctimetuple()), int(offset.total_seconds())
+
+
+def from_timestamp(seconds, offset):
+    """Reverts to_timestamp, the date keeps its UTC offset"""
+    if seconds is None:
+        return None
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone(datetime.timedelta(seconds=offset or 0)))
+
+
+def day_start(day):
+    """Seconds since the epoch at the start of the YYYYMMDD day, on the clock the day is taken by"""
+    return calendar.timegm(time.strptime(day, '%Y%m%d'))
+
+
+@functools.lru_cache(maxsize=FALLBACK_CACHE_SIZE)
+def parse_fallback(value):
+    """Parses a date of unusual format with dateparser, repeated strings are served from the cache"""
+    import dateparser
+
+    return dateparser.parse(value)
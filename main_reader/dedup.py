@@ -0,0 +1,202 @@
+""" Cross-feed deduplication: canonical urls, content hashes and near-duplicate titles """
+import hashlib
+import re
+import urllib.parse
+
+SIMHASH_BITS = 64
+BANDS = 8
+BAND_BITS = SIMHASH_BITS // BANDS
+# Hashes within BANDS - 1 bits share at least one whole band, so looking up the bands finds every candidate
+MAX_DISTANCE = BANDS - 1
+# Candidates are duplicates if this share of word pairs of the titles is the same, so titles which differ
+# in a word that changes the story ("Man"/"Woman", swapped teams) are not merged
+MIN_SIMILARITY = 0.75
+# Shorter titles such as "Morning briefing" recur and are not compared by similarity
+MIN_WORDS = 5
+WINDOW_DAYS = 2
+
+TRACKING_PARAMETERS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'igshid', 'yclid', '_ga',
+                       'cmpid', 'ncid', 'ref', 'ref_src', 'src', 'amp', 'outputtype', 'guccounter'}
+HOST_PREFIXES = ('www.', 'amp.', 'm.')
+DEFAULT_PORTS = {':80', ':443'}
+NOT_WORD = re.compile(r'\W+')
+NO_IMAGE = '---'
+
+
+def canonicalize_url(url):
+    """Reduces http/https, www/amp/mobile hosts, AMP paths, tracking parameters and fragments to one url"""
+    parts = urllib.parse.urlsplit(url.strip())
+    if parts.scheme not in ('http', 'https'):
+        return url
+
+    host = parts.netloc.lower()
+    for port in DEFAULT_PORTS:
+        if host.endswith(port):
+            host = host[:-len(port)]
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+
+    path = parts.path
+    if path.endswith('/amp') or path.endswith('/amp/'):
+        path = path[:path.rindex('/amp')]
+    elif path.endswith('.amp'):
+        path = path[:-len('.amp')]
+    elif path.endswith('.amp.html'):
+        path = path[:-len('.amp.html')] + '.html'
+    path = path.replace('/amp/', '/').rstrip('/') or '/'
+
+    query = [(key, value) for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+             if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMETERS]
+    return urllib.parse.urlunsplit(('https', host, path, urllib.parse.urlencode(sorted(query)), ''))
+
+
+def normalize_text(text):
+    """Lowercases the text and collapses punctuation and whitespace"""
+    return NOT_WORD.sub(' ', text.lower()).strip()
+
+
+def content_hash(article):
+    """Hash of the normalized title and image, the fields a feed gives about the content
+
+    None for articles without an image, the title alone does not tell one story from another.
+    """
+    if not article.image or article.image == NO_IMAGE:
+        return None
+    content = normalize_text(article.title) + '\0' + canonicalize_url(article.image)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def simhash(text):
+    """64-bit SimHash of character trigrams of the normalized text"""
+    text = normalize_text(text)
+    shingles = {text[i:i + 3] for i in range(max(len(text) - 2, 1))}
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def word_pairs(text):
+    """Pairs of adjacent words of the normalized text, with its first and last word marked"""
+    words = ['^', *text.split(), '$']
+    return {(first, second) for first, second in zip(words, words[1:])}
+
+
+def similarity(first, second):
+    """Jaccard similarity of word pairs of two normalized titles, so word order and every word matter"""
+    first, second = word_pairs(first), word_pairs(second)
+    return len(first & second) / len(first | second)
+
+
+def band_keys(value):
+    """Splits the hash into bands, every key keeps the number of its band and its bits"""
+    mask = (1 << BAND_BITS) - 1
+    return [band << BAND_BITS | value >> (band * BAND_BITS) & mask for band in range(BANDS)]
+
+
+def distance(first, second):
+    """Number of different bits of two hashes"""
+    return bin(first ^ second).count('1')
+
+
+def to_signed(value):
+    """SQLite integers are signed 64-bit"""
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    """Reverts to_signed"""
+    return value & ((1 << SIMHASH_BITS) - 1)
+
+
+def fingerprint(article):
+    """Collects the values the article is compared by, needs no database so it can run in worker processes"""
+    date = article.date
+    return {
+        'link': article.link,
+        'canonical_url': canonicalize_url(article.link),
+        'content_hash': content_hash(article),
+        'simhash': simhash(article.title),
+        'day': date.toordinal() if date is not None else None,
+        'title': normalize_text(article.title),
+    }
+
+
+def is_comparable(fingerprint):
+    """True if the title is long enough to be compared by similarity"""
+    return len(fingerprint['title'].split()) >= MIN_WORDS
+
+
+class Deduplicator:
+    """Drops articles already stored under another link and records fingerprints of the rest in the cache"""
+
+    def __init__(self, connection, max_distance=MAX_DISTANCE, window_days=WINDOW_DAYS,
+                 min_similarity=MIN_SIMILARITY):
+        self.connection = connection
+        self.max_distance = max_distance
+        self.window_days = window_days
+        self.min_similarity = min_similarity
+
+    def filter(self, articles):
+        """Returns articles which are not duplicates of the cached ones or of each other"""
+        with self.connection:
+            return [article for article in articles if self.keep(self.fingerprint(article))]
+
+    def fingerprint(self, article):
+        """Collects the values the article is compared by"""
+        return fingerprint(article)
+
+    def keep(self, fingerprint):
+        """Saves the fingerprint unless it is a duplicate, returns True for unique articles"""
+        if self.find_duplicate(fingerprint) is not None:
+            return False
+        self.save(fingerprint)
+        return True
+
+    def find_duplicate(self, fingerprint):
+        """Returns the link of a stored article the fingerprint is a duplicate of"""
+        cursor = self.connection.cursor()
+        cursor.execute('SELECT link FROM fingerprints WHERE canonical_url=:canonical_url AND link!=:link LIMIT 1',
+                       fingerprint)
+        row = cursor.fetchone()
+        if row or fingerprint['day'] is None:
+            return row[0] if row else None
+
+        window = {'link': fingerprint['link'], 'first_day': fingerprint['day'] - self.window_days,
+                  'last_day': fingerprint['day'] + self.window_days}
+        if fingerprint['content_hash'] is not None:
+            cursor.execute('SELECT link FROM fingerprints WHERE content_hash=:content_hash AND link!=:link '
+                           'AND day BETWEEN :first_day AND :last_day LIMIT 1', dict(window, **fingerprint))
+            row = cursor.fetchone()
+            if row:
+                return row[0]
+
+        if not is_comparable(fingerprint):
+            return None
+        keys = band_keys(fingerprint['simhash'])
+        cursor.execute('SELECT DISTINCT fingerprints.link, fingerprints.simhash, fingerprints.title '
+                       'FROM fingerprint_bands '
+                       'JOIN fingerprints ON fingerprints.link = fingerprint_bands.link '
+                       f'WHERE fingerprint_bands.key IN ({", ".join("?" * len(keys))}) '
+                       'AND fingerprint_bands.day BETWEEN ? AND ? AND fingerprint_bands.link!=?',
+                       (*keys, window['first_day'], window['last_day'], window['link']))
+        for link, value, title in cursor:
+            if title and distance(fingerprint['simhash'], to_unsigned(value)) <= self.max_distance \
+                    and similarity(fingerprint['title'], title) >= self.min_similarity:
+                return link
+        return None
+
+    def save(self, fingerprint):
+        """Stores the fingerprint so later runs find duplicates of the article"""
+        self.connection.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)',
+                                (fingerprint['link'], fingerprint['canonical_url'], fingerprint['content_hash'],
+                                 to_signed(fingerprint['simhash']), fingerprint['day'], fingerprint['title']))
+        self.connection.execute('DELETE FROM fingerprint_bands WHERE link=?', (fingerprint['link'],))
+        if fingerprint['day'] is not None and is_comparable(fingerprint):
+            self.connection.executemany('INSERT INTO fingerprint_bands VALUES (?, ?, ?)',
+                                        [(key, fingerprint['day'], fingerprint['link'])
+                                         for key in band_keys(fingerprint['simhash'])])
@@ -0,0 +1,21 @@
+""" Exceptions of the reader, the command line prints their message and exits """
+
+
+class ReaderError(Exception):
+    """Base class of errors of the reader, the message is meant for the user"""
+
+
+class InvalidArgumentError(ReaderError, ValueError):
+    """An argument such as a limit, a date or a feed list is not valid"""
+
+
+class SourceUnavailableError(ReaderError):
+    """The feed could not be downloaded"""
+
+
+class InvalidFeedError(ReaderError):
+    """The document of the feed has no news"""
+
+
+class NewsNotFoundError(ReaderError, LookupError):
+    """No cached news match the request"""
@@ -0,0 +1,307 @@
+""" Reading feed lists and fetching several feeds concurrently """
+import concurrent.futures
+import io
+import itertools
+import os
+import xml.etree.ElementTree as ElementTree
+
+from main_reader import errors
+from main_reader import helper
+from main_reader import metrics
+from main_reader import stream
+from main_reader import transport
+
+DEFAULT_WORKERS = 8
+# Articles stream_feed caches at once
+CHUNK_SIZE = 100
+
+
+class FeedResult:
+    """Outcome of fetching a single feed"""
+
+    def __init__(self, url, articles=None, error=None, etag=None, modified=None, not_modified=False, ttl=None,
+                 skip_hours=None, complete=True, skipped=0, payload=None, content_type=None, exception=None,
+                 links=None):
+        self.url = url
+        self.articles = articles if articles is not None else []
+        self.error = error
+        # The exception the error was made of
+        self.exception = exception
+        self.etag = etag
+        self.modified = modified
+        self.not_modified = not_modified
+        self.ttl = ttl
+        self.skip_hours = skip_hours if skip_hours is not None else set()
+        # False when only the first entries of the feed were read
+        self.complete = complete
+        # Links of all entries of a complete document, cached or not
+        self.links = links
+        # Entries cached before and unchanged, no articles were made of them
+        self.skipped = skipped
+        # The downloaded document and its Content-Type, for the archive
+        self.payload = payload
+        self.content_type = content_type
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+
+    @property
+    def ok(self):
+        """True if the feed was fetched without errors"""
+        return self.error is None
+
+
+def read_feed_list(path):
+    """Reads feed urls from an OPML file or a plain-text file with one url per line"""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            content = file.read()
+    except OSError:
+        raise errors.InvalidArgumentError(f'Feed list {path} is not available')
+
+    if os.path.splitext(str(path))[1].lower() == '.opml' or content.lstrip().startswith('<'):
+        return read_opml(content)
+
+    urls = []
+    for line in content.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            urls.append(line)
+    return urls
+
+
+def read_opml(content):
+    """Extracts feed urls from the outlines of an OPML document"""
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError:
+        raise errors.InvalidArgumentError('Please, check the feed list is a valid OPML file')
+    return [outline.get('xmlUrl') for outline in root.iter('outline') if outline.get('xmlUrl')]
+
+
+def collect_sources(sources, feed_list=None):
+    """Merges positional sources with the feed list file, dropping repeated urls"""
+    urls = list(sources or [])
+    if feed_list:
+        urls.extend(read_feed_list(feed_list))
+    return list(dict.fromkeys(urls))
+
+
+def fetch_feed(url, etag=None, modified=None, limit=None, seen=None):
+    """Fetches one feed, turning its failure into an error of the result
+
+    With a limit the feed is parsed while it is downloaded and reading stops after limit entries.
+    Entries found unchanged in seen, the helper.SeenLinks of the feed, are skipped.
+    """
+    if limit:
+        return fetch_feed_stream(url, etag, modified, limit, seen)
+    skipped = seen.skipped if seen is not None else 0
+    try:
+        rss_news = helper.parse_feed(url, etag, modified)
+        if helper.is_not_modified(rss_news):
+            metrics.count('feeds_not_modified')
+            return FeedResult(url, etag=etag, modified=modified, not_modified=True)
+        articles = helper.articles_from_feed(rss_news, seen)
+    except errors.ReaderError as exc:
+        metrics.count('feed_errors')
+        return FeedResult(url, error=str(exc), exception=exc)
+    except Exception as exc:
+        metrics.count('feed_errors')
+        return FeedResult(url, error=f'{type(exc).__name__}: {exc}', exception=exc)
+    metrics.count('feeds_fetched')
+    ttl, skip_hours = helper.feed_hints(rss_news)
+    return FeedResult(url, articles, etag=rss_news.get('etag'), modified=rss_news.get('modified'), ttl=ttl,
+                      skip_hours=skip_hours, skipped=seen.skipped - skipped if seen is not None else 0,
+                      payload=rss_news.get('payload'), content_type=rss_news.get('content_type'),
+                      links=helper.entry_links(rss_news['entries']))
+
+
+def fetch_feed_stream(url, etag, modified, limit, seen=None):
+    """Reads the first limit entries of the feed while it is downloaded and closes the connection"""
+    skipped = seen.skipped if seen is not None else 0
+    try:
+        response = helper.open_feed(url, etag, modified)
+        if response is None:
+            metrics.count('feeds_not_modified')
+            return FeedResult(url, etag=etag, modified=modified, not_modified=True)
+        with response, metrics.stage('fetch'):
+            feed = stream.FeedStream(response, getattr(response, 'url', None))
+            articles = list(itertools.islice(helper.create_articles(feed, seen), limit))
+    except ElementTree.ParseError:
+        # Not well-formed XML, feedparser copes with more of it
+        if seen is not None:
+            seen.skipped = skipped
+        result = fetch_feed(url, etag, modified, seen=seen)
+        result.complete = len(result.articles) <= limit
+        result.articles = result.articles[:limit]
+        return result
+    except errors.ReaderError as exc:
+        metrics.count('feed_errors')
+        return FeedResult(url, error=str(exc), exception=exc)
+    except Exception as exc:
+        metrics.count('feed_errors')
+        return FeedResult(url, error=f'{type(exc).__name__}: {exc}', exception=exc)
+    skipped = seen.skipped - skipped if seen is not None else 0
+    if not articles and not skipped:
+        metrics.count('feed_errors')
+        error = errors.InvalidFeedError('Please, check the entered link is correct!')
+        return FeedResult(url, error=str(error), exception=error)
+    metrics.count('feeds_fetched')
+    headers = getattr(response, 'headers', {})
+    return FeedResult(url, articles, etag=headers.get('ETag'), modified=headers.get('Last-Modified'), ttl=feed.ttl,
+                      skip_hours=feed.skip_hours, complete=feed.finished, skipped=skipped,
+                      links=feed.links if feed.finished else None)
+
+
+class DrainingReader:
+    """File object passing reads through to the response until drain reads the rest of the body into memory
+
+    A drained response is closed, so its connection is not held while the reads are suspended.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.rest = None
+
+    def read(self, size=-1):
+        if self.rest is not None:
+            return self.rest.read(size)
+        return self.response.read(size)
+
+    def drain(self):
+        """Downloads the rest of the body and closes the response"""
+        if self.rest is None:
+            self.rest = io.BytesIO(self.response.read())
+            self.response.close()
+
+
+class RecordingReader:
+    """File object passing reads through to the response and keeping the bytes read, for the archive"""
+
+    def __init__(self, response):
+        self.response = response
+        self.parts = []
+
+    def read(self, size=-1):
+        data = self.response.read(size)
+        self.parts.append(data)
+        return data
+
+    @property
+    def data(self):
+        """Bytes read so far"""
+        return b''.join(self.parts)
+
+
+def stream_feed(url, etag=None, modified=None, limit=None, size=CHUNK_SIZE, record=False):
+    """Yields results of consecutive chunks of size articles of the feed while it is downloaded
+
+    Only the last result has the validators and the hints of the feed and is complete if the whole
+    document was read; with record it carries the downloaded document then. A not modified feed yields
+    one not modified result. Failures raise exceptions of errors, a document which is not well-formed
+    XML is parsed by feedparser once it is downloaded. The rest of an HTTP document is downloaded before
+    the first chunk is yielded, a suspended generator does not hold a request slot of the host.
+    """
+    response = helper.open_feed(url, etag, modified)
+    if response is None:
+        metrics.count('feeds_not_modified')
+        yield FeedResult(url, etag=etag, modified=modified, not_modified=True)
+        return
+    count = 0
+    with response:
+        source = response
+        if transport.is_http(url):
+            source = download = DrainingReader(response)
+            if record:
+                source = recorder = RecordingReader(download)
+        feed = stream.FeedStream(source, getattr(response, 'url', None))
+        chunk = []
+        try:
+            for article in itertools.islice(helper.create_articles(feed), limit):
+                chunk.append(article)
+                if len(chunk) == size:
+                    count += len(chunk)
+                    if source is not response:
+                        download.drain()
+                    yield FeedResult(url, chunk, complete=False)
+                    chunk = []
+        except ElementTree.ParseError:
+            result = fetch_feed(url)
+            if not result.ok:
+                raise result.exception
+            result.complete = limit is None or len(result.articles) <= limit
+            result.articles = result.articles[count:limit]
+            yield result
+            return
+        except OSError:
+            raise errors.SourceUnavailableError("Source isn't available")
+    if not count and not chunk:
+        metrics.count('feed_errors')
+        raise errors.InvalidFeedError('Please, check the entered link is correct!')
+    metrics.count('feeds_fetched')
+    headers = getattr(response, 'headers', {})
+    yield FeedResult(url, chunk, etag=headers.get('ETag'), modified=headers.get('Last-Modified'), ttl=feed.ttl,
+                     skip_hours=feed.skip_hours, complete=feed.finished,
+                     payload=recorder.data if record and source is not response and feed.finished else None,
+                     content_type=headers.get('Content-Type'), links=feed.links if feed.finished else None)
+
+
+def fetch_feeds(urls, workers=DEFAULT_WORKERS, validators=None, limit=None, seen=None):
+    """Fetches feeds in a bounded thread pool and yields results as soon as they are ready
+
+    validators maps a feed url to the (etag, modified) pair saved on its previous fetch,
+    seen maps it to the helper.SeenLinks of the feed.
+    """
+    if not urls:
+        return
+    validators = validators or {}
+    seen = seen or {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(urls))) as executor:
+        futures = [executor.submit(fetch_feed, url, *validators.get(url, (None, None)), limit, seen.get(url))
+                   for url in urls]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+def store_result(result, connection, logger, deduplicator=None, seen=None, payload_archive=None, read_cached=True):
+    """Caches news of a successful result, returns its articles and the ones which were not cached before
+
+    Only new and changed articles are deduplicated and written, the counts are kept in the result.
+    Saved articles are remembered in seen, the helper.SeenLinks of the feed. The downloaded document
+    is kept in payload_archive, an archive.PayloadArchive. A not modified feed returns the cached news of
+    its last document, without read_cached they are not read and an empty list is returned instead.
+    """
+    if result.not_modified:
+        if not read_cached:
+            logger.info('%s is not modified', result.url)
+            return [], []
+        logger.info('%s is not modified, retrieve news from cache', result.url)
+        return helper.get_fetched_feed(connection, result.url), []
+    logger.info('%s news received from %s', len(result.articles) + result.skipped, result.url)
+    articles = result.articles
+    cached = helper.get_cached_fingerprints(connection, [article.link for article in articles])
+    changed = [article for article in articles if not helper.is_unchanged(article, cached, result.url)]
+    if deduplicator:
+        with metrics.stage('dedup'):
+            unique = deduplicator.filter(changed)
+        logger.info('%s duplicates dropped from %s', len(changed) - len(unique), result.url)
+        if len(unique) < len(changed):
+            dropped = set(changed) - set(unique)
+            articles = [article for article in articles if article not in dropped]
+            changed = unique
+    result.inserted, result.updated, _ = helper.save_news(changed, connection, result.url, cached)
+    result.unchanged = len(articles) - len(changed) + result.skipped
+    helper.count_writes(0, 0, result.unchanged)
+    logger.info('%s inserted, %s updated, %s unchanged news of %s', result.inserted, result.updated,
+                result.unchanged, result.url)
+    if seen is not None:
+        seen.update(changed)
+    if payload_archive and result.payload:
+        payload_archive.save(result.url, result.payload, result.content_type)
+    new = [article for article in changed if article.link not in cached]
+    if result.complete:
+        helper.save_validators(connection, result.url, result.etag, result.modified, result.links)
+    else:
+        # The cache misses the rest of the feed, so the next fetch must not be answered with 304
+        helper.save_validators(connection, result.url, None, None)
+    return articles, new
@@ -1,17 +1,43 @@
 import argparse
+import concurrent.futures
 import datetime
+import hashlib
+import io
+import itertools
 import json
 import os
+import re
+import sqlite3
 import urllib.error
 
-from dominate import tags
 from pathlib import Path
-from xhtml2pdf import pisa
-
-import feedparser
 
+from main_reader import database
+from main_reader import dates
+from main_reader import errors
+from main_reader import metrics
+from main_reader import transport
 from main_reader.article import Article
-from main_reader.rss_reader import VERSION
+
+FETCH_SIZE = 500
+DAY_SECONDS = 86400
+
+# Days and the order of cached news follow the clock of the feed, indexes are built on this expression
+LOCAL_TIME = 'published + utc_offset'
+NEWS_COLUMNS = ('news.title, news.link, news.published, news.utc_offset, '
+                '(SELECT name FROM sources WHERE id = news.source_id), news.image')
+FEED_ID = '(SELECT id FROM feeds WHERE url=:url)'
+SAVE_VALIDATORS = ('INSERT INTO feeds (url, etag, modified, links) VALUES (?, ?, ?, ?) '
+                   'ON CONFLICT (url) DO UPDATE SET etag=excluded.etag, modified=excluded.modified, '
+                   'links=excluded.links')
+
+SKIP_HOURS = re.compile(rb'<skipHours\b[^>]*>(.*?)</skipHours\s*>', re.IGNORECASE | re.DOTALL)
+HOUR = re.compile(rb'<hour\b[^>]*>\s*(\d{1,2})\s*</hour\s*>', re.IGNORECASE)
+
+HTML_HEAD = '<html title="RSS news">\n  <head>\n    <meta charset="utf-8">\n  </head>'
+HTML_FOOTER = '\n</html>'
+HTML_BUFFER_SIZE = 1 << 16
+PDF_CHUNK_SIZE = 100
 
 
 def check_limit(limit_str):
@@ -20,62 +46,213 @@ def check_limit(limit_str):
     try:
         limit = int(limit_str)
     except ValueError:
-        raise SystemExit('The argument "limit" should be a number')
+        raise errors.InvalidArgumentError('The argument "limit" should be a number')
     else:
         if limit < 1:
-            raise SystemExit('The argument "limit" should be greater than 0')
+            raise errors.InvalidArgumentError('The argument "limit" should be greater than 0')
         else:
             return limit
 
 
+def check_workers(workers):
+    """Validating number of concurrent fetches"""
+    if workers < 1:
+        raise errors.InvalidArgumentError('The argument "workers" should be greater than 0')
+    return workers
+
+
 def check_date(date):
     """Checks date format is YYYYMMDD"""
     try:
         (datetime.datetime.strptime(date, '%Y%m%d')).date()
         return True
     except Exception:
-        raise SystemExit('Please, enter the date in "YYYYMMDD" format')
+        raise errors.InvalidArgumentError('Please, enter the date in "YYYYMMDD" format')
 
 
-def create_articles(news):
-    """Creating list of news"""
-    default_value = '---'
+class SeenLinks:
+    """Fingerprints of cached news of one feed, entries which did not change are skipped while the feed is read"""
 
-    articles = []
-    for entry in news:
-        title = entry.get('title', default_value)
-        link = entry.get('link', default_value)
-        published = entry.get('published', default_value)
-        source = entry.get('source', default_value)
-        media_content = entry.get('media_content', default_value)
+    def __init__(self, fingerprints=None):
+        self.fingerprints = fingerprints if fingerprints is not None else {}
+        self.skipped = 0
 
-        source_title = default_value
-        if source != default_value:
-            source_title = source['title']
+    def unchanged(self, link, fingerprint):
+        """Checks the entry is cached as it is, counting skipped entries"""
+        if self.fingerprints.get(link) == fingerprint:
+            self.skipped += 1
+            return True
+        return False
 
-        image = default_value
-        if media_content != image:
-            image = media_content[0]['url']
+    def update(self, articles):
+        """Remembers fingerprints of saved articles"""
+        for article in articles:
+            self.fingerprints[article.link] = article.fingerprint
 
-        article = Article(title, link, published, source_title, image)
-        articles.append(article)
 
-    return articles
+def load_seen_links(connection, url):
+    """Reads fingerprints of cached news of the feed"""
+    cursor = connection.execute(f'SELECT link, fingerprint FROM news WHERE feed_id={FEED_ID} '
+                                'AND fingerprint IS NOT NULL', {'url': url})
+    return SeenLinks(dict(iter_rows(cursor)))
 
 
-def get_news(link):
-    """Get list of RSS"""
+def entry_fingerprint(title, published, source, image):
+    """Hash of the fields of a feed entry which are cached, computed before anything is parsed"""
+    return hashlib.sha1('\0'.join((title, str(published), source, image)).encode('utf-8')).hexdigest()
 
+
+def create_articles(news, seen=None):
+    """Creating news one by one, so the caller can stop reading the feed early
+
+    Entries of feedparser and of stream.FeedStream are read the same way, an entry without a publication
+    date is dated by its update. Entries found unchanged in seen are skipped before their dates are parsed.
+    """
+    default_value = '---'
+
+    count = 0
+    try:
+        for entry in news:
+            title = entry.get('title', default_value)
+            link = entry.get('link', default_value)
+            date_key = 'published' if entry.get('published') else 'updated'
+            published = entry.get(date_key) or default_value
+            source = entry.get('source', default_value)
+            media_content = entry.get('media_content', default_value)
+
+            source_title = default_value
+            if source != default_value:
+                source_title = source['title']
+
+            image = default_value
+            if media_content != image:
+                image = media_content[0]['url']
+
+            fingerprint = entry_fingerprint(title, published, source_title, image)
+            if seen is not None and seen.unchanged(link, fingerprint):
+                continue
+            count += 1
+            yield Article(title, link, dates.parse_date(published, entry.get(date_key + '_parsed')), source_title,
+                          image, fingerprint)
+    finally:
+        metrics.count('entries', count)
+
+
+def parse_feed(link, etag=None, modified=None):
+    """Downloads and parses the feed, sending the cached HTTP validators"""
+    import feedparser
+
+    if os.path.isfile(str(link)):
+        with metrics.stage('fetch'), open(link, 'rb') as file:
+            data = file.read()
+        with metrics.stage('parse'):
+            rss_news = feedparser.parse(data)
+        rss_news['skip_hours'] = read_skip_hours(data)
+        return rss_news
+    if not transport.is_http(link):
+        try:
+            with metrics.stage('fetch'):
+                return feedparser.parse(link, etag=etag, modified=modified)
+        except urllib.error.URLError:
+            raise errors.SourceUnavailableError("Source isn't available")
+
+    with metrics.stage('fetch'):
+        response = open_feed(link, etag, modified)
+        if response is None:
+            return {'entries': [], 'status': 304}
+        with response:
+            data = read_response(response)
+    with metrics.stage('parse'):
+        rss_news = feedparser.parse(data, response_headers=feedparser_headers(response.url, response.headers))
+    rss_news['status'] = response.status
+    rss_news['etag'] = response.headers.get('ETag')
+    rss_news['modified'] = response.headers.get('Last-Modified')
+    # The raw document is kept for the archive
+    rss_news['payload'] = data
+    rss_news['content_type'] = response.headers.get('Content-Type')
+    rss_news['skip_hours'] = read_skip_hours(data)
+    return rss_news
+
+
+def read_skip_hours(data):
+    """Hours of <skipHours> of the document, feedparser keeps only the last of them"""
+    match = SKIP_HOURS.search(data)
+    if not match:
+        return set()
+    return {int(hour) for hour in HOUR.findall(match.group(1)) if int(hour) < 24}
+
+
+def feedparser_headers(url, headers=None):
+    """Response headers as feedparser reads them, relative links of an HTTP feed are resolved against its url
+
+    stream.FeedStream is given the same url, so both parsers make the same entries.
+    """
+    headers = {name.lower(): value for name, value in (headers or {}).items()}
+    if transport.is_http(url):
+        headers['content-location'] = url
+    return headers
+
+
+def open_feed(link, etag=None, modified=None):
+    """Starts downloading the feed to read it incrementally, returns None if it is not modified"""
+    if os.path.isfile(link):
+        return open(link, 'rb')
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if modified:
+        headers['If-Modified-Since'] = modified
+    try:
+        response = transport.get_transport().open(link, headers)
+    except (OSError, ValueError):
+        raise errors.SourceUnavailableError("Source isn't available")
+    if response.status == 200:
+        return response
+    response.close()
+    if response.status == 304:
+        return None
+    raise errors.SourceUnavailableError("Source isn't available")
+
+
+def read_response(response):
+    """Reads the whole body, a broken or too slow download makes the source unavailable"""
     try:
-        rss_news = feedparser.parse(link)
-        articles = create_articles(rss_news['entries'])
-    except urllib.error.URLError:
-        raise SystemExit("Source isn't available")
+        return response.read()
+    except OSError:
+        raise errors.SourceUnavailableError("Source isn't available")
+
+
+def is_not_modified(rss_news):
+    """Checks the server answered that the feed has not changed since the last fetch"""
+    return rss_news.get('status') == 304
+
+
+def feed_hints(rss_news):
+    """Returns the RSS ttl in minutes and the set of skipHours (UTC) the publisher asks not to poll in"""
+    feed = rss_news.get('feed', {})
+    ttl = feed.get('ttl', '').strip()
+    skip_hours = rss_news.get('skip_hours')
+    if skip_hours is None:
+        # Documents feedparser downloaded itself, it keeps the text of the last <hour> of <skipHours> only
+        hours = [feed.get('hour', '')] if 'skiphours' in feed else []
+        skip_hours = {int(hour) for hour in hours if hour.strip().isdigit() and int(hour) < 24}
+    return (int(ttl) if ttl.isdigit() else None), skip_hours
+
+
+def articles_from_feed(rss_news, seen=None):
+    """Creates articles from the parsed feed, skipping entries found unchanged in seen"""
+    skipped = seen.skipped if seen is not None else 0
+    with metrics.stage('articles'):
+        articles = list(create_articles(rss_news['entries'], seen))
+    if len(articles) == 0 and (seen is None or seen.skipped == skipped):
+        raise errors.InvalidFeedError('Please, check the entered link is correct!')
     else:
-        if len(articles) == 0:
-            raise SystemExit('Please, check the entered link is correct!')
-        else:
-            return articles
+        return articles
+
+
+def get_news(link):
+    """Get list of RSS"""
+    return articles_from_feed(parse_feed(link))
 
 
 def make_json(article):
@@ -84,56 +261,322 @@ def make_json(article):
     return json_article
 
 
+def write_news(news, output_format, stream):
+    """Streams news to the stream as NDJSON lines or as a compact JSON array"""
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    if output_format == 'ndjson':
+        for article in news:
+            stream.write(encode(article.to_dict()))
+            stream.write('\n')
+    else:
+        separator = ''
+        stream.write('[')
+        for article in news:
+            stream.write(separator)
+            stream.write(encode(article.to_dict()))
+            separator = ','
+        stream.write(']\n')
+    stream.flush()
+
+
 def get_cashed_news(date, connection, url):
     """Retrieves news for the selected date and url"""
     check_date(date)
+    return query_news(connection, [url] if url else None, date, date)
+
+
+def query_news(connection, urls=None, date_from=None, date_to=None, order=None, limit=None, offset=None,
+               after=None):
+    """Retrieves cached news lazily, filtering, ordering and paging in SQL
+
+    date_from and date_to are YYYYMMDD days, both included, either can be omitted.
+    order is 'asc' or 'desc' by publication date, after is the link of the last article of the previous page.
+    """
+    conditions = []
+    params = {}
+    if date_from:
+        conditions.append(f'{LOCAL_TIME}>=:date_from')
+        params['date_from'] = dates.day_start(date_from)
+    if date_to:
+        conditions.append(f'{LOCAL_TIME}<:date_to')
+        params['date_to'] = dates.day_start(date_to) + DAY_SECONDS
+    if urls and len(urls) == 1:
+        conditions.append(f'feed_id={FEED_ID}')
+        params['url'] = urls[0]
+    elif urls:
+        conditions.append(f'feed_id IN (SELECT id FROM feeds WHERE url IN '
+                          f'({", ".join(f":url{i}" for i in range(len(urls)))}))')
+        params.update({f'url{i}': url for i, url in enumerate(urls)})
+
+    if (after or offset) and not order:
+        order = 'asc'
+    if after:
+        comparison = '<' if order == 'desc' else '>'
+        conditions.append(f'({LOCAL_TIME}, link) {comparison} (SELECT {LOCAL_TIME}, link FROM news WHERE link=:after)')
+        params['after'] = after
+
+    sql = f'SELECT {NEWS_COLUMNS} FROM news'
+    if conditions:
+        sql += ' WHERE ' + ' and '.join(conditions)
+    if order:
+        direction = 'DESC' if order == 'desc' else 'ASC'
+        sql += f' ORDER BY {LOCAL_TIME} {direction}, link {direction}'
+    if limit or offset:
+        sql += ' LIMIT :limit OFFSET :offset'
+        params.update({'limit': limit or -1, 'offset': offset or 0})
+
     cursor = connection.cursor()
-    if url:
-        cursor.execute('SELECT title, link, full_date, source, image, url FROM news WHERE date=:date and url=:url',
-                       {'date': date, 'url': url})
-    else:
-        cursor.execute('SELECT title, link, full_date, source, image, url FROM news WHERE date=:date',
-                       {'date': date})
-    articles = list()
-    records = cursor.fetchall()
-    for title, link, full_date, source, image, url in records:
-        articles.append(Article(title, link, full_date, source, image))
-    return articles
+    cursor.execute(sql, params)
+    return (make_article(row) for row in iter_rows(cursor))
+
+
+def make_article(row):
+    """Creates an article of a row of NEWS_COLUMNS"""
+    title, link, published, utc_offset, source, image = row
+    return Article(title, link, dates.from_timestamp(published, utc_offset), source, image)
+
+
+def iter_rows(cursor, size=FETCH_SIZE):
+    """Reads rows of the cursor in batches of the given size"""
+    while True:
+        with metrics.stage('cache_read'):
+            rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        metrics.count('rows_read', len(rows))
+        yield from rows
+
+
+def get_cashed_feed(connection, url):
+    """Retrieves all cached news of the feed, newest first"""
+    cursor = connection.cursor()
+    cursor.execute(f'SELECT {NEWS_COLUMNS} FROM news WHERE feed_id={FEED_ID} ORDER BY {LOCAL_TIME} DESC, link DESC',
+                   {'url': url})
+    return [make_article(row) for row in iter_rows(cursor)]
+
+
+def get_fetched_feed(connection, url):
+    """Retrieves cached news of the last document fetched from the feed, newest first"""
+    cursor = connection.cursor()
+    cursor.execute(f'SELECT {NEWS_COLUMNS} FROM news WHERE link IN '
+                   '(SELECT value FROM json_each((SELECT links FROM feeds WHERE url=:url))) '
+                   f'ORDER BY {LOCAL_TIME} DESC, link DESC', {'url': url})
+    return [make_article(row) for row in iter_rows(cursor)]
+
+
+def search_news(query, connection, limit=None):
+    """Full-text search over titles and sources of cached news, best matches first"""
+    sql = f'SELECT {NEWS_COLUMNS} FROM news_fts JOIN news ON news.id = news_fts.rowid WHERE news_fts MATCH :query ' \
+          'ORDER BY bm25(news_fts, 10.0, 1.0) LIMIT :limit'
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql, {'query': query, 'limit': limit or -1})
+    except sqlite3.OperationalError:
+        # Not a valid FTS5 query, search for the words as they are
+        terms = ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+        cursor.execute(sql, {'query': terms, 'limit': limit or -1})
+    return [make_article(row) for row in iter_rows(cursor)]
+
+
+def rebuild_search_index(connection):
+    """Fills the full-text index from scratch with all cached news"""
+    with connection:
+        connection.execute('DELETE FROM news_fts')
+        connection.execute('INSERT INTO news_fts (rowid, title, source) '
+                           'SELECT id, title, (SELECT name FROM sources WHERE id = source_id) FROM news')
+        connection.execute("INSERT INTO news_fts (news_fts) VALUES ('optimize')")
+
+
+def prune_news(connection, days, now=None):
+    """Deletes news published more than days ago with their fingerprints, unused sources and archived documents
+
+    Returns the number of deleted news.
+    """
+    cutoff = (now if now is not None else datetime.datetime.now(datetime.timezone.utc)) - datetime.timedelta(days=days)
+    with connection:
+        deleted = connection.execute('DELETE FROM news WHERE published < ?', (dates.to_timestamp(cutoff)[0],)).rowcount
+        connection.execute('DELETE FROM fingerprints WHERE day < ?', (cutoff.toordinal(),))
+        connection.execute('DELETE FROM fingerprint_bands WHERE day < ?', (cutoff.toordinal(),))
+        connection.execute('DELETE FROM sources WHERE id NOT IN '
+                           '(SELECT source_id FROM news WHERE source_id IS NOT NULL)')
+        connection.execute('DELETE FROM fetches WHERE fetched < ?', (dates.to_timestamp(cutoff)[0],))
+        connection.execute('DELETE FROM payloads WHERE hash NOT IN (SELECT hash FROM fetches)')
+    return deleted
 
 
 def init_database(connection):
-    """Creating DB table"""
+    """Creating DB tables or upgrading them to the current schema"""
+    database.migrate(connection)
+
+
+def get_validators(connection, url):
+    """Returns ETag and Last-Modified values saved for the feed on the last fetch"""
     cursor = connection.cursor()
-    sql = 'CREATE TABLE IF NOT EXISTS news (title text, link text UNIQUE, full_date text, date text, source text, ' \
-          'image text, url text)'
-    cursor.execute(sql)
-    connection.commit()
+    cursor.execute('SELECT etag, modified FROM feeds WHERE url=:url', {'url': url})
+    row = cursor.fetchone()
+    return tuple(row) if row else (None, None)
+
 
+def save_validators(connection, url, etag, modified, links=None):
+    """Saves ETag and Last-Modified values of the feed for the next conditional fetch
 
-def save_news(list_of_news, connection, url):
-    """Save news into database"""
+    links of the fetched document are the news a not modified feed is served with.
+    """
     cursor = connection.cursor()
-    for item in list_of_news:
-        new_date = item.date.strftime('%Y%m%d')
-        query = "INSERT OR REPLACE INTO news VALUES (?, ?, ?, ?, ?, ?, ?)"
-        cursor.execute(query, (item.title, item.link, item.date, new_date, item.source, item.image, url))
+    cursor.execute(SAVE_VALIDATORS, (url, etag, modified, dump_links(links)))
     connection.commit()
 
 
+def dump_links(links):
+    """Links of a document as they are saved with the validators"""
+    return json.dumps(links) if links is not None else None
+
+
+def entry_links(entries):
+    """Links of feedparser entries, in the order of the document"""
+    return [entry['link'] for entry in entries if entry.get('link')]
+
+
+def get_cached_fingerprints(connection, links):
+    """Maps the links which are cached to the fingerprint and the feed of their news"""
+    links = json.dumps(list(links))
+    cursor = connection.execute('SELECT link, fingerprint, (SELECT url FROM feeds WHERE id = feed_id) FROM news '
+                                'WHERE link IN (SELECT value FROM json_each(?))', (links,))
+    return {link: (fingerprint, url) for link, fingerprint, url in cursor}
+
+
+def is_unchanged(article, cached, url):
+    """Checks the article is cached for the feed with the same fingerprint"""
+    return article.fingerprint is not None and cached.get(article.link) == (article.fingerprint, url)
+
+
+def news_row(item, url):
+    """Values saved for the article, save_rows turns the source and the feed url into keys"""
+    published, utc_offset = dates.to_timestamp(item.date)
+    return item.title, item.link, published, utc_offset, item.source, item.image, url, item.fingerprint
+
+
+def save_rows(rows, connection):
+    """Inserts new rows of the news table and updates changed ones in one transaction"""
+    with connection:
+        write_rows(rows, connection)
+
+
+def write_rows(rows, connection):
+    """Inserts new rows of the news table and updates changed ones in the transaction of the caller
+
+    Rows are updated in place, so their rowids and the search index entries stay, and a row whose fingerprint
+    and feed are the same is not written at all.
+    """
+    query = ('INSERT INTO news (title, link, published, utc_offset, source_id, image, feed_id, fingerprint) '
+             'VALUES (?, ?, ?, ?, (SELECT id FROM sources WHERE name=?), ?, (SELECT id FROM feeds WHERE url=?), ?) '
+             'ON CONFLICT (link) DO UPDATE SET title=excluded.title, published=excluded.published, '
+             'utc_offset=excluded.utc_offset, source_id=excluded.source_id, image=excluded.image, '
+             'feed_id=excluded.feed_id, fingerprint=excluded.fingerprint '
+             'WHERE excluded.fingerprint IS NULL OR news.fingerprint IS NOT excluded.fingerprint '
+             'OR news.feed_id IS NOT excluded.feed_id')
+    with metrics.stage('db_write'):
+        # Sources and feeds are interned first, news refer to them by their keys
+        connection.executemany('INSERT OR IGNORE INTO sources (name) VALUES (?)',
+                               [(source,) for source in {row[4] for row in rows}])
+        connection.executemany('INSERT OR IGNORE INTO feeds (url) VALUES (?)',
+                               [(url,) for url in {row[6] for row in rows}])
+        connection.executemany(query, rows)
+    metrics.count('rows_written', len(rows))
+
+
+def save_news(list_of_news, connection, url, cached=None):
+    """Saves new and changed news, returns the numbers of inserted, updated and unchanged ones
+
+    cached is the result of get_cached_fingerprints for the news if the caller has it already.
+    """
+    if cached is None:
+        cached = get_cached_fingerprints(connection, [item.link for item in list_of_news])
+    rows = []
+    inserted = 0
+    for item in list_of_news:
+        if is_unchanged(item, cached, url):
+            continue
+        if item.link not in cached:
+            inserted += 1
+        rows.append(news_row(item, url))
+    save_rows(rows, connection)
+    counts = inserted, len(rows) - inserted, len(list_of_news) - len(rows)
+    count_writes(*counts)
+    return counts
+
+
+def count_writes(inserted, updated, unchanged):
+    """Adds the numbers of written news to the metrics of the run"""
+    metrics.count('rows_inserted', inserted)
+    metrics.count('rows_updated', updated)
+    metrics.count('rows_unchanged', unchanged)
+
+
 def parce_command_line_arguments():
     """ Parse command line arguments.
         :return: parsed arguments
     """
+    from main_reader.rss_reader import VERSION
+
     parser = argparse.ArgumentParser(description='Pure Python command-line RSS reader')
-    parser.add_argument('source', type=str, nargs='?', default=None, help='RSS URL')
+    parser.add_argument('source', type=str, nargs='*', default=[], help='RSS URL (can be repeated)')
+    parser.add_argument('--feed_list', type=Path, help='OPML or plain-text file with RSS URLs, one per line')
+    parser.add_argument('--workers', type=int, default=8, help='Number of feeds fetched concurrently')
     parser.add_argument('--version', action='version', version='Version ' + str(VERSION), help='Print version info')
     parser.add_argument('--json', action='store_true', help='Print result as JSON in stdout')
+    parser.add_argument('--format', choices=['text', 'json', 'ndjson', 'json-array'], default='text',
+                        help='Output format: ndjson prints one compact JSON article per line, json-array prints '
+                             'a single compact JSON array, json is the same as --json')
     parser.add_argument('--verbose', action='store_true', help='Outputs verbose status messages')
     parser.add_argument('--limit', help='Limit news topics if this parameter provided')
     parser.add_argument('--date', type=str, nargs='?', default='', help='Get news on a specified date')
+    parser.add_argument('--from', dest='date_from', type=str, help='Get cached news starting from the date')
+    parser.add_argument('--to', dest='date_to', type=str, help='Get cached news up to the date (included)')
+    parser.add_argument('--order', choices=['asc', 'desc'], help='Order cached news by publication date')
+    parser.add_argument('--offset', type=int, default=0, help='Skip the first cached news')
+    parser.add_argument('--after', type=str, help='Link of the last news of the previous page of cached news')
+    parser.add_argument('--search', type=str, help='Full-text search over titles and sources of cached news')
+    parser.add_argument('--rebuild_index', action='store_true', help='Rebuild the full-text index of the cache')
+    parser.add_argument('--prune_older_than', type=int, metavar='DAYS',
+                        help='Delete cached news published more than DAYS days ago')
+    parser.add_argument('--compact', action='store_true',
+                        help='Return free pages of the cache to the disk and refresh its query statistics')
     parser.add_argument('--to_html', type=Path, help='The absolute path where new .html file will be saved')
+    parser.add_argument('--html_page_size', type=int, help='Split the HTML export into pages of this many news')
     parser.add_argument('--to_pdf', type=Path, help='The absolute path where new .pdf file will be saved')
+    parser.add_argument('--pdf_workers', type=int, default=1,
+                        help='Render the PDF in chunks with this many processes')
+    parser.add_argument('--cache_images', action='store_true',
+                        help='Download images of news to the local cache and use them in HTML and PDF exports')
+    parser.add_argument('--image_cache_size', type=int, default=256, help='Size limit of the image cache in MB')
+    parser.add_argument('--thumbnails', action='store_true',
+                        help='Downscale cached images to the 360px width of the export template')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep polling the sources, every feed on an interval adapted to how often it publishes')
+    parser.add_argument('--ingest', action='store_true',
+                        help='Only cache the sources, parsing feeds in worker processes, for large feed lists')
+    parser.add_argument('--serve', type=int, nargs='?', const=8080, metavar='PORT',
+                        help='Serve cached news as JSON over HTTP on the port, 8080 by default')
+    parser.add_argument('--host', default='127.0.0.1', help='Address --serve listens on')
+    parser.add_argument('--replay', action='store_true',
+                        help='Parse archived documents of the sources (all feeds by default) again and cache their '
+                             'news, without network')
+    parser.add_argument('--no_archive', action='store_true', help='Do not archive downloaded feed documents')
+    parser.add_argument('--ingest_workers', type=int, default=None,
+                        help='Number of parsing processes of --ingest, the number of CPUs by default')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print wall and CPU time of every stage and counters of the run to stderr')
+    parser.add_argument('--profile_stats', type=Path, help='Dump cProfile statistics of the run to this file')
+    parser.add_argument('--metrics_file', type=Path,
+                        help='Write metrics of the run to this file, in the Prometheus text format for *.prom')
+    parser.add_argument('--log_file', type=Path,
+                        help='Path to the rotating log file, $RSS_READER_LOG or logs.txt next to the cache by default')
     parser.add_argument('--colorize', action='store_true', help='Print the result of the utility in colorized mode')
+    parser.add_argument('--no_dedup', action='store_true',
+                        help='Keep articles which duplicate cached ones under another link')
+    parser.add_argument('--db', type=Path, default=None,
+                        help=f'Path to the news cache, ${database.DB_ENV_VARIABLE} or the user cache dir by default')
     args = parser.parse_args()
     return args
 
@@ -149,50 +592,137 @@ def check_directory_exists(dir_path, logger):
         return True
 
 
-def add_article_html(article, html_file):
-    """Template for article"""
-    with html_file:
-        tags.h1(article.title)
-        tags.p(tags.b('Title: '), article.title)
-        tags.p(tags.b('Link: ', tags.a(tags.b(article.link), href=article.link, )))
-        tags.p(tags.b('Date: '), article.date.strftime("%a, %d %B, %Y"))
-        tags.p(tags.b('Source: '), article.source)
-        if article.image != '---':
-            tags.p(tags.img(style="width:360px", src=article.image))
-        else:
-            tags.p(tags.b('No images'))
-    return html_file
+def escape_html(value):
+    """Replaces special characters with HTML entities"""
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
 
 
-def save_news_html(news, path_to_html, logger):
-    """Convert news to HTML"""
-    check_directory_exists(path_to_html, logger)
-    html_file = tags.html(title='RSS news')
-    html_file.add(tags.head(tags.meta(charset='utf-8')))
+def image_source(url, images=None):
+    """Local file of the cached image as a file uri, the remote url otherwise"""
+    if images and url in images:
+        return Path(images[url]).resolve().as_uri()
+    return url
 
-    logger.info('Converting news to HTML...')
-    for article in news:
-        add_article_html(article, html_file)
 
+def render_article_html(article, images=None):
+    """Template for article, images maps remote image urls to cached local files"""
+    title = escape_html(article.title)
+    link = escape_html(article.link)
+    if article.image != '---':
+        image = f'<img src="{escape_html(image_source(article.image, images))}" style="width:360px">'
+    else:
+        image = '<b>No images</b>'
+    return f'\n  <h1>{title}</h1>' \
+           f'\n  <p>\n    <b>Title: </b>{title}\n  </p>' \
+           f'\n  <p>\n    <b>Link: \n      <a href="{link}">\n        <b>{link}</b>\n      </a>\n    </b>\n  </p>' \
+           f'\n  <p>\n    <b>Date: </b>{escape_html(article.date_str("%a, %d %B, %Y"))}\n  </p>' \
+           f'\n  <p>\n    <b>Source: </b>{escape_html(article.source)}\n  </p>' \
+           f'\n  <p>\n    {image}\n  </p>'
+
+
+def write_html(chunks, path):
+    """Writes the head, the chunks and the footer of an HTML document through a buffered file"""
+    with open(path, 'w', encoding='utf-8', buffering=HTML_BUFFER_SIZE) as file:
+        file.write(HTML_HEAD)
+        for chunk in chunks:
+            file.write(chunk)
+        file.write(HTML_FOOTER)
+    return file
+
+
+def save_news_html(news, path_to_html, logger, page_size=None, images=None):
+    """Convert news to HTML
+
+    With page_size news are split into news_1.html, news_2.html, ... and news.html links to the pages.
+    Images found in the images mapping are referenced as local files.
+    """
+    check_directory_exists(path_to_html, logger)
     path = os.path.join(path_to_html, 'news.html')
-    logger.info('Creating html file...')
-    with open(path, 'w', encoding='utf-8') as file:
-        file.write(str(html_file))
-    logger.info('Html file created successfully!')
+
+    if not page_size:
+        logger.info('Creating html file...')
+        file = write_html((render_article_html(article, images) for article in news), path)
+        logger.info('Html file created successfully!')
+        return file
+
+    news = iter(news)
+    pages = []
+    while True:
+        page = list(itertools.islice(news, page_size))
+        if not page:
+            break
+        name = f'news_{len(pages) + 1}.html'
+        logger.info(f'Creating html file {name}...')
+        write_html((render_article_html(article, images) for article in page), os.path.join(path_to_html, name))
+        pages.append((name, len(page)))
+
+    links = []
+    first = 1
+    for number, (name, count) in enumerate(pages, 1):
+        links.append(f'\n  <p>\n    <a href="{name}">Page {number}: news {first}-{first + count - 1}</a>\n  </p>')
+        first += count
+    file = write_html(['\n  <h1>RSS news</h1>'] + links, path)
+    logger.info(f'Html index of {len(pages)} pages created successfully!')
     return file
 
 
-def save_news_pdf(news, path_to_pdf, logger):
-    html_file = save_news_html(news, path_to_pdf, logger)
+def render_pdf(html, path=None):
+    """Renders an HTML document to PDF bytes in memory, local files are read relative to path"""
+    from xhtml2pdf import pisa
+
+    output = io.BytesIO()
+    with metrics.stage('render_pdf'):
+        pisa.CreatePDF(src=html, dest=output, path=path)
+    return output.getvalue()
+
+
+def merge_pdfs(documents):
+    """Concatenates PDF documents in the given order"""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for document in documents:
+        writer.append(io.BytesIO(document))
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def save_news_pdf(news, path_to_pdf, logger, workers=1, chunk_size=PDF_CHUNK_SIZE, images=None):
+    """Convert news to PDF
+
+    The HTML is rendered in memory. With several workers news are split into chunks rendered
+    in a process pool and the resulting documents are concatenated in the order of news.
+    Images found in the images mapping are read from local files instead of the network.
+    """
+    check_directory_exists(path_to_pdf, logger)
     path = os.path.join(path_to_pdf, 'news.pdf')
+    news = list(news)
+    # xhtml2pdf reads local files only next to the document, so it is placed into the image cache
+    base_path = None
+    if images:
+        base_path = os.path.join(os.path.commonpath([os.path.dirname(path) for path in images.values()]), 'news.html')
+
+    if workers > 1 and len(news) > chunk_size:
+        chunks = [news[start:start + chunk_size] for start in range(0, len(news), chunk_size)]
+        logger.info(f'Rendering {len(chunks)} pdf chunks with {workers} workers...')
+        htmls = [HTML_HEAD + ''.join(render_article_html(article, images) for article in chunk) + HTML_FOOTER
+                 for chunk in chunks]
+        # Imported before the pool starts, so forked workers inherit it instead of importing it each
+        from xhtml2pdf import pisa  # noqa: F401
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            document = merge_pdfs(executor.map(render_pdf, htmls, itertools.repeat(base_path)))
+    else:
+        logger.info('Rendering pdf...')
+        document = render_pdf(HTML_HEAD + ''.join(render_article_html(article, images) for article in news)
+                              + HTML_FOOTER, base_path)
+
     try:
-        with open(path, 'wb') as pdf_file, open(html_file.name, 'r', encoding='utf-8') as html_file:
+        with open(path, 'wb') as pdf_file:
             logger.info('Creating pdf-file...')
-            pisa.CreatePDF(src=html_file, dest=pdf_file)
+            pdf_file.write(document)
             logger.info("Pdf-file created successfully!")
-            html_file.close()
-            os.remove(html_file.name)
-            logger.info("Temporary html-file deleted")
         return pdf_file
     except FileNotFoundError:
-        raise SystemExit('Please, check the existing of file')
+        raise errors.InvalidArgumentError('Please, check the existing of file')
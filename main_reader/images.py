@@ -0,0 +1,150 @@
+""" Local content-addressed cache of article images used by HTML and PDF exports """
+import concurrent.futures
+import hashlib
+import io
+import os
+import pathlib
+import time
+import urllib.request
+
+from main_reader import database
+
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+DEFAULT_WORKERS = 8
+THUMBNAIL_WIDTH = 360
+TIMEOUT = 10
+NO_IMAGE = '---'
+
+SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+
+
+def default_directory():
+    """Images are kept next to the news cache"""
+    return database.default_path().parent / 'images'
+
+
+def sniff_extension(data):
+    """Guesses the file extension by the first bytes of the image"""
+    for signature, extension in SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    return '.img'
+
+
+def download(url, timeout=TIMEOUT):
+    """Downloads the image, returns None if it is not available"""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.read()
+    except (OSError, ValueError):
+        return None
+
+
+def downscale(data, width=THUMBNAIL_WIDTH):
+    """Shrinks the image to the width of the export template, returns the data as is without Pillow"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width <= width:
+                return data
+            image_format = image.format
+            image.thumbnail((width, image.height * width // image.width + 1))
+            output = io.BytesIO()
+            image.save(output, format=image_format)
+            return output.getvalue()
+    except (OSError, ValueError):
+        return data
+
+
+class ImageCache:
+    """Downloads images concurrently and stores them on disk by the hash of their content
+
+    The url of every image is mapped to its file in the images table of the news cache.
+    When the files exceed max_bytes the least recently used ones are removed.
+    """
+
+    def __init__(self, connection, directory=None, max_bytes=DEFAULT_MAX_BYTES, thumbnail_width=None,
+                 workers=DEFAULT_WORKERS):
+        self.connection = connection
+        self.directory = pathlib.Path(directory or default_directory())
+        self.max_bytes = max_bytes
+        self.thumbnail_width = thumbnail_width
+        self.workers = workers
+
+    def localize(self, articles):
+        """Makes sure images of the articles are cached, returns a mapping of image urls to local files"""
+        urls = list(dict.fromkeys(article.image for article in articles if article.image != NO_IMAGE))
+        return self.fetch(urls)
+
+    def fetch(self, urls):
+        """Downloads images which are not cached yet, returns a mapping of urls to local files"""
+        paths = self.lookup(urls)
+        missing = [url for url in urls if url not in paths]
+        if missing:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.workers, len(missing))) as executor:
+                for url, data in zip(missing, executor.map(self.load, missing)):
+                    if data:
+                        paths[url] = self.store(url, data)
+            self.connection.commit()
+            self.evict(keep=set(paths.values()))
+        return paths
+
+    def load(self, url):
+        """Downloads and optionally downscales one image, runs in a worker thread"""
+        data = download(url)
+        if data and self.thumbnail_width:
+            data = downscale(data, self.thumbnail_width)
+        return data
+
+    def lookup(self, urls):
+        """Returns cached files of the urls and marks them as used"""
+        paths = {}
+        now = time.time()
+        for url in urls:
+            row = self.connection.execute('SELECT path FROM images WHERE url=?', (url,)).fetchone()
+            if row and os.path.exists(row[0]):
+                paths[url] = row[0]
+                self.connection.execute('UPDATE images SET accessed=? WHERE url=?', (now, url))
+        self.connection.commit()
+        return paths
+
+    def store(self, url, data):
+        """Writes the image under the hash of its content, equal images share one file"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.directory / digest[:2] / (digest + sniff_extension(data))
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_suffix('.tmp')
+            temp_path.write_bytes(data)
+            os.replace(temp_path, path)
+        self.connection.execute('INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)',
+                                (url, digest, str(path), len(data), time.time()))
+        return str(path)
+
+    def evict(self, keep=()):
+        """Removes least recently used files until the cache fits into max_bytes"""
+        rows = self.connection.execute('SELECT digest, path, size FROM images GROUP BY digest '
+                                       'ORDER BY MAX(accessed)').fetchall()
+        total = sum(size for _, _, size in rows)
+        with self.connection:
+            for digest, path, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if path in keep:
+                    continue
+                self.connection.execute('DELETE FROM images WHERE digest=?', (digest,))
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
@@ -0,0 +1,266 @@
+""" Bulk ingestion of many feeds: threads download, worker processes parse, the main process writes
+
+Parsing and building articles is CPU-bound and holds the GIL, so with hundreds of feeds the threads of
+feeds.fetch_feeds wait for each other. Here raw documents are downloaded in a thread pool, parsed into rows of
+the news table in a process pool, and written by the main process in large batches, one transaction each.
+Replay runs the same parsing and writing over documents of the archive instead of downloads.
+"""
+import collections
+import concurrent.futures
+import io
+import os
+import xml.etree.ElementTree as ElementTree
+
+from main_reader import archive
+from main_reader import dedup
+from main_reader import errors
+from main_reader import helper
+from main_reader import metrics
+from main_reader import stream
+from main_reader import transport
+
+DOWNLOAD_WORKERS = 8
+BATCH_SIZE = 5000
+
+
+class Download:
+    """Raw document of a feed and the validators of the response"""
+
+    def __init__(self, url, data=None, error=None, etag=None, modified=None, not_modified=False, content_type=None):
+        self.url = url
+        self.data = data
+        self.error = error
+        self.etag = etag
+        self.modified = modified
+        self.not_modified = not_modified
+        self.content_type = content_type
+
+
+class Parsed:
+    """Rows built from a feed in a worker process, plain tuples and dicts so they are cheap to send back"""
+
+    def __init__(self, url, rows=None, fingerprints=None, error=None, cached=None, skipped=0, links=None):
+        self.url = url
+        self.rows = rows or []
+        self.fingerprints = fingerprints
+        self.error = error
+        # For every row, True if its link is cached for the feed already
+        self.cached = cached or [False] * len(self.rows)
+        self.skipped = skipped
+        # Links of all entries of the document, cached or not
+        self.links = links
+
+
+class IngestReport:
+    """Totals of an ingestion run"""
+
+    def __init__(self):
+        self.feeds = 0
+        self.not_modified = 0
+        self.errors = []
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.duplicates = 0
+
+    def __str__(self):
+        return (f'{self.inserted} news inserted, {self.updated} updated, {self.unchanged} unchanged from '
+                f'{self.feeds} feed(s), {self.not_modified} not modified, {len(self.errors)} failed, '
+                f'{self.duplicates} duplicates dropped')
+
+
+def download(url, etag=None, modified=None):
+    """Reads the whole feed document, turning its failure into an error of the download"""
+    try:
+        with metrics.stage('download'):
+            response = helper.open_feed(url, etag, modified)
+            if response is None:
+                return Download(url, etag=etag, modified=modified, not_modified=True)
+            with response:
+                data = response.read()
+    except errors.ReaderError as exc:
+        return Download(url, error=str(exc))
+    except Exception as exc:
+        return Download(url, error=f'{type(exc).__name__}: {exc}')
+    headers = getattr(response, 'headers', {})
+    return Download(url, data, etag=headers.get('ETag'), modified=headers.get('Last-Modified'),
+                    content_type=headers.get('Content-Type'))
+
+
+def parse_payload(url, data, fingerprints=False, seen=None, content_type=None):
+    """Builds rows of the news table from a raw document, runs in a worker process
+
+    Entries found unchanged in seen, the helper.SeenLinks of the feed, are skipped.
+    """
+    seen = seen if seen is not None else helper.SeenLinks()
+    try:
+        try:
+            feed = stream.FeedStream(io.BytesIO(data), url if transport.is_http(url) else None)
+            articles = list(helper.create_articles(feed, seen))
+            links = feed.links
+        except ElementTree.ParseError:
+            import feedparser
+
+            seen.skipped = 0
+            headers = helper.feedparser_headers(url, {'content-type': content_type} if content_type else None)
+            entries = feedparser.parse(data, response_headers=headers)['entries']
+            articles = list(helper.create_articles(entries, seen))
+            links = helper.entry_links(entries)
+        if not articles and not seen.skipped:
+            return Parsed(url, error='Please, check the entered link is correct!')
+        rows = [helper.news_row(article, url) for article in articles]
+        return Parsed(url, rows, [dedup.fingerprint(article) for article in articles] if fingerprints else None,
+                      cached=[article.link in seen.fingerprints for article in articles], skipped=seen.skipped,
+                      links=links)
+    except Exception as exc:
+        return Parsed(url, error=f'{type(exc).__name__}: {exc}')
+
+
+class BatchWriter:
+    """Single writer of the cache: collects rows of parsed feeds and saves them in batches"""
+
+    def __init__(self, connection, deduplicator=None, batch_size=BATCH_SIZE, payload_archive=None):
+        self.connection = connection
+        self.deduplicator = deduplicator
+        self.batch_size = batch_size
+        self.payload_archive = payload_archive
+        self.rows = []
+        self.validators = []
+        self.payloads = []
+        self.report = IngestReport()
+
+    def archive(self, download):
+        """Queues the downloaded document for the archive, if there is one"""
+        if self.payload_archive and download.data:
+            self.payloads.append(archive.Payload(download.url, download.data, download.content_type))
+
+    def classify(self, parsed):
+        """Drops rows cached unchanged and marks the cached ones, for documents parsed without SeenLinks"""
+        links = [row[1] for row in parsed.rows]
+        cached = helper.get_cached_fingerprints(self.connection, links)
+        # Rows of earlier documents are not written until the batch is full
+        queued = {row[1]: (row[7], row[6]) for row in self.rows}
+        cached.update((link, queued[link]) for link in links if link in queued)
+        kept = [index for index, row in enumerate(parsed.rows) if cached.get(row[1]) != (row[7], row[6])]
+        parsed.skipped += len(parsed.rows) - len(kept)
+        parsed.cached = [parsed.rows[index][1] in cached for index in kept]
+        if parsed.fingerprints:
+            parsed.fingerprints = [parsed.fingerprints[index] for index in kept]
+        parsed.rows = [parsed.rows[index] for index in kept]
+        return parsed
+
+    def add(self, parsed, download=None):
+        """Queues rows of the feed, validators are saved with them so a failed batch is fetched again
+
+        Replayed documents come without a download and leave the validators of their feed as they are.
+        """
+        if parsed.error:
+            self.report.errors.append((parsed.url, parsed.error))
+            metrics.count('feed_errors')
+            return
+        rows = list(zip(parsed.rows, parsed.cached))
+        if self.deduplicator and parsed.fingerprints:
+            # Fingerprints are committed per feed, the cache is not locked for other writers until the batch is full
+            with metrics.stage('dedup'), self.connection:
+                rows = [row for row, fingerprint in zip(rows, parsed.fingerprints)
+                        if self.deduplicator.keep(fingerprint)]
+            self.report.duplicates += len(parsed.rows) - len(rows)
+        updated = sum(cached for _, cached in rows)
+        self.report.inserted += len(rows) - updated
+        self.report.updated += updated
+        self.report.unchanged += parsed.skipped
+        helper.count_writes(len(rows) - updated, updated, parsed.skipped)
+        self.rows.extend(row for row, _ in rows)
+        if download is not None:
+            self.validators.append((download.url, download.etag, download.modified, helper.dump_links(parsed.links)))
+        self.report.feeds += 1
+        metrics.count('feeds_fetched')
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes queued rows, validators and documents in one transaction"""
+        if not self.rows and not self.validators and not self.payloads:
+            return
+        with self.connection:
+            helper.write_rows(self.rows, self.connection)
+            self.connection.executemany(helper.SAVE_VALIDATORS, self.validators)
+            if self.payloads:
+                self.payload_archive.write_many(self.payloads)
+        self.report.rows += len(self.rows)
+        self.rows = []
+        self.validators = []
+        self.payloads = []
+
+
+def ingest(urls, connection, processes=None, download_workers=DOWNLOAD_WORKERS, deduplicator=None,
+           batch_size=BATCH_SIZE, payload_archive=None):
+    """Downloads, parses and caches the feeds, returns the report of the run
+
+    Documents are handed to the process pool as soon as they are downloaded, so parsing overlaps downloading.
+    Documents downloaded over HTTP are kept in payload_archive, an archive.PayloadArchive.
+    """
+    processes = processes or os.cpu_count() or 1
+    validators = {url: helper.get_validators(connection, url) for url in urls}
+    seen = {url: helper.load_seen_links(connection, url) for url in urls}
+    writer = BatchWriter(connection, deduplicator, batch_size, payload_archive)
+    if not urls:
+        return writer.report
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(download_workers, len(urls))) as threads, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        downloads = {threads.submit(download, url, *validators[url]) for url in urls}
+        parses = {}
+        while downloads or parses:
+            done, _ = concurrent.futures.wait(downloads | set(parses),
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future in downloads:
+                    downloads.remove(future)
+                    result = future.result()
+                    if result.error:
+                        writer.report.errors.append((result.url, result.error))
+                        metrics.count('feed_errors')
+                    elif result.not_modified:
+                        writer.report.not_modified += 1
+                        metrics.count('feeds_not_modified')
+                    else:
+                        if transport.is_http(result.url):
+                            writer.archive(result)
+                        future = pool.submit(parse_payload, result.url, result.data, deduplicator is not None,
+                                             seen[result.url], result.content_type)
+                        parses[future] = Download(result.url, etag=result.etag, modified=result.modified)
+                else:
+                    writer.add(future.result(), parses.pop(future))
+    writer.flush()
+    return writer.report
+
+
+def replay(connection, urls=None, processes=None, deduplicator=None, batch_size=BATCH_SIZE):
+    """Parses archived documents of the feeds again and caches their news, returns the report of the run
+
+    Documents are replayed in the order they were fetched, so the last version of a news is the one kept.
+    With several processes documents are parsed in parallel and written in the same order. Every entry is
+    parsed, only news whose fingerprint differs from the cached one are written.
+    """
+    processes = processes or os.cpu_count() or 1
+    payloads = archive.PayloadArchive(connection).payloads(urls)
+    writer = BatchWriter(connection, deduplicator, batch_size)
+    if processes == 1:
+        for payload in payloads:
+            writer.add(writer.classify(parse_payload(payload.url, payload.data, deduplicator is not None,
+                                                     content_type=payload.content_type)))
+        writer.flush()
+        return writer.report
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        # A window of documents in flight keeps the memory bounded and the results in order
+        window = collections.deque()
+        for payload in payloads:
+            window.append(pool.submit(parse_payload, payload.url, payload.data, deduplicator is not None,
+                                      content_type=payload.content_type))
+            if len(window) >= 2 * processes:
+                writer.add(writer.classify(window.popleft().result()))
+        while window:
+            writer.add(writer.classify(window.popleft().result()))
+    writer.flush()
+    return writer.report
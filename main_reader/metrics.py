@@ -0,0 +1,147 @@
+""" Per-stage timings and counters of a run, collected only when profiling is enabled
+
+Stages are measured with `with metrics.stage('name'):` and counters grow with `metrics.count('name', value)`.
+Until enable() is called both go to a collector which does nothing, so instrumented code costs one call.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+PROMETHEUS_PREFIX = 'rss_reader'
+
+
+class StageTimes:
+    """Calls, wall and CPU seconds of one stage"""
+
+    __slots__ = ('calls', 'wall', 'cpu')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+
+
+class Metrics:
+    """Collects stage timings and counters from any thread
+
+    CPU time is the time of the thread which ran the stage, so stages run in worker threads are not
+    charged with the work of other threads. Stages may be nested, the outer one includes the inner ones.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measures the block as a call of the stage"""
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.thread_time() - cpu
+            with self.lock:
+                times = self.stages.get(name)
+                if times is None:
+                    times = self.stages[name] = StageTimes()
+                times.calls += 1
+                times.wall += wall
+                times.cpu += cpu
+
+    def count(self, name, value=1):
+        """Adds the value to the counter"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        """Collected values as plain data"""
+        return {
+            'wall_seconds': time.perf_counter() - self.started,
+            'cpu_seconds': time.process_time(),
+            'stages': {name: {'calls': times.calls, 'wall_seconds': times.wall, 'cpu_seconds': times.cpu}
+                       for name, times in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+    def summary(self):
+        """Table of stages and counters for humans"""
+        data = self.to_dict()
+        lines = [f'{"stage":<16}{"calls":>8}{"wall s":>10}{"cpu s":>10}']
+        for name, times in sorted(data['stages'].items(), key=lambda item: -item[1]['wall_seconds']):
+            lines.append(f'{name:<16}{times["calls"]:>8}{times["wall_seconds"]:>10.3f}{times["cpu_seconds"]:>10.3f}')
+        lines.append(f'{"process":<16}{"":>8}{data["wall_seconds"]:>10.3f}{data["cpu_seconds"]:>10.3f}')
+        for name, value in sorted(data['counters'].items()):
+            lines.append(f'{name:<34}{value:>10}')
+        return '\n'.join(lines)
+
+    def to_prometheus(self):
+        """Collected values in the Prometheus text format"""
+        data = self.to_dict()
+        lines = []
+        for metric, key, description in (('stage_calls_total', 'calls', 'Calls of the stage'),
+                                         ('stage_wall_seconds_total', 'wall_seconds', 'Wall time of the stage'),
+                                         ('stage_cpu_seconds_total', 'cpu_seconds', 'CPU time of the stage')):
+            lines.append(f'# HELP {PROMETHEUS_PREFIX}_{metric} {description}')
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{metric} counter')
+            for name, times in sorted(data['stages'].items()):
+                lines.append(f'{PROMETHEUS_PREFIX}_{metric}{{stage="{name}"}} {times[key]}')
+        for name, value in sorted(data['counters'].items()):
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name}_total counter')
+            lines.append(f'{PROMETHEUS_PREFIX}_{name}_total {value}')
+        for name in ('wall_seconds', 'cpu_seconds'):
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_run_{name} gauge')
+            lines.append(f'{PROMETHEUS_PREFIX}_run_{name} {data[name]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Writes metrics to a .prom textfile or to JSON, replacing the file at once for collectors reading it"""
+        path = str(path)
+        content = self.to_prometheus() if path.endswith('.prom') else json.dumps(self.to_dict(), indent=2)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as file:
+            file.write(content)
+        os.replace(temp_path, path)
+
+
+class NullMetrics:
+    """Collector of a run without profiling"""
+
+    NULL_STAGE = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self.NULL_STAGE
+
+    def count(self, name, value=1):
+        pass
+
+
+_collector = NullMetrics()
+
+
+def enable():
+    """Starts collecting metrics, returns the collector"""
+    global _collector
+    _collector = Metrics()
+    return _collector
+
+
+def disable():
+    """Stops collecting metrics"""
+    global _collector
+    _collector = NullMetrics()
+
+
+def stage(name):
+    """Context manager measuring a call of the stage"""
+    return _collector.stage(name)
+
+
+def count(name, value=1):
+    """Adds the value to the counter"""
+    _collector.count(name, value)
@@ -0,0 +1,210 @@
+""" Library API: a Reader owns the cache connection and yields articles, failures raise main_reader.errors
+
+    with Reader('news.db') as reader:
+        for article in reader.iter_feed('https://example.com/rss', limit=10):
+            ...
+        for article in reader.iter_cached('20220918'):
+            ...
+
+Downloads go over the pooled keep-alive transport of the process, so a long-lived service calling
+the reader again and again reuses connections to feed servers as well as the cache connection.
+"""
+import logging
+
+from main_reader import archive
+from main_reader import database
+from main_reader import dedup
+from main_reader import errors
+from main_reader import feeds
+from main_reader import helper
+from main_reader import images
+from main_reader import ingest
+from main_reader import metrics
+from main_reader import watch
+
+
+class Reader:
+    """Fetches feeds into the cache and reads cached news, one instance serves any number of calls
+
+    Not thread-safe, every thread should use its own Reader.
+    """
+
+    def __init__(self, db_path=None, workers=feeds.DEFAULT_WORKERS, deduplicate=True, archive_payloads=True,
+                 logger=None, connection=None):
+        self.workers = helper.check_workers(workers)
+        self.logger = logger or logging.getLogger(__name__)
+        self.owns_connection = connection is None
+        self.connection = connection or database.connect(db_path or database.default_path())
+        # File of the cache, empty for an in-memory database
+        self.path = self.connection.execute('PRAGMA database_list').fetchone()[2]
+        helper.init_database(self.connection)
+        self.deduplicator = dedup.Deduplicator(self.connection) if deduplicate else None
+        self.payload_archive = archive.PayloadArchive(self.connection) if archive_payloads else None
+
+    @staticmethod
+    def error_of(result):
+        """The exception of a failed fetch, unexpected errors make the source unavailable"""
+        if isinstance(result.exception, errors.ReaderError):
+            return result.exception
+        return errors.SourceUnavailableError(result.error)
+
+    def store(self, result):
+        """Caches the fetched feed and returns all its articles, raises the error of a failed fetch"""
+        if not result.ok:
+            raise self.error_of(result)
+        articles, _ = feeds.store_result(result, self.connection, self.logger, self.deduplicator,
+                                         payload_archive=self.payload_archive)
+        return articles
+
+    def iter_feed(self, url, limit=None):
+        """Yields articles of the feed while it is downloaded and parsed, no more than limit of them
+
+        Nothing is fetched before the first article is asked for. Articles are cached in chunks of
+        feeds.CHUNK_SIZE before they are yielded. The first chunk is parsed while the feed is downloaded,
+        the rest of the document is downloaded before it is yielded, so suspended iterators do not hold
+        connections. A not modified feed yields its cached articles.
+        """
+        if limit is not None:
+            limit = helper.check_limit(limit)
+        return self.generate_feed(url, limit)
+
+    def generate_feed(self, url, limit):
+        """Generator of iter_feed, started once the arguments are checked"""
+        validators = helper.get_validators(self.connection, url)
+        for result in feeds.stream_feed(url, *validators, limit, record=self.payload_archive is not None):
+            articles = self.store(result)
+            yield from articles[:limit] if result.not_modified else articles
+
+    def iter_feeds(self, urls, limit=None):
+        """Fetches the feeds concurrently and yields their articles feed by feed, as soon as a feed is cached
+
+        A failed feed does not stop the others, its error is raised after all the others were read.
+        """
+        if not urls:
+            raise errors.InvalidArgumentError('Please, specify at least one RSS URL')
+        if limit is not None:
+            limit = helper.check_limit(limit)
+        validators = {url: helper.get_validators(self.connection, url) for url in urls}
+        return self.generate_feeds(urls, validators, limit)
+
+    def generate_feeds(self, urls, validators, limit):
+        """Generator of iter_feeds, started once the arguments are checked"""
+        failed = []
+        for result in feeds.fetch_feeds(urls, self.workers, validators, limit):
+            try:
+                articles = self.store(result)
+            except errors.ReaderError as exc:
+                self.logger.info('%s: %s', result.url, exc)
+                failed.append(exc)
+                continue
+            yield from articles
+        if failed:
+            raise failed[0] if len(failed) == 1 else errors.SourceUnavailableError(
+                f'{len(failed)} of {len(urls)} sources are not available')
+
+    def fetch(self, urls, limit=None, on_error=None):
+        """Fetches the feeds and returns their articles in the order of urls
+
+        A failed feed is passed to on_error with its error message, the error is raised if none of the
+        feeds was read.
+        """
+        if not urls:
+            raise errors.InvalidArgumentError('Please, specify at least one RSS URL')
+        if limit is not None:
+            limit = helper.check_limit(limit)
+        self.logger.info(f'Fetching {len(urls)} feed(s) with {self.workers} worker(s)...')
+        validators = {url: helper.get_validators(self.connection, url) for url in urls}
+        fetched = {}
+        failed = []
+        counts = [0, 0, 0]
+        for result in feeds.fetch_feeds(urls, self.workers, validators, limit):
+            if not result.ok:
+                failed.append(result)
+                if on_error:
+                    on_error(result.url, result.error)
+                continue
+            fetched[result.url] = self.store(result)
+            counts = [total + value for total, value in zip(counts, (result.inserted, result.updated,
+                                                                       result.unchanged))]
+        self.logger.info('Cache: %s inserted, %s updated, %s unchanged news', *counts)
+        if not fetched:
+            raise self.error_of(failed[0]) if len(failed) == 1 else errors.SourceUnavailableError(
+                'None of the sources are available')
+        return [article for url in urls for article in fetched.get(url, [])]
+
+    def iter_cached(self, date_from=None, date_to=None, urls=None, order=None, limit=None, offset=None,
+                    after=None):
+        """Yields cached news published from date_from to date_to (YYYYMMDD, both included) of the feeds
+
+        News are read from the cache in chunks while they are consumed.
+        """
+        for date in (date_from, date_to):
+            if date:
+                helper.check_date(date)
+        if limit is not None:
+            limit = helper.check_limit(limit)
+        if order not in (None, 'asc', 'desc'):
+            raise errors.InvalidArgumentError('The order should be "asc" or "desc"')
+        return helper.query_news(self.connection, urls or None, date_from, date_to, order, limit, offset, after)
+
+    def search(self, query, limit=None):
+        """Full-text search over titles and sources of cached news, best matches first"""
+        if limit is not None:
+            limit = helper.check_limit(limit)
+        return iter(helper.search_news(query, self.connection, limit))
+
+    def watch(self, urls, on_news=None):
+        """Polls the feeds on their adaptive intervals until interrupted, on_news gets lists of new articles"""
+        watcher = watch.Watcher(urls, self.workers, self.connection, self.logger, self.deduplicator, on_news,
+                                payload_archive=self.payload_archive)
+        self.logger.info(f'Watching {len(urls)} feed(s), press Ctrl+C to stop')
+        watcher.run()
+
+    def ingest(self, urls, processes=None):
+        """Caches many feeds, parsing them in processes (one per CPU by default), returns the ingest.IngestReport"""
+        if not urls:
+            raise errors.InvalidArgumentError('Please, specify at least one RSS URL')
+        if processes is not None:
+            processes = helper.check_workers(processes)
+        return ingest.ingest(urls, self.connection, processes, self.workers, self.deduplicator,
+                             payload_archive=self.payload_archive)
+
+    def replay(self, urls=None, processes=None):
+        """Caches news of archived documents of the feeds again, all feeds by default, returns the report"""
+        if processes is not None:
+            processes = helper.check_workers(processes)
+        report = ingest.replay(self.connection, urls or None, processes, self.deduplicator)
+        if not report.feeds and not report.errors:
+            raise errors.NewsNotFoundError('No archived documents of the feeds')
+        return report
+
+    def cache_images(self, articles, directory=None, max_bytes=images.DEFAULT_MAX_BYTES, thumbnail_width=None):
+        """Downloads images of the articles which are not cached yet, returns a mapping of image urls to files"""
+        image_cache = images.ImageCache(self.connection, directory, max_bytes, thumbnail_width, self.workers)
+        with metrics.stage('images'):
+            return image_cache.localize(articles)
+
+    def prune(self, days):
+        """Deletes news published more than days ago, returns the number of deleted news"""
+        if days < 0:
+            raise errors.InvalidArgumentError('Number of days must be a positive integer')
+        return helper.prune_news(self.connection, days)
+
+    def compact(self):
+        """Returns free pages of the cache to the file system and optimizes its indexes"""
+        database.compact(self.connection)
+
+    def rebuild_index(self):
+        """Rebuilds the full-text index of cached news"""
+        helper.rebuild_search_index(self.connection)
+
+    def close(self):
+        """Closes the cache connection if the reader opened it"""
+        if self.owns_connection:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,9 +1,13 @@
 """ Main module. Receive input info from bash, parse it and print result to stdout """
+import itertools
 import logging.handlers
-import pathlib
-import sqlite3
+import os
+import sys
 
+from main_reader import database
+from main_reader import errors
 from main_reader import helper
+from main_reader import metrics
 from main_reader.colorize_logger import ColorizeLogger
 
 VERSION = 5.0
@@ -15,15 +19,56 @@ def main():
         of news to print (json or not) and call valid function for printing.
         """
 
-    # Creating logger
-    logger = ColorizeLogger()
+    # Parsing arguments first, so --version and --help exit before any other work
+    args = helper.parce_command_line_arguments()
+    try:
+        return profile(args)
+    except errors.ReaderError as exc:
+        raise SystemExit(str(exc))
 
-    # Creating connection
-    db = str(pathlib.Path(__file__).parent.absolute()) + '\\news.db'
-    connection = sqlite3.connect(db)
-    helper.init_database(connection)
 
-    args = helper.parce_command_line_arguments()
+def profile(args):
+    """Runs the reader, measuring it if arguments ask for that"""
+    if not (args.profile or args.profile_stats or args.metrics_file):
+        return run(args)
+
+    collector = metrics.enable()
+    profiler = None
+    if args.profile_stats:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with collector.stage('run'):
+            return run(args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile_stats)
+        if args.metrics_file:
+            collector.write(args.metrics_file)
+        if args.profile:
+            print(collector.summary(), file=sys.stderr)
+
+
+def run(args):
+    """Reads news by the parsed arguments"""
+    # The library stack is imported once arguments are parsed, --version and --help exit before that
+    from main_reader import feeds
+    from main_reader import images
+    from main_reader.reader import Reader
+
+    # Creating logger next to the cache
+    db_path = args.db or database.default_path()
+    logger = ColorizeLogger(log_path=args.log_file, cache_path=db_path)
+
+    # Creating the reader and its connection
+    reader = Reader(db_path, args.workers, not args.no_dedup, not args.no_archive, logger)
+
+    def cache_images(news):
+        return reader.cache_images(news, db_path.parent / 'images', args.image_cache_size * 2 ** 20,
+                                   images.THUMBNAIL_WIDTH if args.thumbnails else None)
 
     if args.colorize:
         logger.is_colorize = True
@@ -37,22 +82,111 @@ def main():
         logging.disable(0)
         logger.info('Verbose mode is ON')
 
+    sources = feeds.collect_sources(args.source, args.feed_list)
+
+    if args.rebuild_index:
+        logger.info('Rebuilding the full-text index...')
+        reader.rebuild_index()
+        logger.info('The full-text index was rebuilt successfully!')
+
+    if args.prune_older_than is not None:
+        deleted = reader.prune(args.prune_older_than)
+        logger.info(f'{deleted} news older than {args.prune_older_than} day(s) were deleted from the cache')
+
+    if args.compact:
+        logger.info('Compacting the cache...')
+        reader.compact()
+        logger.info('The cache was compacted successfully!')
+
+    if args.rebuild_index or args.prune_older_than is not None or args.compact:
+        if not (args.search or args.date or args.date_from or args.date_to or sources or args.serve is not None):
+            return
+
+    if args.serve is not None:
+        from main_reader import server
+
+        reader.close()
+        server.serve(reader.path, logger, args.host, args.serve, reader.workers)
+        return
+
+    if args.watch:
+        reader.watch(sources, lambda new_news: print_news(new_news, args, logger))
+        return
+
+    if args.ingest:
+        logger.info(f'Ingesting {len(sources)} feed(s)...')
+        report = reader.ingest(sources, args.ingest_workers)
+        for url, error in report.errors:
+            print(f'{url}: {error}', file=sys.stderr)
+        logger.print(str(report))
+        return
+
+    if args.replay:
+        logger.info(f'Replaying archived documents of {len(sources) or "all"} feed(s)...')
+        report = reader.replay(sources, args.ingest_workers)
+        for url, error in report.errors:
+            print(f'{url}: {error}', file=sys.stderr)
+        logger.print(str(report))
+        return
+
     news = list()
-    if args.date:
-        try:
-            logger.info(f"Retrieve news from cache for the date {args.date}")
-            news = helper.get_cashed_news(args.date, connection, args.source)
-            if len(news) == 0:
-                raise SystemExit(f"Cached news not found for the date {args.date}")
-        except ValueError:
-            logger.error("No valid date provided")
+    if args.search:
+        logger.info(f'Searching cached news for "{args.search}"')
+        news = list(reader.search(args.search, limit or None))
+        if len(news) == 0:
+            raise errors.NewsNotFoundError(f'Cached news not found for "{args.search}"')
+    elif args.date or args.date_from or args.date_to:
+        date_from = args.date or args.date_from
+        date_to = args.date or args.date_to
+        news = reader.iter_cached(date_from, date_to, sources, args.order, limit or None, args.offset, args.after)
+        logger.info(f"Retrieve news from cache for the dates {date_from or '...'} - {date_to or '...'}")
+        first = next(news, None)
+        if first is None:
+            raise errors.NewsNotFoundError(
+                f"Cached news not found for the date {args.date}" if args.date
+                else f"Cached news not found for the dates {date_from or '...'} - {date_to or '...'}")
+        news = itertools.chain([first], news)
     else:
-        news = helper.get_news(args.source)
-        helper.save_news(news, connection, args.source)
+        news = fetch_news(reader, sources, limit or None)
+        if args.cache_images:
+            logger.info('Caching images of fetched news...')
+            cache_images(news)
     if limit > 0:
         logger.info(f'The limit of articles is set to {limit}')
-        news = news[:limit]
-    if args.json:
+        news = itertools.islice(news, limit)
+    image_paths = None
+    if args.to_pdf or args.to_html:
+        news = list(news)
+        if args.cache_images:
+            logger.info('Caching images of exported news...')
+            image_paths = cache_images(news)
+    with metrics.stage('output'):
+        print_news(news, args, logger)
+    if args.to_pdf:
+        logger.info('Converting existing list of news to PDF format...')
+        with metrics.stage('export_pdf'):
+            helper.save_news_pdf(news, args.to_pdf, logger, args.pdf_workers, images=image_paths)
+        logger.info('The list of news was saved as PDF successfully!')
+    if args.to_html:
+        logger.info('Converting existing list of news to HTML format...')
+        with metrics.stage('export_html'):
+            helper.save_news_html(news, args.to_html, logger, args.html_page_size, image_paths)
+        logger.info('The list of news was saved as HTML successfully!')
+
+
+def print_news(news, args, logger):
+    """Prints news in the format chosen by arguments"""
+    if args.format in ('ndjson', 'json-array'):
+        logger.info('Writing the list of news in %s format...', args.format)
+        logger.flush()
+        try:
+            helper.write_news(news, args.format, sys.stdout)
+        except BrokenPipeError:
+            # The consumer stopped reading, redirect the rest of the output to devnull to exit quietly
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            raise SystemExit(1)
+        logger.info('The list of news was written successfully!')
+    elif args.json or args.format == 'json':
         logger.info('Creating the list of news in JSON format...')
         for article in news:
             article_json = helper.make_json(article)
@@ -63,14 +197,14 @@ def main():
         for article in news:
             logger.print(article)
         logger.info('The list of news was created successfully!')
-    if args.to_pdf:
-        logger.info('Converting existing list of news to PDF format...')
-        helper.save_news_pdf(news, args.to_pdf, logger)
-        logger.info('The list of news was saved as PDF successfully!')
-    if args.to_html:
-        logger.info('Converting existing list of news to HTML format...')
-        helper.save_news_html(news, args.to_html, logger)
-        logger.info('The list of news was saved as HTML successfully!')
+
+
+def fetch_news(reader, sources, limit=None):
+    """Fetches all sources with the reader and returns their articles in the order of sources
+
+    With a limit no more than limit entries are read from every feed. Failed feeds are reported to stderr.
+    """
+    return reader.fetch(sources, limit, lambda url, error: print(f'{url}: {error}', file=sys.stderr))
 
 
 if __name__ == '__main__':
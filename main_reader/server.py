@@ -0,0 +1,222 @@
+""" Serve mode: read-only JSON API over the cache, answered from an in-memory result cache
+
+Dashboards ask for the same few lists of news again and again, a process started per query spends most of
+its time on imports and opening the cache. Here one process keeps a pool of read-only connections and the
+encoded responses. Responses expire after a TTL and all of them are dropped as soon as anything is written
+to the cache: PRAGMA data_version of a connection changes when another connection commits, in this process
+(save_news of --watch) or any other one.
+"""
+import collections
+import http.server
+import json
+import pathlib
+import queue
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+from main_reader import database
+from main_reader import errors
+from main_reader import helper
+from main_reader import metrics
+
+DEFAULT_PORT = 8080
+CACHE_SIZE = 1024
+CACHE_TTL = 60
+LATEST_LIMIT = 20
+MAX_LIMIT = 1000
+POOL_SIZE = 4
+
+
+class ApiError(Exception):
+    """The request can not be answered, args are the HTTP status and the message"""
+
+
+class ReadPool:
+    """Read-only connections to the cache shared by the threads of the server"""
+
+    def __init__(self, path, size=POOL_SIZE):
+        uri = pathlib.Path(path).resolve().as_uri() + '?mode=ro'
+        self.connections = queue.Queue()
+        for _ in range(size):
+            connection = sqlite3.connect(uri, uri=True, timeout=database.BUSY_TIMEOUT, check_same_thread=False)
+            connection.execute('PRAGMA query_only=ON')
+            self.connections.put(connection)
+        self.size = size
+
+    def acquire(self):
+        """Waits for a free connection"""
+        return self.connections.get()
+
+    def release(self, connection):
+        """Returns the connection to the pool"""
+        self.connections.put(connection)
+
+    def close(self):
+        """Closes all connections, waiting for those in use"""
+        for _ in range(self.size):
+            self.connections.get().close()
+
+
+class ResultCache:
+    """Encoded responses by request, least recently used ones are evicted and every one expires after ttl seconds
+
+    The cache is cleared when the data version of the cache database changes.
+    """
+
+    def __init__(self, connection, size=CACHE_SIZE, ttl=CACHE_TTL, clock=time.monotonic):
+        self.connection = connection
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.data_version = self.read_data_version()
+
+    def read_data_version(self):
+        """Data version of the connection, it changes on every commit of other connections"""
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def get(self, key):
+        """Returns the cached response or None"""
+        with self.lock:
+            version = self.read_data_version()
+            if version != self.data_version:
+                self.data_version = version
+                self.entries.clear()
+                metrics.count('cache_invalidations')
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < self.clock():
+                metrics.count('cache_misses')
+                return None
+            self.entries.move_to_end(key)
+            metrics.count('cache_hits')
+            return entry[1]
+
+    def put(self, key, value, version):
+        """Saves the response built when the cache was at the data version"""
+        with self.lock:
+            if version != self.data_version:
+                # The news were written while the response was built
+                return
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class Api:
+    """Answers requests of the API: /news by date and source url, /news/latest and /health"""
+
+    def __init__(self, path, pool_size=POOL_SIZE, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL):
+        self.pool = ReadPool(path, pool_size + 1)
+        # One connection of the pool only watches the data version
+        self.cache = ResultCache(self.pool.acquire(), cache_size, cache_ttl)
+        self.encode = json.JSONEncoder(separators=(',', ':')).encode
+
+    def respond(self, target):
+        """Returns the status and the JSON body of the request target"""
+        parts = urllib.parse.urlsplit(target)
+        route = parts.path.rstrip('/') or '/'
+        if route == '/health':
+            return 200, b'{"status":"ok"}'
+        query = urllib.parse.parse_qs(parts.query)
+        key = (route, tuple(sorted((name, tuple(values)) for name, values in query.items())))
+        body = self.cache.get(key)
+        if body is not None:
+            return 200, body
+        with self.cache.lock:
+            version = self.cache.data_version
+        try:
+            news = self.find_news(route, query)
+        except ApiError as exc:
+            status, message = exc.args
+            return status, self.encode({'error': message}).encode('utf-8')
+        body = ('[' + ','.join(self.encode(article.to_dict()) for article in news) + ']').encode('utf-8')
+        self.cache.put(key, body, version)
+        return 200, body
+
+    def find_news(self, route, query):
+        """Reads the news of the route from the cache"""
+        sources = query.get('source') or None
+        limit = self.read_limit(query)
+        if route == '/news':
+            date = query.get('date', [''])[0]
+            if not (date or sources):
+                raise ApiError(400, 'Please, specify the date or the source')
+            if date:
+                self.validate(helper.check_date, date)
+            arguments = (sources, date or None, date or None, query.get('order', ['asc'])[0], limit)
+        elif route == '/news/latest':
+            arguments = (sources, None, None, 'desc', limit or LATEST_LIMIT)
+        else:
+            raise ApiError(404, f'Unknown path {route}')
+        connection = self.pool.acquire()
+        try:
+            with metrics.stage('cache_read'):
+                return list(helper.query_news(connection, *arguments))
+        finally:
+            self.pool.release(connection)
+
+    def read_limit(self, query):
+        """The limit of the query, no greater than MAX_LIMIT"""
+        if 'limit' not in query:
+            return MAX_LIMIT if 'date' in query or 'source' in query else None
+        return min(self.validate(helper.check_limit, query['limit'][0]), MAX_LIMIT)
+
+    @staticmethod
+    def validate(check, value):
+        """Runs the check of the CLI argument, its error is an error of the request"""
+        try:
+            return check(value)
+        except errors.InvalidArgumentError as exc:
+            raise ApiError(400, str(exc))
+
+    def close(self):
+        """Closes the connections"""
+        self.pool.release(self.cache.connection)
+        self.pool.close()
+
+
+class ApiHandler(http.server.BaseHTTPRequestHandler):
+    """Keep-alive handler of GET requests of the API"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        status, body = self.server.api.respond(self.path)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.logger.info('%s - %s', self.address_string(), format % args)
+
+
+class ApiServer(http.server.ThreadingHTTPServer):
+    """HTTP server of the API, a thread per connection"""
+
+    daemon_threads = True
+
+    def __init__(self, address, api, logger):
+        self.api = api
+        self.logger = logger
+        super().__init__(address, ApiHandler)
+
+
+def serve(path, logger, host='127.0.0.1', port=DEFAULT_PORT, pool_size=POOL_SIZE):
+    """Serves the cache until the process is interrupted"""
+    api = Api(path, pool_size)
+    server = ApiServer((host, port), api, logger)
+    logger.print(f'Serving the cache at http://{host}:{server.server_address[1]}/news, press Ctrl+C to stop')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        api.close()
@@ -0,0 +1,139 @@
+""" Incremental parsing of RSS and Atom documents: entries are yielded as soon as they are read """
+import urllib.parse
+import xml.etree.ElementTree as ElementTree
+
+MEDIA_NAMESPACE = '{http://search.yahoo.com/mrss/}'
+XML_BASE = '{http://www.w3.org/XML/1998/namespace}base'
+ENTRY_TAGS = {'item', 'entry'}
+# Elements feedparser reads into published and updated, the first one found is kept
+PUBLISHED_TAGS = ('pubDate', 'published', 'issued')
+UPDATED_TAGS = ('updated', 'date', 'modified')
+GUID_TAGS = {'guid', 'id'}
+
+
+def local_name(tag):
+    """Tag without its namespace"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def element_text(element):
+    """Text of the element and its children, stripped"""
+    return ''.join(element.itertext()).strip()
+
+
+def entry_link(element):
+    """Link of an RSS item or the alternate link of an Atom entry"""
+    if element.get('href') is None:
+        return element_text(element)
+    if element.get('rel', 'alternate') == 'alternate':
+        return element.get('href')
+    return None
+
+
+def resolve(base, element):
+    """Base url of the element, changed by its xml:base"""
+    value = element.get(XML_BASE)
+    if value is None:
+        return base
+    return urllib.parse.urljoin(base, value) if base else value
+
+
+def make_entry(item, base=None):
+    """Turns an item element into a dict with the keys of feedparser entries create_articles reads
+
+    As feedparser does, a permalink guid or an Atom id is the link of an entry without one, and relative
+    links are resolved against base, the url of the document or its xml:base.
+    """
+    entry = {}
+    dates = {}
+    guid = None
+    base = resolve(base, item)
+    for child in item:
+        name = local_name(child.tag)
+        if child.tag == MEDIA_NAMESPACE + 'content' and 'media_content' not in entry and child.get('url'):
+            entry['media_content'] = [{'url': child.get('url')}]
+        elif child.tag == MEDIA_NAMESPACE + 'group' and 'media_content' not in entry:
+            content = child.find(MEDIA_NAMESPACE + 'content')
+            if content is not None and content.get('url'):
+                entry['media_content'] = [{'url': content.get('url')}]
+        elif name == 'title' and 'title' not in entry:
+            entry['title'] = element_text(child)
+        elif name == 'link' and 'link' not in entry:
+            link = entry_link(child)
+            if link:
+                entry['link'] = link
+                link_base = resolve(base, child)
+        elif name in GUID_TAGS and guid is None and child.get('isPermaLink', 'true') == 'true':
+            guid = element_text(child)
+            guid_base = resolve(base, child)
+        elif name == 'source':
+            title = child.find('{*}title')
+            entry['source'] = {'title': element_text(title if title is not None else child)}
+        elif name in PUBLISHED_TAGS or name in UPDATED_TAGS:
+            dates.setdefault(name, element_text(child))
+    if 'link' not in entry and guid:
+        entry['link'], link_base = guid, guid_base
+    if 'link' in entry and link_base:
+        entry['link'] = urllib.parse.urljoin(link_base, entry['link'])
+    for key, tags in (('published', PUBLISHED_TAGS), ('updated', UPDATED_TAGS)):
+        for name in tags:
+            if dates.get(name):
+                entry[key] = dates[name]
+                break
+    return entry
+
+
+class FeedStream:
+    """Iterates over entries of a feed document read from a binary file object
+
+    Parsed elements are dropped right after their entry is yielded, so memory does not grow with the
+    size of the document, and nothing after the last requested entry is read. Channel hints met before
+    that are kept in ttl and skip_hours, links of the entries read in links. Relative links are resolved
+    against base, the url of the document.
+    """
+
+    def __init__(self, source, base=None):
+        self.source = source
+        self.base = base
+        self.ttl = None
+        self.skip_hours = set()
+        self.links = []
+        self.finished = False
+
+    def __iter__(self):
+        parents = []
+        # Base urls the children of the parents are resolved against
+        bases = [self.base]
+        depth_in_entry = 0
+        for event, element in ElementTree.iterparse(self.source, events=('start', 'end')):
+            name = local_name(element.tag)
+            if event == 'start':
+                parents.append(element)
+                bases.append(resolve(bases[-1], element))
+                if name in ENTRY_TAGS:
+                    depth_in_entry += 1
+                continue
+            parents.pop()
+            bases.pop()
+            if name in ENTRY_TAGS:
+                depth_in_entry -= 1
+                if depth_in_entry == 0:
+                    entry = make_entry(element, bases[-1])
+                    if entry.get('link'):
+                        self.links.append(entry['link'])
+                    yield entry
+                    if parents:
+                        parents[-1].remove(element)
+            elif depth_in_entry == 0:
+                self.read_hint(name, element)
+                if parents:
+                    parents[-1].remove(element)
+        self.finished = True
+
+    def read_hint(self, name, element):
+        """Keeps polling hints of the channel"""
+        text = (element.text or '').strip()
+        if name == 'ttl' and text.isdigit():
+            self.ttl = int(text)
+        elif name == 'hour' and text.isdigit() and int(text) < 24:
+            self.skip_hours.add(int(text))
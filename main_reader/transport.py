@@ -0,0 +1,313 @@
+""" HTTP transport of feed downloads: keep-alive connections reused per host, compression, timeouts and retries
+
+urllib opens a new connection for every request and waits on a silent server for as long as it keeps the
+socket open. Here every host has a small pool of persistent connections and a cap on concurrent requests,
+connect and read timeouts are separate, a whole download has a deadline and failed requests are retried
+with exponential backoff and jitter. Proxies are taken from the environment as urllib does: HTTP_PROXY,
+HTTPS_PROXY and NO_PROXY, https urls are tunnelled with CONNECT.
+"""
+import base64
+import http.client
+import random
+import ssl
+import threading
+import time
+import urllib.parse
+import urllib.request
+import zlib
+
+from main_reader import metrics
+
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+# A server sending a byte every READ_TIMEOUT seconds must not hold the run either
+DOWNLOAD_TIMEOUT = 120
+PER_HOST_LIMIT = 4
+RETRIES = 2
+BACKOFF = 0.5
+MAX_REDIRECTS = 5
+CHUNK_SIZE = 256 * 1024
+USER_AGENT = 'rss_reader'
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+
+class TransportError(OSError):
+    """The url could not be downloaded"""
+
+
+def is_http(url):
+    """Checks the url is downloaded by the transport"""
+    return urllib.parse.urlsplit(str(url)).scheme in ('http', 'https')
+
+
+def proxy_headers(proxy):
+    """Proxy-Authorization header of the credentials in the proxy url"""
+    if not proxy.username:
+        return {}
+    credentials = f'{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or "")}'
+    return {'Proxy-Authorization': 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')}
+
+
+class HostPool:
+    """Idle keep-alive connections of one host and the slots of its concurrent requests
+
+    With a proxy, the urllib.parse.SplitResult of its url, connections go to the proxy: http requests are
+    sent to it with absolute urls and https ones through a tunnel to the host.
+    """
+
+    def __init__(self, scheme, netloc, limit, connect_timeout, read_timeout, context=None, proxy=None):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.context = context
+        self.proxy = proxy
+        # Headers every request of the pool is sent with
+        self.headers = proxy_headers(proxy) if proxy and scheme == 'http' else {}
+        self.slots = threading.BoundedSemaphore(limit)
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def target(self, parts):
+        """Request target of the url, absolute when http requests go to a proxy"""
+        if self.proxy and self.scheme == 'http':
+            return urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path or '/', parts.query, ''))
+        return urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+    def connect(self):
+        """Opens a new connection, the read timeout replaces the connect one once it is established"""
+        netloc = self.proxy.netloc.rpartition('@')[2] if self.proxy else self.netloc
+        if self.scheme == 'https':
+            connection = http.client.HTTPSConnection(netloc, timeout=self.connect_timeout, context=self.context)
+            if self.proxy:
+                connection.set_tunnel(self.netloc, headers=proxy_headers(self.proxy))
+        else:
+            connection = http.client.HTTPConnection(netloc, timeout=self.connect_timeout)
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        metrics.count('connections_opened')
+        return connection
+
+    def acquire(self):
+        """Waits for a free slot, returns an idle connection or None if a new one is needed"""
+        self.slots.acquire()
+        with self.lock:
+            if self.idle:
+                metrics.count('connections_reused')
+                return self.idle.pop()
+        return None
+
+    def release(self, connection=None):
+        """Frees the slot, keeps the connection for the next request if it is given"""
+        if connection is not None:
+            with self.lock:
+                self.idle.append(connection)
+        self.slots.release()
+
+    def close(self):
+        """Closes idle connections"""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+
+class Response:
+    """Binary file object of a response body, decompressed while it is read
+
+    The connection goes back to the pool when the body is read to the end and closed, a response closed
+    earlier closes its connection.
+    """
+
+    def __init__(self, url, raw, connection, pool, deadline):
+        self.url = url
+        self.raw = raw
+        self.status = raw.status
+        self.headers = raw.headers
+        self.connection = connection
+        self.pool = pool
+        self.deadline = deadline
+        self.buffer = bytearray()
+        self.finished = False
+        self.closed = False
+        self.bytes_received = 0
+        encoding = self.headers.get('Content-Encoding', '').strip().lower()
+        # 32 + MAX_WBITS accepts both gzip and zlib headers, servers send either for deflate
+        self.decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS) if encoding in ('gzip', 'deflate') else None
+
+    def fill(self):
+        """Reads what the socket has, up to CHUNK_SIZE bytes, returns it decompressed"""
+        if time.monotonic() > self.deadline:
+            raise TransportError(f'Download of {self.url} takes more than {DOWNLOAD_TIMEOUT} seconds')
+        try:
+            chunk = self.raw.read1(CHUNK_SIZE)
+        except http.client.HTTPException as exc:
+            raise TransportError(f'{type(exc).__name__}: {exc}') from exc
+        if not chunk:
+            self.finished = True
+            return self.decompressor.flush() if self.decompressor else b''
+        self.bytes_received += len(chunk)
+        if not self.decompressor:
+            return chunk
+        try:
+            return self.decompressor.decompress(chunk)
+        except zlib.error as exc:
+            raise TransportError(f'Broken {self.headers.get("Content-Encoding")} body of {self.url}') from exc
+
+    def read(self, size=-1):
+        """Reads up to size bytes of the decompressed body, all of it by default"""
+        if size < 0:
+            parts = [bytes(self.buffer)]
+            self.buffer.clear()
+            while not self.finished:
+                parts.append(self.fill())
+            return b''.join(parts)
+        # Returns as soon as there is some data, so incremental parsers get entries while the body arrives
+        while not self.finished and not self.buffer:
+            self.buffer += self.fill()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def close(self):
+        """Returns the connection to the pool if the whole body was read, closes it otherwise"""
+        if self.closed:
+            return
+        self.closed = True
+        metrics.count('bytes_downloaded', self.bytes_received)
+        if self.raw.length == 0:
+            # Nothing left of the body, as in 304 responses
+            self.finished = True
+        if self.finished and not self.raw.will_close:
+            self.raw.close()
+            self.pool.release(self.connection)
+        else:
+            self.raw.close()
+            self.connection.close()
+            self.pool.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Transport:
+    """Downloads urls over pooled keep-alive connections, safe to use from many threads"""
+
+    def __init__(self, per_host=PER_HOST_LIMIT, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 retries=RETRIES, backoff=BACKOFF, proxies=None):
+        self.per_host = per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        # Maps a scheme to the url of its proxy and 'no' to the hosts reached directly, as urllib.request.getproxies
+        self.proxies = urllib.request.getproxies() if proxies is None else proxies
+        self.context = ssl.create_default_context()
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def proxy(self, scheme, netloc):
+        """Parsed url of the proxy requests to the host go through, None for direct connections"""
+        proxy = self.proxies.get(scheme)
+        if not proxy or urllib.request.proxy_bypass_environment(netloc, self.proxies):
+            return None
+        return urllib.parse.urlsplit(proxy if '://' in proxy else 'http://' + proxy)
+
+    def pool(self, scheme, netloc):
+        """Pool of the host, created on the first request to it"""
+        with self.lock:
+            pool = self.pools.get((scheme, netloc))
+            if pool is None:
+                pool = self.pools[(scheme, netloc)] = HostPool(scheme, netloc, self.per_host, self.connect_timeout,
+                                                               self.read_timeout, self.context,
+                                                               self.proxy(scheme, netloc))
+            return pool
+
+    def open(self, url, headers=None):
+        """Sends a GET request following redirects, returns the response of any status to read the body from
+
+        Raises TransportError when the server is not reachable after all retries.
+        """
+        headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate', **(headers or {})}
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self.request(url, headers)
+            location = response.headers.get('Location')
+            if response.status not in REDIRECT_STATUSES or not location:
+                return response
+            response.close()
+            url = urllib.parse.urljoin(url, location)
+        raise TransportError(f'Too many redirects from {url}')
+
+    def request(self, url, headers):
+        """Sends the request, retrying failed connections and temporary errors of the server"""
+        attempt = 0
+        while True:
+            try:
+                response = self.send(url, headers)
+            except (OSError, http.client.HTTPException) as exc:
+                if attempt >= self.retries:
+                    raise TransportError(f'{type(exc).__name__}: {exc}') from exc
+            else:
+                if response.status not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                response.read()
+                response.close()
+            metrics.count('http_retries')
+            # Full jitter keeps feeds of one host failed together from retrying in lockstep
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            attempt += 1
+
+    def send(self, url, headers):
+        """Sends one request over an idle connection of the host or a new one"""
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise ValueError(f'Unsupported url {url}')
+        pool = self.pool(parts.scheme, parts.netloc)
+        target = pool.target(parts)
+        headers = {**headers, **pool.headers}
+        connection = pool.acquire()
+        deadline = time.monotonic() + DOWNLOAD_TIMEOUT
+        try:
+            if connection is not None:
+                try:
+                    return Response(url, self.exchange(connection, target, headers), connection, pool, deadline)
+                except (OSError, http.client.HTTPException):
+                    # The server closed the idle connection, it is not a failure of the request
+                    connection.close()
+            connection = pool.connect()
+            return Response(url, self.exchange(connection, target, headers), connection, pool, deadline)
+        except BaseException:
+            if connection is not None:
+                connection.close()
+            pool.release()
+            raise
+
+    @staticmethod
+    def exchange(connection, target, headers):
+        """Writes the request and reads the status line and headers of the response"""
+        connection.request('GET', target, headers=headers)
+        return connection.getresponse()
+
+    def close(self):
+        """Closes idle connections of all hosts"""
+        with self.lock:
+            pools = list(self.pools.values())
+        for pool in pools:
+            pool.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """Transport shared by all downloads of the process"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport()
+        return _transport
@@ -0,0 +1,191 @@
+""" Watch mode: polling feeds from one long-running process, every feed on its own adaptive interval """
+import concurrent.futures
+import datetime
+import heapq
+import random
+import time
+
+from main_reader import errors
+from main_reader import feeds
+from main_reader import helper
+
+MIN_INTERVAL = 60
+DEFAULT_INTERVAL = 15 * 60
+MAX_INTERVAL = 24 * 60 * 60
+MAX_BACKOFF = 6 * 60 * 60
+# Weight of the last observed time between news in the estimated interval
+SMOOTHING = 0.5
+# The interval grows by this factor after every poll without news
+SLOWDOWN = 1.5
+JITTER = 0.1
+
+
+class FeedSchedule:
+    """Polling state of one feed"""
+
+    __slots__ = ('url', 'interval', 'errors', 'ttl', 'skip_hours', 'last_poll', 'next_poll')
+
+    def __init__(self, url, interval=DEFAULT_INTERVAL):
+        self.url = url
+        self.interval = interval
+        self.errors = 0
+        self.ttl = None
+        self.skip_hours = set()
+        self.last_poll = None
+        self.next_poll = None
+
+
+def skip_to_allowed_hour(timestamp, skip_hours):
+    """Moves the time to the start of the first UTC hour which is not in skip_hours"""
+    if not skip_hours or len(skip_hours) >= 24:
+        return timestamp
+    moment = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    while moment.hour in skip_hours:
+        moment = moment.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+    return moment.timestamp()
+
+
+class Scheduler:
+    """Priority queue of feeds ordered by the time of their next poll
+
+    A feed which published n news since its previous poll t seconds ago is expected to publish one
+    in t / n seconds, the interval moves towards this estimate. A feed without news is polled less
+    and less often up to MAX_INTERVAL. The RSS ttl is the lower bound of the interval, polls never
+    fall into skipHours and failed polls are retried with exponential backoff.
+    """
+
+    def __init__(self, urls, now, interval=DEFAULT_INTERVAL, min_interval=MIN_INTERVAL,
+                 max_interval=MAX_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.feeds = {url: FeedSchedule(url, interval) for url in urls}
+        self.queue = []
+        self.counter = 0
+        for schedule in self.feeds.values():
+            self.push(schedule, now)
+
+    def push(self, schedule, timestamp):
+        """Queues the next poll of the feed, the counter keeps the order of feeds due at the same time"""
+        schedule.next_poll = timestamp
+        heapq.heappush(self.queue, (timestamp, self.counter, schedule.url))
+        self.counter += 1
+
+    def pop_due(self, now, limit=None):
+        """Removes and returns urls of feeds which polls are due"""
+        due = []
+        while self.queue and self.queue[0][0] <= now and (limit is None or len(due) < limit):
+            due.append(heapq.heappop(self.queue)[2])
+        return due
+
+    def delay(self, now):
+        """Seconds until the next poll is due"""
+        if not self.queue:
+            return None
+        return max(self.queue[0][0] - now, 0)
+
+    def success(self, url, now, new_news, ttl=None, skip_hours=None):
+        """Adapts the interval of the feed to the number of news found by the poll and queues the next one"""
+        schedule = self.feeds[url]
+        if new_news and schedule.last_poll is not None:
+            observed = (now - schedule.last_poll) / new_news
+            schedule.interval = SMOOTHING * observed + (1 - SMOOTHING) * schedule.interval
+        elif not new_news:
+            schedule.interval *= SLOWDOWN
+        schedule.interval = min(max(schedule.interval, self.min_interval), self.max_interval)
+        schedule.errors = 0
+        schedule.ttl = ttl
+        schedule.skip_hours = skip_hours or set()
+        schedule.last_poll = now
+        self.push(schedule, self.next_time(schedule, now, schedule.interval))
+        return schedule
+
+    def failure(self, url, now):
+        """Queues the retry of a failed poll after an exponentially growing delay"""
+        schedule = self.feeds[url]
+        schedule.errors += 1
+        backoff = min(self.min_interval * 2 ** schedule.errors, MAX_BACKOFF)
+        self.push(schedule, self.next_time(schedule, now, backoff))
+        return schedule
+
+    def next_time(self, schedule, now, interval):
+        """Time of the next poll with the ttl, a random jitter against synchronized polls and skipHours"""
+        if schedule.ttl:
+            interval = max(interval, schedule.ttl * 60)
+        interval *= 1 + random.uniform(-JITTER, JITTER)
+        return skip_to_allowed_hour(now + interval, schedule.skip_hours)
+
+
+class Watcher:
+    """Polls feeds by the scheduler in a thread pool and caches news through one resident connection"""
+
+    def __init__(self, sources, workers, connection, logger, deduplicator=None, on_news=None, clock=time.time,
+                 payload_archive=None):
+        if not sources:
+            raise errors.InvalidArgumentError('Please, specify at least one RSS URL')
+        self.workers = workers
+        self.connection = connection
+        self.logger = logger
+        self.deduplicator = deduplicator
+        self.payload_archive = payload_archive
+        self.on_news = on_news
+        self.clock = clock
+        self.scheduler = Scheduler(sources, clock())
+        self.running = {}
+        # Fingerprints of cached news are read once, polls skip the entries which did not change since
+        self.seen = {}
+
+    def run(self):
+        """Polls feeds until interrupted"""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                while True:
+                    self.poll(executor)
+            except KeyboardInterrupt:
+                self.logger.info('Watch mode is stopped')
+                for future in self.running:
+                    future.cancel()
+
+    def poll(self, executor):
+        """Starts due polls, keeping at most two per worker in flight, and handles the finished ones"""
+        now = self.clock()
+        for url in self.scheduler.pop_due(now, self.capacity()):
+            etag, modified = helper.get_validators(self.connection, url)
+            if url not in self.seen:
+                self.seen[url] = helper.load_seen_links(self.connection, url)
+            self.running[executor.submit(feeds.fetch_feed, url, etag, modified, seen=self.seen[url])] = url
+
+        delay = self.scheduler.delay(self.clock())
+        if not self.running:
+            time.sleep(delay or 0)
+            return
+        if not self.capacity():
+            # More feeds may be due, but none can start before a poll in flight finishes
+            delay = None
+        done, _ = concurrent.futures.wait(self.running, timeout=delay,
+                                          return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            del self.running[future]
+            self.handle(future.result())
+
+    def capacity(self):
+        """Number of polls which can be started, two per worker are kept in flight"""
+        return max(2 * self.workers - len(self.running), 0)
+
+    def handle(self, result):
+        """Caches news of the result and schedules the next poll of its feed"""
+        now = self.clock()
+        if not result.ok:
+            schedule = self.scheduler.failure(result.url, now)
+            self.logger.info('%s: %s, retry #%s in %.0f s', result.url, result.error, schedule.errors,
+                             schedule.next_poll - now)
+            return
+        _, new = feeds.store_result(result, self.connection, self.logger, self.deduplicator,
+                                    self.seen.get(result.url), self.payload_archive, read_cached=False)
+        schedule = self.scheduler.feeds[result.url]
+        # A not modified feed is not parsed, so its hints of the previous poll stay
+        ttl, skip_hours = (schedule.ttl, schedule.skip_hours) if result.not_modified else \
+            (result.ttl, result.skip_hours)
+        self.scheduler.success(result.url, now, len(new), ttl, skip_hours)
+        self.logger.info('%s new news from %s, next poll in %.0f s', len(new), result.url, schedule.next_poll - now)
+        if new and self.on_news:
+            self.on_news(new)
@@ -0,0 +1,94 @@
+""" Test module for the archive of raw feed documents and the replay of it. """
+import sqlite3
+import unittest
+from unittest.mock import MagicMock
+
+from main_reader import archive
+from main_reader import feeds
+from main_reader import helper
+from main_reader import ingest
+from main_reader.article import Article
+
+RSS = '''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>News</title>{items}</channel></rss>'''
+ITEM = '<item><title>{title}</title><link>{link}</link><pubDate>Sun, 18 Sep 2022 17:11:56 GMT</pubDate></item>'
+
+
+def make_feed(*items):
+    """RSS document of (title, link) items"""
+    return RSS.format(items=''.join(ITEM.format(title=title, link=link) for title, link in items)).encode('utf-8')
+
+
+class TestArchive(unittest.TestCase):
+    """Test cases to test storing documents once, reading them back and replaying them"""
+
+    def setUp(self):
+        self.connection = sqlite3.connect(':memory:')
+        helper.init_database(self.connection)
+        self.archive = archive.PayloadArchive(self.connection)
+
+    def count(self, table):
+        """Number of rows of the table"""
+        return self.connection.execute(f'SELECT count(*) FROM {table}').fetchone()[0]
+
+    def test_documents_are_stored_once(self):
+        """Checks that a document fetched again is not stored again and is compressed"""
+        document = make_feed(*[(f'Title {number}', f'https://a.example/{number}') for number in range(50)])
+        self.archive.save('https://a.example/rss', document, 'application/rss+xml', fetched=100)
+        self.archive.save('https://a.example/rss', document, 'application/rss+xml', fetched=200)
+        self.assertEqual((1, 2), (self.count('payloads'), self.count('fetches')))
+        size, stored = self.connection.execute('SELECT size, length(data) FROM payloads').fetchone()
+        self.assertEqual(len(document), size)
+        self.assertLess(stored, size / 4)
+        [payload] = self.archive.payloads()
+        self.assertEqual((document, 'application/rss+xml', 100), (payload.data, payload.content_type, payload.fetched))
+
+    def test_payloads_in_order_of_fetches(self):
+        """Checks that documents are read back in the order they were first fetched, optionally of some feeds"""
+        self.archive.save('second', b'second v1', fetched=200)
+        self.archive.save('first', b'first v1', fetched=100)
+        self.archive.save('first', b'first v2', fetched=300)
+        self.assertEqual([b'first v1', b'second v1', b'first v2'],
+                         [payload.data for payload in self.archive.payloads()])
+        self.assertEqual([b'first v1', b'first v2'], [payload.data for payload in self.archive.payloads(['first'])])
+
+    def test_store_result_archives_the_document(self):
+        """Checks that the document of a fetched feed is archived with its news"""
+        result = feeds.FeedResult('url', [Article('Title', 'Link', '2022-09-18T17:11:56Z', 'Source', '---')],
+                                  payload=b'<rss/>', content_type='text/xml')
+        feeds.store_result(result, self.connection, MagicMock(), payload_archive=self.archive)
+        self.assertEqual([('url', b'<rss/>', 'text/xml')],
+                         [(payload.url, payload.data, payload.content_type) for payload in self.archive.payloads()])
+
+    def test_replay(self):
+        """Checks that news are cached again from the archive in the order of fetches, validators stay"""
+        self.archive.save('feed', make_feed(('First', 'https://a.example/1')), fetched=100)
+        self.archive.save('feed', make_feed(('Corrected', 'https://a.example/1'), ('Second', 'https://a.example/2')),
+                          fetched=200)
+        self.archive.save('other', b'not a feed', fetched=300)
+        helper.save_validators(self.connection, 'feed', '"v1"', None)
+
+        for processes in (1, 2):
+            with self.subTest(processes=processes):
+                self.connection.execute('DELETE FROM news')
+                report = ingest.replay(self.connection, processes=processes)
+                self.assertEqual((2, 3, 1), (report.feeds, report.rows, len(report.errors)))
+                self.assertEqual((2, 1), (report.inserted, report.updated))
+                self.assertEqual(['Second', 'Corrected'],
+                                 [article.title for article in helper.get_cashed_feed(self.connection, 'feed')])
+                self.assertEqual(('"v1"', None), helper.get_validators(self.connection, 'feed'))
+
+        report = ingest.replay(self.connection, ['feed'], processes=1)
+        self.assertEqual((0, 2, 1), (report.inserted, report.updated, report.unchanged))
+
+    def test_prune_removes_old_documents(self):
+        """Checks that fetches older than the retention and documents no longer fetched are deleted"""
+        self.archive.save('feed', b'old', fetched=0)
+        self.archive.save('feed', b'new')
+        helper.prune_news(self.connection, 30)
+        self.assertEqual([b'new'], [payload.data for payload in self.archive.payloads()])
+        self.assertEqual(1, self.count('payloads'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from unittest.mock import patch
 
 from main_reader.article import Article
 
@@ -30,6 +31,31 @@ class TestArticle(unittest.TestCase):
             'Image': IMAGE,
         }, self.article.to_dict())
 
+    def test_hash_agrees_with_eq(self):
+        """Checks that articles with the same link are one item of a set"""
+        same_link = Article('other_title', LINK, '2021-05-22T15:03:25Z', 'other_source', '---')
+        self.assertEqual(hash(self.article), hash(same_link))
+        self.assertEqual(1, len({self.article, same_link}))
+        self.assertIn(same_link, {self.article: True})
+
+    def test_date_is_parsed_lazily(self):
+        """Checks that the date is parsed once and only when it is used"""
+        with patch('main_reader.dates.parse_date', wraps=lambda value: None) as parse_date:
+            article = Article(TITLE, LINK, DATE, SOURCE, IMAGE)
+            parse_date.assert_not_called()
+            article.date
+            article.date
+            parse_date.assert_called_once_with(DATE)
+
+    def test_date_str_is_cached(self):
+        """Checks that the displayed date is formatted once"""
+        self.assertIs(self.article.date_str("%a, %d %B, %Y"), self.article.to_dict()['Date'])
+        self.assertEqual('20220905', self.article.date_str('%Y%m%d'))
+
+    def test_no_instance_dict(self):
+        """Checks that article keeps its fields in slots"""
+        self.assertFalse(hasattr(self.article, '__dict__'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,65 @@
+""" Test module for the logger of the reader. """
+import glob
+import logging
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from main_reader import colorize_logger
+from main_reader.colorize_logger import ColorizeLogger
+
+
+class TestColorizeLogger(unittest.TestCase):
+    """Test cases to test handlers, lazy formatting and the rotating file"""
+
+    def setUp(self):
+        colorize_logger.shutdown()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'logs.txt')
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.addCleanup(colorize_logger.shutdown)
+
+    def test_handlers_are_installed_once(self):
+        """Checks that creating several loggers adds a single handler to the root logger"""
+        before = len(logging.getLogger().handlers)
+        ColorizeLogger(log_path=self.path)
+        ColorizeLogger(log_path=self.path)
+        self.assertEqual(before + 1, len(logging.getLogger().handlers))
+
+    def test_disabled_messages_are_not_formatted(self):
+        """Checks that messages of disabled levels are neither formatted nor written"""
+        logger = ColorizeLogger(log_path=self.path, is_colorize=True)
+        with patch.object(logger, 'get_message') as get_message:
+            logger.info('%s news received', 10)
+        get_message.assert_not_called()
+        colorize_logger.flush()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_log_is_next_to_the_cache(self):
+        """Checks that the default log file follows the cache path given with --db"""
+        with patch.dict(os.environ, {colorize_logger.LOG_ENV_VARIABLE: ''}):
+            logger = ColorizeLogger(disable=0, cache_path=os.path.join(self.directory.name, 'news.db'))
+            logger.info('Message')
+        colorize_logger.flush()
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_file_is_rotated_by_size(self):
+        """Checks that the log file is rotated when it grows over the limit"""
+        colorize_logger.install_handlers(self.path, max_bytes=1000, backup_count=2)
+        logger = ColorizeLogger(disable=0)
+        for number in range(100):
+            logger.info('Message number %s', number)
+            logger.print('Printed news')
+        colorize_logger.flush()
+        self.assertEqual([self.path, self.path + '.1', self.path + '.2'], sorted(glob.glob(self.path + '*')))
+        self.assertLessEqual(os.path.getsize(self.path), 1000)
+        with open(self.path) as file:
+            content = file.read()
+        self.assertIn('INFO - Message number 99', content)
+        self.assertNotIn('Printed news', content)
+
+
+if __name__ == '__main__':
+    unittest.main()
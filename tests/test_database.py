@@ -0,0 +1,296 @@
+""" Test module for the cache location, connection settings and schema migrations. """
+import os
+import pathlib
+import sqlite3
+import tempfile
+import types
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from main_reader import database
+from main_reader import helper
+from main_reader.article import Article
+
+
+class TestDatabase(unittest.TestCase):
+    """Test cases to test the SQLite cache"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = pathlib.Path(self.temp_dir.name) / 'cache' / 'news.db'
+        self.articles = [Article(f'Title_{i}', f'Link_{i}', f'2022-09-{10 + i}T17:11:56Z', 'Source', '---')
+                         for i in range(5)]
+
+    def test_connect_creates_directory_and_enables_wal(self):
+        """Checks that the cache directory is created and WAL mode is on"""
+        connection = database.connect(self.path)
+        self.addCleanup(connection.close)
+        self.assertTrue(self.path.exists())
+        self.assertEqual('wal', connection.execute('PRAGMA journal_mode').fetchone()[0])
+
+    def test_new_cache_is_incrementally_vacuumed(self):
+        """Checks that a new cache is created with incremental auto_vacuum, so its first compaction is not a VACUUM"""
+        connection = database.connect(self.path)
+        self.addCleanup(connection.close)
+        helper.init_database(connection)
+        self.assertEqual(database.INCREMENTAL_VACUUM, connection.execute('PRAGMA auto_vacuum').fetchone()[0])
+        statements = []
+        connection.set_trace_callback(statements.append)
+        database.compact(connection)
+        connection.set_trace_callback(None)
+        self.assertNotIn('VACUUM', statements)
+
+    def test_default_path_from_environment(self):
+        """Checks that RSS_READER_DB variable overrides the default location"""
+        with patch.dict(os.environ, {database.DB_ENV_VARIABLE: str(self.path)}):
+            self.assertEqual(self.path, database.default_path())
+
+    def test_default_path_in_user_cache(self):
+        """Checks that the default location is inside the user cache directory"""
+        with patch.dict(os.environ, {database.DB_ENV_VARIABLE: '', 'XDG_CACHE_HOME': self.temp_dir.name}), \
+                patch('sys.platform', 'linux'):
+            self.assertEqual(pathlib.Path(self.temp_dir.name) / 'rss_reader' / 'news.db', database.default_path())
+
+    def test_migrate_new_database(self):
+        """Checks that all migrations are applied to a new cache and applying them again changes nothing"""
+        connection = sqlite3.connect(':memory:')
+        database.migrate(connection)
+        database.migrate(connection)
+        self.assertEqual(len(database.MIGRATIONS), database.schema_version(connection))
+        indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        self.assertTrue({'news_local_order', 'news_feed_order', 'news_source'} <= indexes)
+
+    def test_migrate_existing_database(self):
+        """Checks that a cache created by an earlier release is upgraded in place keeping its news"""
+        connection = database.connect(self.path)
+        self.addCleanup(connection.close)
+        connection.execute('CREATE TABLE news (title text, link text UNIQUE, full_date text, date text, '
+                           'source text, image text, url text)')
+        connection.execute("INSERT INTO news VALUES ('T', 'L', '2022-09-18 17:11:56+00:00', '20220918', 'S', "
+                           "'---', 'url')")
+        connection.commit()
+
+        helper.init_database(connection)
+
+        self.assertEqual(len(database.MIGRATIONS), database.schema_version(connection))
+        self.assertEqual(['T'], [article.title for article in helper.get_cashed_news('20220918', connection, 'url')])
+
+    def test_date_lookup_uses_index(self):
+        """Checks that news of a date and url are found by the index instead of a table scan"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        day = {'date_from': 1663459200, 'date_to': 1663545600, 'url': 'url'}
+        plan = connection.execute(f'EXPLAIN QUERY PLAN SELECT title FROM news WHERE feed_id={helper.FEED_ID} and '
+                                  f'{helper.LOCAL_TIME}>=:date_from and {helper.LOCAL_TIME}<:date_to', day).fetchall()
+        self.assertIn('USING INDEX news_feed_order', ' '.join(row[-1] for row in plan))
+        plan = connection.execute(f'EXPLAIN QUERY PLAN SELECT title FROM news WHERE {helper.LOCAL_TIME}>=:date_from '
+                                  f'and {helper.LOCAL_TIME}<:date_to', day).fetchall()
+        self.assertIn('USING INDEX news_local_order', plan[0][-1])
+
+    def test_save_news_in_one_transaction(self):
+        """Checks that news are written by a single executemany and committed"""
+        connection = database.connect(self.path)
+        self.addCleanup(connection.close)
+        helper.init_database(connection)
+        helper.save_news(self.articles, connection, 'url')
+        self.assertFalse(connection.in_transaction)
+
+        reader = database.connect(self.path)
+        self.addCleanup(reader.close)
+        self.assertEqual(5, reader.execute('SELECT count(*) FROM news').fetchone()[0])
+        self.assertEqual(self.articles[:1], list(helper.get_cashed_news('20220910', reader, 'url')))
+
+    def test_query_date_range(self):
+        """Checks that both ends of the range are included and other feeds are skipped"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        helper.save_news(self.articles, connection, 'url')
+        helper.save_news([Article('Other', 'Link_O', '2022-09-12T10:00:00Z', 'S', '---')], connection, 'other')
+        news = helper.query_news(connection, ['url'], '20220911', '20220913', order='asc')
+        self.assertEqual(self.articles[1:4], list(news))
+        self.assertEqual(6, len(list(helper.query_news(connection, ['url', 'other'], '20220901'))))
+
+    def test_query_pushes_limit_down(self):
+        """Checks that limit, offset and order are applied by SQL and rows are read lazily"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        helper.save_news(self.articles, connection, 'url')
+        news = helper.query_news(connection, date_from='20220901', order='desc', limit=2, offset=1)
+        self.assertIsInstance(news, types.GeneratorType)
+        self.assertEqual([self.articles[3], self.articles[2]], list(news))
+
+    def test_query_keyset_pages(self):
+        """Checks that pages after the last link of the previous page cover all news once"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        helper.save_news(self.articles, connection, 'url')
+        pages = []
+        after = None
+        while True:
+            page = list(helper.query_news(connection, date_from='20220901', order='desc', limit=2, after=after))
+            if not page:
+                break
+            pages.append(page)
+            after = page[-1].link
+        self.assertEqual([2, 2, 1], [len(page) for page in pages])
+        self.assertEqual(self.articles[::-1], [article for page in pages for article in page])
+
+    def test_iter_rows_in_batches(self):
+        """Checks that rows are fetched with fetchmany of the given size"""
+        cursor = MagicMock()
+        cursor.fetchmany.side_effect = [[1, 2], [3], []]
+        self.assertEqual([1, 2, 3], list(helper.iter_rows(cursor, size=2)))
+        cursor.fetchmany.assert_called_with(2)
+
+    def test_search_is_ranked(self):
+        """Checks that a match in the title is ranked above a match in the source"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        by_source = Article('Markets close higher', 'Link_S', '2022-09-18T17:11:56Z', 'Turkey Today', '---')
+        by_title = Article('Thousands march in Turkey', 'Link_T', '2022-09-18T17:11:56Z', 'AP', '---')
+        helper.save_news([by_source, by_title] + self.articles, connection, 'url')
+        self.assertEqual([by_title, by_source], helper.search_news('turkey', connection))
+        self.assertEqual([by_title], helper.search_news('turkey', connection, limit=1))
+
+    def test_search_follows_saved_news(self):
+        """Checks that replaced news are searchable by the new title only"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        helper.save_news([Article('Draft headline', 'Link_1', '2022-09-18T17:11:56Z', 'AP', '---')],
+                         connection, 'url')
+        helper.save_news([Article('Final headline', 'Link_1', '2022-09-18T17:11:56Z', 'AP', '---')],
+                         connection, 'url')
+        self.assertEqual([], helper.search_news('draft', connection))
+        self.assertEqual(['Final headline'], [article.title for article in helper.search_news('final', connection)])
+        self.assertEqual(1, connection.execute('SELECT count(*) FROM news_fts').fetchone()[0])
+
+    def test_unchanged_news_are_not_written(self):
+        """Checks that news are inserted, updated in place keeping their rowid, or skipped when unchanged"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        entries = [{'title': f'Title_{i}', 'link': f'Link_{i}', 'published': '2022-09-18T17:11:56Z'} for i in range(3)]
+        self.assertEqual((3, 0, 0), helper.save_news(list(helper.create_articles(entries)), connection, 'url'))
+        rowids = dict(connection.execute('SELECT link, rowid FROM news'))
+
+        entries[1]['title'] = 'Corrected title'
+        entries.append({'title': 'Title_3', 'link': 'Link_3', 'published': '2022-09-19T17:11:56Z'})
+        self.assertEqual((1, 1, 2), helper.save_news(list(helper.create_articles(entries)), connection, 'url'))
+        self.assertEqual(rowids['Link_1'], connection.execute("SELECT rowid FROM news WHERE link='Link_1'").fetchone()[0])
+        self.assertEqual(['Corrected title'], [article.title for article in helper.search_news('corrected', connection)])
+        self.assertEqual('Link_3', helper.get_cashed_feed(connection, 'url')[0].link)
+
+        changes = connection.total_changes
+        self.assertEqual((0, 0, 4), helper.save_news(list(helper.create_articles(entries)), connection, 'url'))
+        self.assertEqual(changes, connection.total_changes)
+
+    def test_seen_links_skip_unchanged_entries(self):
+        """Checks that entries cached with the same fingerprint are skipped before articles are made"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        entries = [{'title': f'Title_{i}', 'link': f'Link_{i}', 'published': '2022-09-18T17:11:56Z'} for i in range(3)]
+        helper.save_news(list(helper.create_articles(entries)), connection, 'url')
+
+        entries[2]['title'] = 'Corrected title'
+        seen = helper.load_seen_links(connection, 'url')
+        with patch('main_reader.helper.Article', wraps=Article) as article:
+            self.assertEqual(['Corrected title'], [item.title for item in helper.create_articles(entries, seen)])
+        self.assertEqual((1, 2), (article.call_count, seen.skipped))
+
+    def test_search_with_invalid_syntax(self):
+        """Checks that a query which is not valid FTS5 syntax is searched word by word"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        helper.save_news(self.articles, connection, 'url')
+        self.assertEqual(self.articles[2:3], helper.search_news('Title_2"', connection))
+
+    def test_migration_indexes_existing_news(self):
+        """Checks that news cached before the search index existed are searchable after the upgrade"""
+        connection = sqlite3.connect(':memory:')
+        for statements in database.MIGRATIONS[:3]:
+            for statement in statements:
+                connection.execute(statement)
+        connection.execute('PRAGMA user_version=3')
+        connection.executemany('INSERT INTO news VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               [(article.title, article.link, str(article.date), article.date.strftime('%Y%m%d'),
+                                 article.source, article.image, 'url') for article in self.articles])
+        connection.commit()
+        helper.init_database(connection)
+        self.assertEqual(self.articles[:1], helper.search_news('Title_0', connection))
+
+    def test_normalized_schema_keeps_local_dates(self):
+        """Checks that news of feeds in other time zones keep their offset and are found by their local day"""
+        connection = database.connect(self.path)
+        self.addCleanup(connection.close)
+        for statements in database.MIGRATIONS[:7]:
+            for statement in statements:
+                connection.execute(statement)
+        connection.execute('PRAGMA user_version=7')
+        connection.execute("INSERT INTO news VALUES ('Late', 'L', '2022-09-18 23:30:00-05:00', '20220918', 'S', "
+                           "'---', 'url', NULL)")
+        connection.commit()
+        rowid = connection.execute("SELECT rowid FROM news WHERE link='L'").fetchone()[0]
+
+        helper.init_database(connection)
+
+        [article] = helper.get_cashed_news('20220918', connection, 'url')
+        self.assertEqual('2022-09-18 23:30:00-05:00', str(article.date))
+        self.assertEqual([], list(helper.get_cashed_news('20220919', connection, 'url')))
+        self.assertEqual([rowid], [row[0] for row in connection.execute("SELECT id FROM news WHERE link='L'")])
+        self.assertEqual(['Late'], [article.title for article in helper.search_news('S', connection)])
+
+    def test_prune_news(self):
+        """Checks that old news, their fingerprints and sources no longer used are deleted"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        old = Article('Old', 'Old link', '2022-01-01T10:00:00Z', 'Old source', '---')
+        helper.save_news([old] + self.articles, connection, 'url')
+        connection.execute('INSERT INTO fingerprints (link, day) VALUES (?, ?)', ('Old link', old.date.toordinal()))
+        connection.commit()
+
+        now = self.articles[-1].date
+        self.assertEqual(1, helper.prune_news(connection, 30, now))
+        self.assertEqual(self.articles[::-1], helper.get_cashed_feed(connection, 'url'))
+        self.assertEqual(['Source'], [row[0] for row in connection.execute('SELECT name FROM sources')])
+        self.assertEqual(0, connection.execute('SELECT count(*) FROM fingerprints').fetchone()[0])
+        self.assertEqual([], helper.search_news('Old', connection))
+
+    def test_compact_shrinks_the_file(self):
+        """Checks that pages freed by pruning are returned to the file system, by a new and an older cache"""
+        articles = [Article(f'Title {i} ' + 'words ' * 50, f'Link_{i}', '2022-01-01T10:00:00Z', 'Source', '---')
+                    for i in range(2000)]
+        for name, new in (('new.db', True), ('old.db', False)):
+            with self.subTest(new=new):
+                path = self.path.with_name(name)
+                if new:
+                    connection = database.connect(path)
+                else:
+                    # Caches of earlier releases switched to WAL before choosing auto_vacuum
+                    connection = sqlite3.connect(path)
+                    connection.execute('PRAGMA journal_mode=WAL')
+                self.addCleanup(connection.close)
+                helper.init_database(connection)
+                helper.save_news(articles, connection, 'url')
+                connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                size = path.stat().st_size
+
+                helper.prune_news(connection, 1)
+                database.compact(connection)
+
+                self.assertEqual(database.INCREMENTAL_VACUUM,
+                                 connection.execute('PRAGMA auto_vacuum').fetchone()[0])
+                self.assertLess(path.stat().st_size, size / 4)
+
+    def test_rebuild_search_index(self):
+        """Checks that the index is restored after it went out of sync"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        helper.save_news(self.articles, connection, 'url')
+        connection.execute('DELETE FROM news_fts')
+        helper.rebuild_search_index(connection)
+        self.assertEqual(self.articles[4:], helper.search_news('Title_4', connection))
+
+
+if __name__ == '__main__':
+    unittest.main()
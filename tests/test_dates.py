@@ -0,0 +1,82 @@
+""" Test module for fast parsing of article dates. """
+import datetime
+import time
+import unittest
+from unittest.mock import patch
+
+from main_reader import dates
+
+UTC = datetime.timezone.utc
+
+
+class TestDates(unittest.TestCase):
+    """Test cases to test strict parsers and the dateparser fallback"""
+
+    def setUp(self):
+        dates.parse_fallback.cache_clear()
+
+    def test_iso_date(self):
+        """Checks that Atom dates are parsed as aware datetime"""
+        self.assertEqual(datetime.datetime(2022, 9, 18, 17, 11, 56, tzinfo=UTC),
+                         dates.parse_date('2022-09-18T17:11:56Z'))
+
+    def test_cached_date(self):
+        """Checks that the str() of a datetime written to the cache is parsed back to the same value"""
+        date = datetime.datetime(2022, 9, 18, 17, 11, 56, tzinfo=datetime.timezone(datetime.timedelta(hours=-4)))
+        self.assertEqual(date.utcoffset(), dates.parse_date(str(date)).utcoffset())
+        self.assertEqual(date, dates.parse_date(str(date)))
+
+    def test_rfc822_date(self):
+        """Checks that RSS dates keep their UTC offset"""
+        date = dates.parse_date('Sun, 18 Sep 2022 17:11:56 -0400')
+        self.assertEqual(datetime.datetime(2022, 9, 18, 21, 11, 56, tzinfo=UTC), date)
+        self.assertEqual(datetime.timedelta(hours=-4), date.utcoffset())
+
+    def test_rfc822_zone_names(self):
+        """Checks that zones unknown to email.utils are parsed by dateparser instead of being taken as UTC"""
+        parsed = time.struct_time((2022, 9, 18, 23, 30, 0, 6, 261, 0))
+        for zone, hours in (('CEST', 2), ('AEST', 10), ('EST', -5), ('GMT', 0)):
+            with self.subTest(zone=zone):
+                value = f'Sun, 18 Sep 2022 23:30:00 {zone}'
+                self.assertEqual(datetime.timedelta(hours=hours), dates.parse_date(value, parsed).utcoffset())
+        for zone in ('BST', 'XYZ'):
+            with self.subTest(zone=zone):
+                value = f'Sun, 18 Sep 2022 23:30:00 {zone}'
+                self.assertIsNone(dates.parse_strict(value))
+                self.assertTrue(dates.has_unknown_zone(value))
+                date = dates.parse_date(value, parsed)
+                self.assertTrue(date is None or date.utcoffset() is not None)
+
+    def test_loose_rfc822_date(self):
+        """Checks that a date which only looks like RFC 822 is not parsed by the strict parser"""
+        self.assertIsNone(dates.parse_strict('Sunday, September 18, 2022 5:11 PM'))
+        self.assertEqual(datetime.datetime(2022, 9, 18, 17, 11), dates.parse_date('18 September 2022, 05:11 PM'))
+
+    def test_struct_time(self):
+        """Checks that feedparser's struct is used if the string is not in a strict format"""
+        parsed = time.struct_time((2022, 9, 18, 17, 11, 56, 6, 261, 0))
+        with patch('dateparser.parse') as dateparser:
+            self.assertEqual(datetime.datetime(2022, 9, 18, 17, 11, 56, tzinfo=UTC),
+                             dates.parse_date('18th of September 2022, 5:11 pm', parsed))
+            dateparser.assert_not_called()
+
+    def test_datetime_is_passed_through(self):
+        """Checks that an already parsed date is returned as is"""
+        date = datetime.datetime(2022, 9, 18, 17, 11, 56)
+        self.assertIs(date, dates.parse_date(date))
+
+    def test_fallback_is_memoized(self):
+        """Checks that dateparser is called once for a repeated string of unusual format"""
+        with patch('dateparser.parse') as dateparser:
+            dateparser.return_value = datetime.datetime(2022, 9, 18)
+            for _ in range(3):
+                self.assertEqual(datetime.datetime(2022, 9, 18), dates.parse_date('yesterday'))
+            dateparser.assert_called_once_with('yesterday')
+
+    def test_invalid_date(self):
+        """Checks that None is returned for a value which is not a date"""
+        self.assertIsNone(dates.parse_date('---'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+""" Test module for cross-feed deduplication. """
+import sqlite3
+import unittest
+
+from main_reader import dedup
+from main_reader import helper
+from main_reader.article import Article
+
+TITLE = 'Thousands march in Turkey to demand ban on LGBTQ groups'
+LINK = 'https://news.yahoo.com/anti-lgbtq-protest-turkey-backs-171156220.html'
+DATE = '2022-09-18T17:11:56Z'
+
+
+class TestDedup(unittest.TestCase):
+    """Test cases to test url canonicalization, hashes and the deduplicator"""
+
+    def setUp(self):
+        self.connection = sqlite3.connect(':memory:')
+        helper.init_database(self.connection)
+        self.article = Article(TITLE, LINK, DATE, 'Associated Press', '---')
+
+    def test_canonicalize_url(self):
+        """Checks that scheme, host prefixes, AMP variants, tracking parameters and fragments are dropped"""
+        expected = 'https://example.com/news/story-1?id=3'
+        for url in ('http://www.Example.com/news/story-1/?utm_source=rss&id=3&fbclid=abc#comments',
+                    'https://amp.example.com/news/story-1/amp?id=3',
+                    'https://m.example.com:443/news/story-1.amp?id=3'):
+            self.assertEqual(expected, dedup.canonicalize_url(url))
+
+    def test_canonicalize_keeps_meaningful_query(self):
+        """Checks that parameters which select the content are kept in sorted order"""
+        self.assertEqual('https://example.com/article?id=2&page=1',
+                         dedup.canonicalize_url('https://example.com/article?page=1&id=2'))
+
+    def test_simhash_distance(self):
+        """Checks that a slightly edited title is close to the original and another story is far"""
+        original = dedup.simhash(TITLE)
+        self.assertEqual(original, dedup.simhash(TITLE.upper() + '!'))
+        self.assertLessEqual(dedup.distance(original, dedup.simhash(TITLE.replace(' to ', ', '))),
+                             dedup.MAX_DISTANCE)
+        self.assertGreater(dedup.distance(original, dedup.simhash('Stocks fall as Fed raises interest rates')),
+                           dedup.MAX_DISTANCE)
+
+    def test_close_hashes_share_a_band(self):
+        """Checks the banding guarantee the similarity index relies on"""
+        value = dedup.simhash(TITLE)
+        changed = value ^ sum(1 << bit for bit in range(0, dedup.MAX_DISTANCE * dedup.BAND_BITS, dedup.BAND_BITS))
+        self.assertEqual(dedup.MAX_DISTANCE, dedup.distance(value, changed))
+        self.assertTrue(set(dedup.band_keys(value)) & set(dedup.band_keys(changed)))
+
+    def test_signed_round_trip(self):
+        """Checks that hashes with the highest bit set survive SQLite integers"""
+        value = (1 << 64) - 5
+        self.assertEqual(value, dedup.to_unsigned(dedup.to_signed(value)))
+
+    def test_duplicates_across_feeds(self):
+        """Checks that the same story under a tracking url or an edited title is dropped"""
+        deduplicator = dedup.Deduplicator(self.connection)
+        self.assertEqual([self.article], deduplicator.filter([self.article]))
+
+        amp_copy = Article(TITLE, LINK.replace('https://', 'http://') + '?utm_source=feed', DATE, 'Yahoo', '---')
+        edited = Article(TITLE.replace(' to ', ', '), 'https://other.example.com/turkey-march', DATE, 'AP', '---')
+        other = Article('Stocks fall as Fed raises interest rates', 'https://other.example.com/stocks', DATE,
+                        'AP', '---')
+        self.assertEqual([other], deduplicator.filter([amp_copy, edited, other]))
+
+    def test_dedup_is_incremental(self):
+        """Checks that fingerprints saved by one run are used by the next one"""
+        dedup.Deduplicator(self.connection).filter([self.article])
+        copy = Article(TITLE, 'https://mirror.example.com/turkey', DATE, 'Mirror', '---')
+        self.assertEqual([], dedup.Deduplicator(self.connection).filter([copy]))
+
+    def test_same_link_is_not_a_duplicate(self):
+        """Checks that a story fetched again under its own link is kept"""
+        deduplicator = dedup.Deduplicator(self.connection)
+        deduplicator.filter([self.article])
+        self.assertEqual([self.article], deduplicator.filter([self.article]))
+
+    def test_same_title_on_distant_days(self):
+        """Checks that recurring titles published on distant days are not duplicates"""
+        deduplicator = dedup.Deduplicator(self.connection)
+        monday = Article('Morning briefing', 'https://example.com/briefing-1', '2022-09-12T06:00:00Z', 'S', '---')
+        friday = Article('Morning briefing', 'https://example.com/briefing-2', '2022-09-16T06:00:00Z', 'S', '---')
+        self.assertEqual([monday, friday], deduplicator.filter([monday, friday]))
+
+    def test_near_miss_titles_are_kept(self):
+        """Checks that titles which differ in a word or in word order are distinct stories"""
+        pairs = [('Man arrested in Paris', 'Woman arrested in Paris'),
+                 ('Lakers beat Celtics 110-102', 'Celtics beat Lakers 110-102'),
+                 ('Man arrested after stabbing in central Paris on Sunday',
+                  'Woman arrested after stabbing in central Paris on Sunday'),
+                 ('Lakers beat Celtics in overtime thriller 110-102',
+                  'Celtics beat Lakers in overtime thriller 110-102')]
+        for first, second in pairs:
+            with self.subTest(first=first):
+                articles = [Article(first, 'https://a.example/1', DATE, 'A', '---'),
+                            Article(second, 'https://b.example/2', DATE, 'B', '---')]
+                self.assertEqual(articles, dedup.Deduplicator(self.connection).filter(articles))
+                self.connection.execute('DELETE FROM fingerprints')
+
+    def test_same_title_without_image(self):
+        """Checks that a recurring title is a duplicate only with the same image"""
+        deduplicator = dedup.Deduplicator(self.connection)
+        today = Article('Morning briefing', 'https://example.com/briefing-1', '2022-09-12T06:00:00Z', 'S', '---')
+        tomorrow = Article('Morning briefing', 'https://example.com/briefing-2', '2022-09-13T06:00:00Z', 'S', '---')
+        self.assertEqual([today, tomorrow], deduplicator.filter([today, tomorrow]))
+        copy = Article('Morning briefing', 'https://mirror.example.com/briefing', '2022-09-13T06:00:00Z', 'M',
+                       'https://example.com/briefing.jpg')
+        image = Article('Morning briefing', 'https://other.example.com/briefing', '2022-09-13T06:00:00Z', 'O',
+                        'https://example.com/briefing.jpg')
+        self.assertEqual([copy], deduplicator.filter([copy, image]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+""" Test module for reading feed lists and concurrent fetching of several feeds. """
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from main_reader import errors
+from main_reader import feeds
+from main_reader import helper
+from main_reader.article import Article
+
+OPML = '''<?xml version="1.0" encoding="UTF-8"?>
+<opml version="1.0">
+  <head><title>Subscriptions</title></head>
+  <body>
+    <outline text="News">
+      <outline text="Yahoo" type="rss" xmlUrl="https://news.yahoo.com/rss/"/>
+      <outline text="BBC" type="rss" xmlUrl="http://feeds.bbci.co.uk/news/rss.xml"/>
+    </outline>
+  </body>
+</opml>
+'''
+
+
+class TestFeeds(unittest.TestCase):
+    """Test cases to test feed list reading and fetching"""
+
+    def setUp(self):
+        self.article_a = Article('Title_A', 'Link_A', '2022-09-18T17:11:56Z', 'Source_A', 'Image_A')
+        self.article_b = Article('Title_B', 'Link_B', '2021-05-22T15:03:25Z', 'Source_B', 'Image_B')
+        self.feed_a = {'entries': [{'title': 'Title_A', 'link': 'Link_A', 'published': '2022-09-18T17:11:56Z'}],
+                       'etag': '"a1"', 'modified': 'Sun, 18 Sep 2022 17:11:56 GMT', 'status': 200}
+        self.feed_b = {'entries': [{'title': 'Title_B', 'link': 'Link_B', 'published': '2021-05-22T15:03:25Z'}]}
+
+    def write_temp(self, content, suffix):
+        """Writes content to a temporary file removed after the test"""
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_read_opml(self):
+        """Checks that feed urls are extracted from nested OPML outlines"""
+        path = self.write_temp(OPML, '.opml')
+        self.assertEqual(['https://news.yahoo.com/rss/', 'http://feeds.bbci.co.uk/news/rss.xml'],
+                         feeds.read_feed_list(path))
+
+    def test_read_plain_text(self):
+        """Checks that blank lines and comments of a plain-text feed list are skipped"""
+        path = self.write_temp('# my feeds\nhttps://a.example/rss\n\n  https://b.example/rss  \n', '.txt')
+        self.assertEqual(['https://a.example/rss', 'https://b.example/rss'], feeds.read_feed_list(path))
+
+    def test_invalid_opml(self):
+        """Tests read_feed_list method if the OPML file is broken"""
+        path = self.write_temp('<opml><body>', '.opml')
+        with self.assertRaises(errors.InvalidArgumentError) as cl:
+            feeds.read_feed_list(path)
+        self.assertEqual('Please, check the feed list is a valid OPML file', cl.exception.args[0])
+
+    def test_collect_sources(self):
+        """Checks that positional sources go first and repeated urls are dropped"""
+        path = self.write_temp('https://b.example/rss\nhttps://a.example/rss\n', '.txt')
+        self.assertEqual(['https://a.example/rss', 'https://b.example/rss'],
+                         feeds.collect_sources(['https://a.example/rss'], path))
+
+    @patch('main_reader.helper.parse_feed')
+    def test_failing_feed_does_not_stop_others(self, parse_feed):
+        """Checks that an unavailable feed is reported in its result while other feeds are fetched"""
+
+        def fake_parse_feed(url, etag, modified):
+            if url == 'bad':
+                raise errors.SourceUnavailableError("Source isn't available")
+            return {'a': self.feed_a, 'b': self.feed_b}[url]
+
+        parse_feed.side_effect = fake_parse_feed
+        results = {result.url: result for result in feeds.fetch_feeds(['a', 'bad', 'b'], workers=2)}
+
+        self.assertEqual([self.article_a], results['a'].articles)
+        self.assertEqual([self.article_b], results['b'].articles)
+        self.assertFalse(results['bad'].ok)
+        self.assertEqual("Source isn't available", results['bad'].error)
+
+    @patch('main_reader.helper.parse_feed')
+    def test_slow_feed_does_not_block_others(self, parse_feed):
+        """Checks that results of fast feeds are yielded before a slow feed finishes"""
+        release = threading.Event()
+
+        def fake_parse_feed(url, etag, modified):
+            if url == 'slow':
+                release.wait(5)
+            return self.feed_a
+
+        parse_feed.side_effect = fake_parse_feed
+        results = feeds.fetch_feeds(['slow', 'fast'], workers=2)
+        self.assertEqual('fast', next(results).url)
+        release.set()
+        self.assertEqual('slow', next(results).url)
+
+    @patch('main_reader.helper.parse_feed')
+    def test_validators_are_sent_and_returned(self, parse_feed):
+        """Checks that saved validators are sent and the new ones are kept in the result"""
+        parse_feed.return_value = self.feed_a
+        result = next(feeds.fetch_feeds(['a'], validators={'a': ('"a0"', 'Sat, 17 Sep 2022 10:00:00 GMT')}))
+
+        parse_feed.assert_called_once_with('a', '"a0"', 'Sat, 17 Sep 2022 10:00:00 GMT')
+        self.assertEqual('"a1"', result.etag)
+        self.assertEqual('Sun, 18 Sep 2022 17:11:56 GMT', result.modified)
+        self.assertFalse(result.not_modified)
+
+    @patch('main_reader.helper.create_articles')
+    @patch('main_reader.helper.parse_feed')
+    def test_not_modified_feed(self, parse_feed, create_articles):
+        """Checks that articles are not created if the server answers 304 Not Modified"""
+        parse_feed.return_value = {'entries': [], 'status': 304}
+        result = feeds.fetch_feed('a', '"a1"', 'Sun, 18 Sep 2022 17:11:56 GMT')
+
+        self.assertTrue(result.ok)
+        self.assertTrue(result.not_modified)
+        self.assertEqual('"a1"', result.etag)
+        create_articles.assert_not_called()
+
+    def test_validators_round_trip(self):
+        """Checks that validators are saved in the cache and read back for the feed"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        self.assertEqual((None, None), helper.get_validators(connection, 'a'))
+        helper.save_validators(connection, 'a', '"a1"', 'Sun, 18 Sep 2022 17:11:56 GMT')
+        self.assertEqual(('"a1"', 'Sun, 18 Sep 2022 17:11:56 GMT'), helper.get_validators(connection, 'a'))
+
+    def test_cashed_feed(self):
+        """Checks that a not modified feed is served from the cache, newest news first"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        helper.save_news([self.article_b, self.article_a], connection, 'a')
+        helper.save_news([Article('Title_C', 'Link_C', '2022-09-19T10:00:00Z', '---', '---')], connection, 'c')
+        self.assertEqual([self.article_a, self.article_b], helper.get_cashed_feed(connection, 'a'))
+
+    @patch('main_reader.helper.parse_feed')
+    def test_not_modified_feed_serves_its_last_document(self, parse_feed):
+        """Checks that a not modified feed returns news of its last document, not all news ever cached of it"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        entries = [{'title': f'Title_{number}', 'link': f'Link_{number}', 'published': f'2022-09-1{number}T10:00:00Z'}
+                   for number in range(6)]
+        for document in (entries[:3], entries[3:]):
+            parse_feed.return_value = {'entries': document, 'etag': '"a1"', 'status': 200}
+            feeds.store_result(feeds.fetch_feed('a'), connection, MagicMock())
+        parse_feed.return_value = {'entries': [], 'status': 304}
+        articles, new = feeds.store_result(feeds.fetch_feed('a', '"a1"'), connection, MagicMock())
+        self.assertEqual((['Link_5', 'Link_4', 'Link_3'], []), ([article.link for article in articles], new))
+        self.assertEqual(6, len(helper.get_cashed_feed(connection, 'a')))
+
+    @patch('main_reader.helper.parse_feed')
+    def test_unchanged_entries_are_skipped(self, parse_feed):
+        """Checks that a feed polled again makes articles only of changed entries and counts the rest"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        parse_feed.return_value = {'entries': self.feed_a['entries'] + self.feed_b['entries']}
+        seen = helper.load_seen_links(connection, 'a')
+        result = feeds.fetch_feed('a', seen=seen)
+        feeds.store_result(result, connection, MagicMock(), seen=seen)
+        self.assertEqual((2, 0, 0), (result.inserted, result.updated, result.unchanged))
+
+        parse_feed.return_value = {'entries': [dict(self.feed_a['entries'][0], title='Title_A2')] +
+                                   self.feed_b['entries']}
+        result = feeds.fetch_feed('a', seen=seen)
+        articles, new = feeds.store_result(result, connection, MagicMock(), seen=seen)
+        self.assertEqual((['Title_A2'], []), ([article.title for article in articles], new))
+        self.assertEqual((0, 1, 1), (result.inserted, result.updated, result.unchanged))
+
+        result = feeds.fetch_feed('a', seen=seen)
+        self.assertTrue(result.ok)
+        self.assertEqual(([], 2), (result.articles, result.skipped))
+
+    def test_no_urls(self):
+        """Checks that nothing is fetched for an empty list of urls"""
+        self.assertEqual([], list(feeds.fetch_feeds([])))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,8 @@
 """ Main test module for basic reading news from external resources and cache. """
 import io
+import json
+import shutil
+import tempfile
 import unittest
 from contextlib import redirect_stdout
 from unittest.mock import MagicMock
@@ -8,6 +11,7 @@ from urllib.error import URLError
 import os
 
 from main_reader.article import Article
+from main_reader import errors
 from main_reader import helper
 
 
@@ -78,24 +82,43 @@ class TestHelper(unittest.TestCase):
 
     def test_create_articles(self):
         """Checks that processing the entries creates an object of the Article class"""
-        self.actual = helper.create_articles(self.entries)[0]
+        self.actual = list(helper.create_articles(self.entries))[0]
         self.assertEqual(self.article_a, self.actual)
 
     def test_empty_news(self):
         """Checks that the program creates empty list after receiving an empty input"""
-        self.assertEqual([], helper.create_articles([]))
+        self.assertEqual([], list(helper.create_articles([])))
 
     def test_make_json(self):
         """Checks that news is converted to json format correctly"""
         self.assertEqual(self.json, helper.make_json(self.article_a))
 
+    def test_write_ndjson(self):
+        """Checks that every article is written as one compact JSON line"""
+        with io.StringIO() as stream:
+            helper.write_news([self.article_a, self.article_b], 'ndjson', stream)
+            lines = stream.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual(json.loads(self.json), json.loads(lines[0]))
+        self.assertEqual('Title_B', json.loads(lines[1])['Title'])
+        self.assertNotIn('": ', lines[1])
+
+    def test_write_json_array(self):
+        """Checks that articles are written as a single valid JSON array"""
+        with io.StringIO() as stream:
+            helper.write_news([self.article_a, self.article_b], 'json-array', stream)
+            self.assertEqual([json.loads(self.json), self.article_b.to_dict()], json.loads(stream.getvalue()))
+        with io.StringIO() as stream:
+            helper.write_news([], 'json-array', stream)
+            self.assertEqual('[]\n', stream.getvalue())
+
     def test_check_limit(self):
         """Tests check_limit method with valid values (positive numbers)"""
         self.assertEqual(2, helper.check_limit('2'))
 
     def test_check_limit_value_error(self):
         """Tests check_limit method with invalid values (letters)"""
-        with self.assertRaises(SystemExit) as cl:
+        with self.assertRaises(errors.InvalidArgumentError) as cl:
             helper.check_limit('one')
 
         exc = cl.exception
@@ -103,7 +126,7 @@ class TestHelper(unittest.TestCase):
 
     def test_check_limit_negative(self):
         """Tests check_limit method with invalid values (negative numbers)"""
-        with self.assertRaises(SystemExit) as cl:
+        with self.assertRaises(errors.InvalidArgumentError) as cl:
             helper.check_limit('-1')
 
         exc = cl.exception
@@ -111,7 +134,7 @@ class TestHelper(unittest.TestCase):
 
     def test_check_limit_zero(self):
         """Tests check_limit method with invalid values (zero)"""
-        with self.assertRaises(SystemExit) as cl:
+        with self.assertRaises(errors.InvalidArgumentError) as cl:
             helper.check_limit('0')
 
         exc = cl.exception
@@ -121,7 +144,7 @@ class TestHelper(unittest.TestCase):
     def test_bad_link(self, mocked_object):
         """Tests get_news method if url returns empty news list"""
         mocked_object.return_value = {'entries': []}
-        with self.assertRaises(SystemExit) as cl:
+        with self.assertRaises(errors.InvalidFeedError) as cl:
             helper.get_news(self.url)
 
         exc = cl.exception
@@ -131,7 +154,7 @@ class TestHelper(unittest.TestCase):
     def test_invalid_url(self, mocked_object):
         """Tests get_news method if url is not available"""
         mocked_object.side_effect = MagicMock(side_effect=URLError('foo'))
-        with self.assertRaises(SystemExit) as cl:
+        with self.assertRaises(errors.SourceUnavailableError) as cl:
             helper.get_news(self.url)
 
         exc = cl.exception
@@ -150,25 +173,28 @@ class TestHelper(unittest.TestCase):
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
         mock_connection.cursor.return_value = mock_cursor
+        mock_cursor.fetchmany.return_value = []
         # mock_logger = MagicMock()
         date = '20220919'
-        helper.get_cashed_news(date, mock_connection, self.url)
+        list(helper.get_cashed_news(date, mock_connection, self.url))
         # helper.get_cashed_news(date, mock_connection, self.url, mock_logger)
-        self.assertEqual('SELECT title, link, full_date, source, image, url FROM news WHERE date=:date and url=:url',
+        self.assertEqual(f'SELECT {helper.NEWS_COLUMNS} FROM news WHERE published + utc_offset>=:date_from and '
+                         f'published + utc_offset<:date_to and feed_id=(SELECT id FROM feeds WHERE url=:url)',
                          mock_cursor.execute.call_args.args[0])
-        self.assertEqual(date, mock_cursor.execute.call_args.args[1]['date'])
-        self.assertEqual(self.url, mock_cursor.execute.call_args.args[1]['url'])
+        self.assertEqual({'date_from': 1663545600, 'date_to': 1663632000, 'url': self.url},
+                         mock_cursor.execute.call_args.args[1])
 
     def test_execute_news_without_url(self):
         """Checks the get_cashed_news method will execute the required sql query if only date specified"""
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
         mock_connection.cursor.return_value = mock_cursor
+        mock_cursor.fetchmany.return_value = []
         date = '20220919'
-        helper.get_cashed_news(date, mock_connection, None)
-        self.assertEqual('SELECT title, link, full_date, source, image, url FROM news WHERE date=:date',
-                         mock_cursor.execute.call_args.args[0])
-        self.assertEqual(date, mock_cursor.execute.call_args.args[1]['date'])
+        list(helper.get_cashed_news(date, mock_connection, None))
+        self.assertEqual(f'SELECT {helper.NEWS_COLUMNS} FROM news WHERE published + utc_offset>=:date_from and '
+                         f'published + utc_offset<:date_to', mock_cursor.execute.call_args.args[0])
+        self.assertEqual({'date_from': 1663545600, 'date_to': 1663632000}, mock_cursor.execute.call_args.args[1])
 
     def test_valid_path_to_directory(self):
         """Checks that the specified path exists"""
@@ -201,20 +227,58 @@ class TestHelper(unittest.TestCase):
             f.close()
         os.remove(html.name)
 
-    @patch('main_reader.helper.save_news_html')
+    def test_render_article_without_image(self):
+        """Checks that special characters are escaped and the missing image is marked"""
+        article = Article('A & <B> "C"', 'http://a?b=1&c=2', '2021-05-22T15:03:25Z', 'Source', '---')
+        chunk = helper.render_article_html(article)
+        self.assertIn('<h1>A &amp; &lt;B&gt; &quot;C&quot;</h1>', chunk)
+        self.assertIn('<a href="http://a?b=1&amp;c=2">', chunk)
+        self.assertTrue(chunk.endswith('\n  <p>\n    <b>No images</b>\n  </p>'))
+
+    def test_save_news_in_html_pages(self):
+        """Checks that news are split into pages and the index links to every page"""
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        news = [self.article_a, self.article_b, self.article_a]
+        index = helper.save_news_html(iter(news), path, MagicMock(return_value=None), page_size=2)
+
+        with open(os.path.join(path, 'news_1.html'), encoding='utf-8') as page:
+            self.assertEqual(2, page.read().count('<h1>'))
+        with open(os.path.join(path, 'news_2.html'), encoding='utf-8') as page:
+            self.assertEqual(self.html, page.read())
+        with open(index.name, encoding='utf-8') as file:
+            content = file.read()
+        self.assertIn('<a href="news_1.html">Page 1: news 1-2</a>', content)
+        self.assertIn('<a href="news_2.html">Page 2: news 3-3</a>', content)
+        self.assertFalse(os.path.exists(os.path.join(path, 'news_3.html')))
+
     @patch('xhtml2pdf.pisa.CreatePDF')
-    def test_save_news_in_pdf(self, pisa, html_saver):
-        """Checks that the save_news_pdf method is converting the passed object to pdf-format"""
-        pisa.return_value = ''
-        path = os.path.abspath(os.curdir)
+    def test_save_news_in_pdf(self, pisa):
+        """Checks that the save_news_pdf method renders the news in memory without a temporary html-file"""
+        pisa.side_effect = lambda src, dest, path=None: dest.write(b'%PDF-test')
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
         mock_logger = MagicMock(return_value=None)
-        html_file = os.path.join(path, 'test.html')
-        with open(html_file, 'x', encoding='utf-8') as html:
-            html.write(self.html)
-        html_saver.return_value = html
-        pdf = helper.save_news_pdf(self.article_a, path, mock_logger)
-        self.assertTrue(os.path.join(path, 'news.pdf'))
-        os.remove(pdf.name)
+        pdf = helper.save_news_pdf([self.article_a], path, mock_logger)
+
+        self.assertEqual(self.html, pisa.call_args.kwargs['src'])
+        self.assertEqual(['news.pdf'], os.listdir(path))
+        with open(pdf.name, 'rb') as file:
+            self.assertEqual(b'%PDF-test', file.read())
+
+    def test_save_news_in_pdf_chunks(self):
+        """Checks that chunks rendered in a process pool are concatenated in the order of news"""
+        from pypdf import PdfReader
+
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        news = [Article(f'Title_{i}', f'Link_{i}', '2021-05-22T15:03:25Z', 'Source', '---') for i in range(3)]
+        pdf = helper.save_news_pdf(news, path, MagicMock(return_value=None), workers=2, chunk_size=1)
+
+        pages = PdfReader(pdf.name).pages
+        self.assertEqual(3, len(pages))
+        for number, page in enumerate(pages):
+            self.assertIn(f'Title_{number}', page.extract_text())
 
     def test_check_date(self):
         """Tests check_date method with valid values (date in YYYYMMDD format)"""
@@ -223,7 +287,7 @@ class TestHelper(unittest.TestCase):
     def test_check_invalid_format_date(self):
         """Tests check_date method with invalid values"""
         date = '55555555'
-        with self.assertRaises(SystemExit) as cl:
+        with self.assertRaises(errors.InvalidArgumentError) as cl:
             helper.check_date(date)
 
         exc = cl.exception
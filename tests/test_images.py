@@ -0,0 +1,101 @@
+""" Test module for the local image cache. """
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from PIL import Image
+
+from main_reader import helper
+from main_reader import images
+from main_reader.article import Article
+
+DATE = '2022-09-18T17:11:56Z'
+
+
+def make_png(width, height, color='red'):
+    """Encodes a plain image"""
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(output, format='PNG')
+    return output.getvalue()
+
+
+class TestImages(unittest.TestCase):
+    """Test cases to test downloading, content addressing, eviction and exports with cached images"""
+
+    def setUp(self):
+        self.connection = sqlite3.connect(':memory:')
+        helper.init_database(self.connection)
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = images.ImageCache(self.connection, self.directory.name)
+        self.remote = {'https://example.com/a.png': make_png(10, 10),
+                       'https://mirror.example.com/a.png': make_png(10, 10),
+                       'https://example.com/b.png': make_png(20, 10, 'blue')}
+
+    def tearDown(self):
+        self.connection.close()
+        self.directory.cleanup()
+
+    def download(self, url, timeout=images.TIMEOUT):
+        return self.remote.get(url)
+
+    def test_sniff_extension(self):
+        """Checks that the extension follows the content of the image"""
+        self.assertEqual('.png', images.sniff_extension(make_png(1, 1)))
+        self.assertEqual('.jpg', images.sniff_extension(b'\xff\xd8\xff\xe0'))
+        self.assertEqual('.img', images.sniff_extension(b'<html>'))
+
+    def test_same_content_is_stored_once(self):
+        """Checks that equal images under different urls share one file and a second fetch hits the cache"""
+        with patch('main_reader.images.download', side_effect=self.download) as download:
+            paths = self.cache.fetch(list(self.remote) + ['https://example.com/missing.png'])
+            self.assertEqual(4, download.call_count)
+            self.assertEqual(paths['https://example.com/a.png'], paths['https://mirror.example.com/a.png'])
+            self.assertNotIn('https://example.com/missing.png', paths)
+            self.assertEqual(paths, self.cache.fetch(list(self.remote)))
+            self.assertEqual(4, download.call_count)
+        self.assertTrue(all(os.path.exists(path) for path in paths.values()))
+
+    def test_least_recently_used_are_evicted(self):
+        """Checks that the oldest image is removed when the cache exceeds its size"""
+        self.cache.max_bytes = len(self.remote['https://example.com/b.png']) + 1
+        with patch('main_reader.images.download', side_effect=self.download):
+            old = self.cache.fetch(['https://example.com/a.png'])['https://example.com/a.png']
+            new = self.cache.fetch(['https://example.com/b.png'])['https://example.com/b.png']
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+        self.assertEqual({}, self.cache.lookup(['https://example.com/a.png']))
+
+    def test_downscale(self):
+        """Checks that wide images are shrunk to the thumbnail width and narrow ones are kept"""
+        small = make_png(100, 50)
+        self.assertEqual(small, images.downscale(small))
+        with Image.open(io.BytesIO(images.downscale(make_png(1440, 720)))) as image:
+            self.assertEqual((images.THUMBNAIL_WIDTH, 180), image.size)
+
+    def test_exports_reference_local_files(self):
+        """Checks that the HTML export points to the cached file and keeps remote urls of missing images"""
+        cached = Article('Cached', 'https://example.com/1', DATE, 'S', 'https://example.com/a.png')
+        missing = Article('Missing', 'https://example.com/2', DATE, 'S', 'https://example.com/missing.png')
+        with patch('main_reader.images.download', side_effect=self.download):
+            paths = self.cache.localize([cached, missing])
+        html = helper.render_article_html(cached, paths) + helper.render_article_html(missing, paths)
+        self.assertIn('src="file://' + os.path.realpath(paths['https://example.com/a.png']) + '"', html)
+        self.assertIn('src="https://example.com/missing.png"', html)
+
+    def test_pdf_reads_cached_files(self):
+        """Checks that the PDF export embeds the cached image without downloading it"""
+        article = Article('Cached', 'https://example.com/1', DATE, 'S', 'https://example.com/a.png')
+        with patch('main_reader.images.download', side_effect=self.download):
+            paths = self.cache.localize([article])
+        with tempfile.TemporaryDirectory() as path, patch('urllib.request.urlopen') as urlopen:
+            pdf = helper.save_news_pdf([article], path, MagicMock(), images=paths)
+            with open(pdf.name, 'rb') as file:
+                self.assertIn(b'/Image', file.read())
+        urlopen.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
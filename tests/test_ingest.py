@@ -0,0 +1,115 @@
+""" Test module for bulk ingestion with worker processes. """
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from main_reader import archive
+from main_reader import dedup
+from main_reader import helper
+from main_reader import ingest
+
+RSS = '''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>News</title>{items}</channel></rss>'''
+ITEM = '<item><title>{title}</title><link>{link}</link><pubDate>Sun, 18 Sep 2022 17:11:56 GMT</pubDate></item>'
+
+
+class TestIngest(unittest.TestCase):
+    """Test cases to test parsing in worker processes and batched writes"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.connection = sqlite3.connect(':memory:')
+        helper.init_database(self.connection)
+
+    def write_feed(self, name, items):
+        """Writes an RSS feed with (title, link) items, returns its path"""
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(RSS.format(items=''.join(ITEM.format(title=title, link=link) for title, link in items)))
+        return path
+
+    def test_parse_payload(self):
+        """Checks that a worker returns rows of the news table and fingerprints of every article"""
+        data = RSS.format(items=ITEM.format(title='First', link='https://example.com/1')).encode('utf-8')
+        parsed = ingest.parse_payload('feed', data, fingerprints=True)
+        self.assertEqual([('First', 'https://example.com/1', 1663521116, 0, '---', '---', 'feed')],
+                         [row[:7] for row in parsed.rows])
+        self.assertEqual('https://example.com/1', parsed.fingerprints[0]['canonical_url'])
+        self.assertIsNone(parsed.error)
+        seen = helper.SeenLinks({'https://example.com/1': parsed.rows[0][7]})
+        self.assertEqual(([], ['https://example.com/1']), (ingest.parse_payload('feed', data, seen=seen).rows,
+                                                           ingest.parse_payload('feed', data, seen=seen).links))
+
+    def test_malformed_payload_falls_back_to_feedparser(self):
+        """Checks that a document which is not well-formed XML is still parsed"""
+        data = RSS.format(items=ITEM.format(title='First', link='https://example.com/1') + '<br>').encode('utf-8')
+        self.assertEqual(1, len(ingest.parse_payload('feed', data).rows))
+        self.assertEqual(['https://example.com/1'], ingest.parse_payload('feed', data).links)
+        self.assertIsNotNone(ingest.parse_payload('feed', b'not a feed').error)
+
+    def test_ingest_feeds_in_batches(self):
+        """Checks that all feeds are cached by the writer with small batches, failed feeds are reported"""
+        first = self.write_feed('first.xml', [(f'First {number}', f'https://a.example/{number}')
+                                              for number in range(5)])
+        second = self.write_feed('second.xml', [('Second', 'https://b.example/1')])
+        missing = os.path.join(self.directory.name, 'missing.xml')
+        report = ingest.ingest([first, second, missing], self.connection, processes=2, batch_size=2)
+        self.assertEqual((2, 6, 0), (report.feeds, report.rows, report.duplicates))
+        self.assertEqual([missing], [url for url, _ in report.errors])
+        self.assertEqual(5, len(list(helper.get_cashed_feed(self.connection, first))))
+        self.assertEqual(2, self.connection.execute('SELECT count(*) FROM feeds').fetchone()[0])
+
+    def test_ingest_again_skips_unchanged_entries(self):
+        """Checks that a second ingestion writes only the entries which changed"""
+        items = [(f'First {number}', f'https://a.example/{number}') for number in range(3)]
+        path = self.write_feed('first.xml', items)
+        ingest.ingest([path], self.connection, processes=1)
+        self.write_feed('first.xml', items[:2] + [('Corrected', items[2][1]), ('New', 'https://a.example/new')])
+        report = ingest.ingest([path], self.connection, processes=1)
+        self.assertEqual((1, 1, 2), (report.inserted, report.updated, report.unchanged))
+        self.assertEqual('Corrected', self.connection.execute(
+            "SELECT title FROM news WHERE link='https://a.example/2'").fetchone()[0])
+
+    def test_ingest_drops_duplicates(self):
+        """Checks that fingerprints computed by workers drop articles repeated by another feed"""
+        first = self.write_feed('first.xml', [('Breaking news', 'https://a.example/news')])
+        second = self.write_feed('second.xml', [('Breaking news', 'https://www.a.example/news/?utm_source=rss')])
+        report = ingest.ingest([first, second], self.connection, processes=1,
+                               deduplicator=dedup.Deduplicator(self.connection))
+        self.assertEqual((1, 1), (report.rows, report.duplicates))
+
+    def test_writer_does_not_lock_the_cache_between_batches(self):
+        """Checks that fingerprints of a queued feed are committed, so other connections can write"""
+        path = os.path.join(self.directory.name, 'news.db')
+        connection = sqlite3.connect(path)
+        self.addCleanup(connection.close)
+        helper.init_database(connection)
+        writer = ingest.BatchWriter(connection, dedup.Deduplicator(connection))
+        data = RSS.format(items=ITEM.format(title='First', link='https://example.com/1')).encode('utf-8')
+        writer.add(ingest.parse_payload('feed', data, fingerprints=True))
+        self.assertFalse(connection.in_transaction)
+        other = sqlite3.connect(path, timeout=0)
+        self.addCleanup(other.close)
+        helper.save_validators(other, 'other', '"v1"', None)
+        writer.flush()
+        self.assertEqual(1, len(list(helper.get_cashed_feed(connection, 'feed'))))
+
+    def test_failed_batch_writes_nothing(self):
+        """Checks that rows, validators and documents of a batch are written in one transaction"""
+        payload_archive = archive.PayloadArchive(self.connection)
+        writer = ingest.BatchWriter(self.connection, payload_archive=payload_archive)
+        data = RSS.format(items=ITEM.format(title='First', link='https://example.com/1')).encode('utf-8')
+        writer.add(ingest.parse_payload('feed', data), ingest.Download('feed', etag='"v1"'))
+        writer.archive(ingest.Download('feed', data))
+        writer.archive(ingest.Download('broken', 'not bytes'))
+        with self.assertRaises(TypeError):
+            writer.flush()
+        self.assertEqual(0, len(helper.get_cashed_feed(self.connection, 'feed')))
+        self.assertEqual((None, None), helper.get_validators(self.connection, 'feed'))
+        self.assertEqual([], list(payload_archive.payloads()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+""" Test module for per-stage metrics. """
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from main_reader import helper
+from main_reader import metrics
+from main_reader.article import Article
+
+DATE = '2022-09-18T17:11:56Z'
+
+
+class TestMetrics(unittest.TestCase):
+    """Test cases to test collecting, printing and writing metrics"""
+
+    def setUp(self):
+        self.collector = metrics.enable()
+        self.addCleanup(metrics.disable)
+
+    def test_stages_and_counters(self):
+        """Checks that instrumented functions record their stage and rows"""
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        news = [Article(f'News {number}', f'https://example.com/{number}', DATE, 'S', '---') for number in range(3)]
+        helper.save_news(news, connection, 'https://example.com/rss')
+        self.assertEqual(3, len(list(helper.query_news(connection))))
+
+        data = self.collector.to_dict()
+        self.assertEqual(1, data['stages']['db_write']['calls'])
+        self.assertIn('cache_read', data['stages'])
+        self.assertEqual({'rows_written': 3, 'rows_inserted': 3, 'rows_updated': 0, 'rows_unchanged': 0,
+                          'rows_read': 3}, data['counters'])
+        self.assertIn('db_write', self.collector.summary())
+
+    def test_disabled_collector_records_nothing(self):
+        """Checks that without profiling stages and counters are ignored"""
+        metrics.disable()
+        with metrics.stage('fetch'):
+            metrics.count('entries', 10)
+        self.assertEqual({}, self.collector.stages)
+        self.assertEqual({}, self.collector.counters)
+
+    def test_write_prometheus_and_json(self):
+        """Checks both formats of the metrics file"""
+        with metrics.stage('fetch'):
+            metrics.count('bytes_downloaded', 1024)
+        with tempfile.TemporaryDirectory() as directory:
+            prometheus = os.path.join(directory, 'reader.prom')
+            self.collector.write(prometheus)
+            with open(prometheus) as file:
+                content = file.read()
+            self.assertIn('rss_reader_stage_calls_total{stage="fetch"} 1\n', content)
+            self.assertIn('rss_reader_bytes_downloaded_total 1024\n', content)
+
+            path = os.path.join(directory, 'reader.json')
+            self.collector.write(path)
+            with open(path) as file:
+                self.assertEqual(1024, json.load(file)['counters']['bytes_downloaded'])
+            self.assertEqual(['reader.json', 'reader.prom'], sorted(os.listdir(directory)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+""" Test module for the library API. """
+import functools
+import http.server
+import os
+import pathlib
+import tempfile
+import threading
+import unittest
+
+import main_reader
+from main_reader import errors
+from main_reader import feeds
+from main_reader import transport
+from main_reader.reader import Reader
+
+RSS = '''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>News</title>{items}</channel></rss>'''
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves files of a directory without logging requests"""
+
+    def log_message(self, *args):
+        pass
+
+
+ITEM = '<item><title>{title}</title><link>{link}</link><pubDate>Sun, 18 Sep 2022 17:11:56 GMT</pubDate></item>'
+
+
+class TestReader(unittest.TestCase):
+    """Test cases to test the Reader and its exceptions"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.reader = Reader(pathlib.Path(self.temp_dir.name) / 'news.db')
+        self.addCleanup(self.reader.close)
+
+    def write_feed(self, name, count):
+        """Writes an RSS feed with count items, returns its path"""
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(RSS.format(items=''.join(ITEM.format(title=f'{name} {number}', link=f'{name}/{number}')
+                                                for number in range(count))))
+        return path
+
+    def count_news(self):
+        """Number of cached news"""
+        return self.reader.connection.execute('SELECT count(*) FROM news').fetchone()[0]
+
+    def test_iter_feed_caches_the_feed(self):
+        """Checks that articles of a feed are yielded and can be read back from the cache"""
+        path = self.write_feed('first', 3)
+        self.assertEqual(['first 0', 'first 1', 'first 2'], [article.title for article in self.reader.iter_feed(path)])
+        self.assertEqual(['first/0'], [article.link for article in self.reader.iter_feed(path, limit=1)])
+        cached = self.reader.iter_cached('20220918', urls=[path], order='asc', limit=2)
+        self.assertEqual(['first/0', 'first/1'], [article.link for article in cached])
+
+    def test_iter_feed_is_lazy(self):
+        """Checks that the feed is fetched on the first article and cached chunk by chunk while it is read"""
+        iterator = self.reader.iter_feed('http://127.0.0.1:1/feed')
+        with self.assertRaises(errors.SourceUnavailableError):
+            next(iterator)
+
+        path = self.write_feed('long', feeds.CHUNK_SIZE + 50)
+        iterator = self.reader.iter_feed(path)
+        self.assertEqual('long 0', next(iterator).title)
+        self.assertEqual(feeds.CHUNK_SIZE, self.count_news())
+        self.assertEqual(feeds.CHUNK_SIZE + 49, len(list(iterator)))
+        self.assertEqual(feeds.CHUNK_SIZE + 50, self.count_news())
+
+    def test_interleaved_iterators_of_one_host(self):
+        """Checks that suspended iterators do not hold the request slots of their host"""
+        self.write_feed('long', feeds.CHUNK_SIZE * 3)
+        server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), functools.partial(QuietHandler, directory=self.temp_dir.name))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_address[1]}/long'
+        counts = []
+
+        def read():
+            # A reader of its own, a Reader is used by one thread, and this one is left behind if it hangs
+            with Reader(pathlib.Path(self.temp_dir.name) / 'interleaved.db') as reader:
+                iterators = [reader.iter_feed(url) for _ in range(transport.PER_HOST_LIMIT + 1)]
+                firsts = [next(iterator) for iterator in iterators]
+                counts.extend(len(list(iterator)) + 1 for iterator in iterators)
+                counts.append(len({article.title for article in firsts}))
+
+        thread = threading.Thread(target=read, daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([feeds.CHUNK_SIZE * 3] * (transport.PER_HOST_LIMIT + 1) + [1], counts)
+
+    def test_iter_feeds_and_fetch(self):
+        """Checks that a failed feed does not stop the others and its error is reported"""
+        first, second = self.write_feed('first', 2), self.write_feed('second', 1)
+        missing = os.path.join(self.temp_dir.name, 'missing.xml')
+        failures = []
+        news = self.reader.fetch([second, missing, first], on_error=lambda *failure: failures.append(failure))
+        self.assertEqual(['second/0', 'first/0', 'first/1'], [article.link for article in news])
+        self.assertEqual([missing], [url for url, _ in failures])
+
+        iterator = self.reader.iter_feeds([first, missing])
+        self.assertEqual(2, len([next(iterator), next(iterator)]))
+        with self.assertRaises(errors.InvalidFeedError):
+            next(iterator)
+
+    def test_cache_maintenance(self):
+        """Checks that the cache is ingested, pruned, compacted and reindexed through the reader"""
+        path = self.write_feed('first', 3)
+        report = self.reader.ingest([path], processes=1)
+        self.assertEqual((1, 3), (report.feeds, report.inserted))
+        self.assertEqual({}, self.reader.cache_images(list(self.reader.iter_cached(urls=[path]))))
+        self.reader.rebuild_index()
+        self.assertEqual(['first/1'], [article.link for article in self.reader.search('"first 1"')])
+        self.assertEqual(3, self.reader.prune(0))
+        self.reader.compact()
+        self.assertEqual(0, self.count_news())
+
+    def test_typed_errors(self):
+        """Checks that invalid arguments and unavailable sources raise exceptions of errors, not SystemExit"""
+        with self.assertRaises(errors.InvalidArgumentError):
+            self.reader.iter_cached('2022')
+        with self.assertRaises(ValueError):
+            self.reader.iter_cached(limit=0)
+        with self.assertRaises(errors.SourceUnavailableError):
+            list(self.reader.iter_feed('http://127.0.0.1:1/feed'))
+        with self.assertRaises(errors.InvalidFeedError):
+            self.reader.fetch([os.path.join(self.temp_dir.name, 'missing.xml')])
+        with self.assertRaises(errors.InvalidArgumentError):
+            self.reader.prune(-1)
+        with self.assertRaises(errors.InvalidArgumentError):
+            self.reader.watch([])
+        with self.assertRaises(errors.InvalidArgumentError):
+            self.reader.ingest([])
+        with self.assertRaises(errors.NewsNotFoundError):
+            self.reader.replay()
+        self.assertIs(main_reader.Reader, Reader)
+        self.assertTrue(issubclass(main_reader.InvalidFeedError, main_reader.ReaderError))
+
+
+if __name__ == '__main__':
+    unittest.main()
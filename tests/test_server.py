@@ -0,0 +1,98 @@
+""" Test module for the read-only JSON API over the cache. """
+import http.client
+import json
+import pathlib
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from main_reader import database
+from main_reader import helper
+from main_reader import server
+from main_reader.article import Article
+
+
+class TestServer(unittest.TestCase):
+    """Test cases to test the routes of the API, its result cache and the HTTP server"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = pathlib.Path(self.temp_dir.name) / 'news.db'
+        self.connection = database.connect(self.path)
+        self.addCleanup(self.connection.close)
+        helper.init_database(self.connection)
+        self.articles = [Article(f'Title_{i}', f'Link_{i}', f'2022-09-18T1{i}:00:00Z', 'Source', '---')
+                         for i in range(5)]
+        helper.save_news(self.articles[:3], self.connection, 'first')
+        helper.save_news(self.articles[3:], self.connection, 'second')
+        self.api = server.Api(self.path, pool_size=2)
+        self.addCleanup(self.api.close)
+
+    def get(self, target):
+        """Status and decoded body of the request"""
+        status, body = self.api.respond(target)
+        return status, json.loads(body)
+
+    def test_news_by_date_and_source(self):
+        """Checks that news are selected by date and source url with the fields of the JSON output"""
+        status, news = self.get('/news?date=20220918&source=first')
+        self.assertEqual(200, status)
+        self.assertEqual([article.to_dict() for article in self.articles[:3]], news)
+        self.assertEqual(['Link_0', 'Link_1', 'Link_3', 'Link_4'],
+                         [item['Link'] for item in self.get('/news?source=first&source=second&order=asc')[1]
+                          if item['Link'] != 'Link_2'])
+        self.assertEqual([], self.get('/news?date=20220919')[1])
+
+    def test_latest_news(self):
+        """Checks that the latest news come first and the limit is applied"""
+        self.assertEqual(['Link_4', 'Link_3'], [item['Link'] for item in self.get('/news/latest?limit=2')[1]])
+        self.assertEqual(['Link_2'], [item['Link'] for item in self.get('/news/latest?limit=1&source=first')[1]])
+
+    def test_invalid_requests(self):
+        """Checks that invalid arguments and unknown paths are answered with an error"""
+        self.assertEqual((400, {'error': 'Please, enter the date in "YYYYMMDD" format'}), self.get('/news?date=2022'))
+        self.assertEqual(400, self.get('/news/latest?limit=0')[0])
+        self.assertEqual(400, self.get('/news')[0])
+        self.assertEqual(404, self.get('/feeds')[0])
+
+    def test_responses_are_cached_until_news_are_written(self):
+        """Checks that a repeated request is answered from memory and a write drops the cached answers"""
+        first = self.api.respond('/news/latest')
+        pool, self.api.pool = self.api.pool, MagicMock()
+        self.assertIs(first[1], self.api.respond('/news/latest')[1])
+        self.api.pool.acquire.assert_not_called()
+        self.api.pool = pool
+
+        helper.save_news([Article('New', 'Link_new', '2022-09-19T10:00:00Z', 'Source', '---')], self.connection,
+                         'first')
+        self.assertIsNone(self.api.cache.get(('/news/latest', ())))
+
+    def test_result_cache_expires_and_evicts(self):
+        """Checks the TTL and the size limit of the result cache"""
+        now = [0]
+        cache = server.ResultCache(self.connection, size=2, ttl=10, clock=lambda: now[0])
+        for key in 'abc':
+            cache.put(key, key.encode(), cache.data_version)
+        self.assertEqual((None, b'b', b'c'), (cache.get('a'), cache.get('b'), cache.get('c')))
+        now[0] = 11
+        self.assertIsNone(cache.get('c'))
+
+    def test_serve_over_http(self):
+        """Checks that the API is served over keep-alive connections"""
+        api_server = server.ApiServer(('127.0.0.1', 0), self.api, MagicMock())
+        threading.Thread(target=api_server.serve_forever, daemon=True).start()
+        self.addCleanup(api_server.server_close)
+        self.addCleanup(api_server.shutdown)
+        connection = http.client.HTTPConnection('127.0.0.1', api_server.server_address[1])
+        self.addCleanup(connection.close)
+        for _ in range(2):
+            connection.request('GET', '/news/latest?limit=1')
+            response = connection.getresponse()
+            self.assertEqual((200, 'application/json'), (response.status, response.headers['Content-Type']))
+            self.assertEqual('Link_4', json.loads(response.read())[0]['Link'])
+
+
+if __name__ == '__main__':
+    unittest.main()
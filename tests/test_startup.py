@@ -0,0 +1,62 @@
+""" Start-up regression tests based on python -X importtime. """
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('xhtml2pdf', 'reportlab', 'dominate', 'feedparser', 'dateparser')
+# The library stack and the HTTP server are loaded by run(), after the arguments are parsed
+LAZY_MODULES = ('main_reader.reader', 'main_reader.server', 'http.server')
+# Standard modules the command line needs anyway, importing them is the baseline of the same machine and run
+BASELINE_MODULES = ('argparse', 'sqlite3', 'json', 'logging.handlers', 'ssl', 'http.client', 'email.utils')
+IMPORT_BUDGET = 2
+RUNS = 3
+
+
+def import_times(*args):
+    """Runs python -X importtime with args and returns cumulative import time of every module in microseconds"""
+    process = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=ROOT, capture_output=True,
+                             text=True, timeout=60)
+    times = dict()
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    """Test cases to check that heavy dependencies are loaded only when used"""
+
+    def assert_no_heavy_modules(self, times):
+        """Checks that none of the heavy packages was imported"""
+        loaded = sorted(name for name in times if name.split('.')[0] in HEAVY_MODULES)
+        self.assertEqual([], loaded)
+
+    def assert_no_lazy_modules(self, times):
+        """Checks that the library stack and the HTTP server were not imported"""
+        self.assertEqual([], [name for name in LAZY_MODULES if name in times])
+
+    def test_import_reader(self):
+        """Checks that importing the CLI module loads no more than twice the time of the standard modules it needs"""
+        times = import_times('-c', 'import main_reader.rss_reader')
+        self.assert_no_heavy_modules(times)
+        self.assert_no_lazy_modules(times)
+        # The best of several runs, a single one is at the mercy of the scheduler
+        imported = min(import_times('-c', 'import main_reader.rss_reader')['main_reader.rss_reader']
+                       for _ in range(RUNS))
+        baseline = min(sum(import_times('-c', f'import {", ".join(BASELINE_MODULES)}').get(name, 0)
+                           for name in BASELINE_MODULES) for _ in range(RUNS))
+        self.assertLess(imported, baseline * IMPORT_BUDGET)
+
+    def test_version(self):
+        """Checks that --version does not load heavy dependencies, the library stack and the HTTP server"""
+        times = import_times('-m', 'main_reader.rss_reader', '--version')
+        self.assert_no_heavy_modules(times)
+        self.assert_no_lazy_modules(times)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+""" Test module for the streaming feed parser. """
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from main_reader import feeds
+from main_reader import helper
+from main_reader import stream
+
+RSS = b'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/"><channel>
+<title>News</title><ttl>30</ttl><skipHours><hour>1</hour><hour>2</hour></skipHours>
+<item><title>First &amp; best</title><link>https://example.com/1</link>
+<pubDate>Sun, 18 Sep 2022 17:11:56 GMT</pubDate><source url="https://example.com/rss">Agency</source>
+<media:content url="https://example.com/1.jpg" medium="image"/></item>
+<item><title>Second</title><link>https://example.com/2</link><pubDate>Sun, 18 Sep 2022 16:00:00 GMT</pubDate></item>
+<item><title>Third</title><link>https://example.com/3</link><pubDate>Sun, 18 Sep 2022 15:00:00 GMT</pubDate></item>
+</channel></rss>'''
+
+ATOM = b'''<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom"><title>News</title>
+<entry><title>Atom news</title><link rel="self" href="https://example.com/self"/>
+<link href="https://example.com/atom"/><updated>2022-09-18T18:00:00Z</updated>
+<published>2022-09-18T17:11:56Z</published><source><title>Agency</title></source></entry>
+</feed>'''
+
+MIXED_RSS = b'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/"><channel><title>News</title>
+<item><title>Guid</title><guid>https://example.com/guid</guid><dc:date>2022-09-18T17:11:56Z</dc:date></item>
+<item><title>Relative</title><link>/relative</link><guid isPermaLink="false">id-1</guid>
+<pubDate>Sun, 18 Sep 2022 17:11:56 GMT</pubDate></item>
+<item><title>Relative guid</title><guid>guid/2</guid><pubDate>Sun, 18 Sep 2022 16:00:00 +0200</pubDate></item>
+</channel></rss>'''
+
+MIXED_ATOM = b'''<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xml:base="https://example.com/base/"><title>News</title>
+<entry><title>Updated</title><link href="updated"/><updated>2022-09-18T18:00:00Z</updated></entry>
+<entry xml:base="/other/"><title>Identified</title><id>https://example.com/id</id>
+<link rel="enclosure" href="sound.mp3"/><updated>2022-09-18T19:00:00+03:00</updated></entry>
+<entry><title>Own base</title><link xml:base="https://mirror.example.com/" href="own"/>
+<published>2022-09-18T17:11:56Z</published></entry>
+</feed>'''
+
+
+def describe(article):
+    """Everything an article is cached with"""
+    return article.title, article.link, article.date, article.source, article.image, article.fingerprint
+
+
+class CountingReader(io.BytesIO):
+    """Remembers how many bytes were read"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+class TestStream(unittest.TestCase):
+    """Test cases to test incremental parsing and the early stop of limited fetches"""
+
+    def test_rss_entries_and_hints(self):
+        """Checks that RSS items are read with the fields create_articles needs and all channel hints"""
+        feed = stream.FeedStream(io.BytesIO(RSS))
+        articles = list(helper.create_articles(feed))
+        self.assertEqual(['First & best', 'Second', 'Third'], [article.title for article in articles])
+        self.assertEqual('Agency', articles[0].source)
+        self.assertEqual('https://example.com/1.jpg', articles[0].image)
+        self.assertEqual('---', articles[1].image)
+        self.assertEqual('2022-09-18 17:11:56+00:00', str(articles[0].date))
+        self.assertEqual((30, {1, 2}, True), (feed.ttl, feed.skip_hours, feed.finished))
+
+    def test_atom_entry(self):
+        """Checks the alternate link, the published date and the source of Atom entries"""
+        entry, = stream.FeedStream(io.BytesIO(ATOM))
+        self.assertEqual({'title': 'Atom news', 'link': 'https://example.com/atom', 'source': {'title': 'Agency'},
+                          'published': '2022-09-18T17:11:56Z', 'updated': '2022-09-18T18:00:00Z'}, entry)
+
+    def test_same_articles_as_feedparser(self):
+        """Checks that both parsers make the same articles and fingerprints, so their rows do not overwrite"""
+        import feedparser
+
+        for document in (RSS, ATOM, MIXED_RSS, MIXED_ATOM):
+            for url in ('feed.xml', 'https://example.com/feeds/rss'):
+                with self.subTest(document=document[:60], url=url):
+                    streamed = helper.create_articles(stream.FeedStream(io.BytesIO(document),
+                                                                        url if url.startswith('http') else None))
+                    parsed = feedparser.parse(document, response_headers=helper.feedparser_headers(url))
+                    self.assertEqual([describe(article) for article in helper.create_articles(parsed['entries'])],
+                                     [describe(article) for article in streamed])
+
+    def test_reading_stops_at_the_limit(self):
+        """Checks that taking the first entries of a large feed reads only the beginning of it"""
+        items = b''.join(b'<item><title>News %d</title><link>https://example.com/%d</link></item>' % (number, number)
+                         for number in range(10000))
+        reader = CountingReader(b'<rss><channel>' + items + b'</channel></rss>')
+        feed = stream.FeedStream(reader)
+        entries = [entry for _, entry in zip(range(5), feed)]
+        self.assertEqual('News 4', entries[-1]['title'])
+        self.assertFalse(feed.finished)
+        self.assertLess(reader.bytes_read, len(reader.getvalue()) / 4)
+
+    def test_limited_fetch_does_not_keep_validators(self):
+        """Checks that a truncated feed is cached without validators, so the next fetch reads it fully"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feed.xml')
+            with open(path, 'wb') as file:
+                file.write(RSS)
+            result = feeds.fetch_feed(path, limit=2)
+            self.assertEqual((2, False), (len(result.articles), result.complete))
+            self.assertTrue(feeds.fetch_feed(path, limit=5).complete)
+
+        connection = sqlite3.connect(':memory:')
+        helper.init_database(connection)
+        result.etag = '"v1"'
+        feeds.store_result(result, connection, MagicMock())
+        self.assertEqual((None, None), helper.get_validators(connection, path))
+
+    def test_malformed_feed_falls_back_to_feedparser(self):
+        """Checks that a feed which is not well-formed XML is still read"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feed.xml')
+            with open(path, 'wb') as file:
+                file.write(RSS.replace(b'</channel></rss>', b'<br></channel></rss>'))
+            result = feeds.fetch_feed(path, limit=2)
+        self.assertTrue(result.ok)
+        self.assertEqual(['First & best', 'Second'], [article.title for article in result.articles])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+""" Test module for the pooled HTTP transport, run against a local HTTP server. """
+import concurrent.futures
+import base64
+import gzip
+import http.server
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from main_reader import errors
+from main_reader import helper
+from main_reader import transport
+
+RSS = b'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>News</title>
+<item><title>First</title><link>https://example.com/1</link><pubDate>Sun, 18 Sep 2022 17:11:56 GMT</pubDate></item>
+</channel></rss>''' + b'<!-- padding -->' * 200
+
+
+class FeedHandler(http.server.BaseHTTPRequestHandler):
+    """Keep-alive server of a feed with gzip, validators, failures and slow answers"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    connections = 0
+    requests = []
+    active = 0
+    max_active = 0
+    proxy_authorization = None
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            FeedHandler.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.lock:
+            FeedHandler.requests.append(self.path)
+            FeedHandler.proxy_authorization = self.headers.get('Proxy-Authorization')
+            FeedHandler.active += 1
+            FeedHandler.max_active = max(FeedHandler.max_active, FeedHandler.active)
+        try:
+            self.answer()
+        finally:
+            with self.lock:
+                FeedHandler.active -= 1
+
+    def answer(self):
+        if self.path == '/redirect':
+            return self.send_body(302, b'', {'Location': '/feed'})
+        if self.path == '/flaky' and FeedHandler.requests.count('/flaky') == 1:
+            return self.send_body(503, b'Try later')
+        if self.path == '/slow':
+            time.sleep(1)
+        if self.path == '/busy':
+            time.sleep(0.1)
+        if self.headers.get('If-None-Match') == '"v1"':
+            return self.send_body(304, b'')
+        body, headers = RSS, {'ETag': '"v1"', 'Content-Type': 'application/rss+xml'}
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body, headers['Content-Encoding'] = gzip.compress(body), 'gzip'
+        self.send_body(200, body, headers)
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except ConnectionError:
+            # The client gave up waiting for a slow answer
+            pass
+
+
+class TestTransport(unittest.TestCase):
+    """Test cases to test connection reuse, compression, retries, timeouts and per-host limits"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FeedHandler.connections = 0
+        FeedHandler.requests = []
+        FeedHandler.max_active = 0
+        self.transport = transport.Transport(backoff=0)
+        self.addCleanup(self.transport.close)
+
+    def get(self, path, headers=None):
+        """Downloads the whole body of the path"""
+        with self.transport.open(self.base_url + path, headers) as response:
+            return response.status, response.read()
+
+    def test_connection_is_reused(self):
+        """Checks that requests to one host are sent over one keep-alive connection"""
+        for _ in range(5):
+            self.assertEqual((200, RSS), self.get('/feed'))
+        self.assertEqual((1, 5), (FeedHandler.connections, len(FeedHandler.requests)))
+
+    def test_gzip_body_is_decompressed(self):
+        """Checks that the body is sent compressed and the compressed size is what was received"""
+        with self.transport.open(self.base_url + '/feed') as response:
+            self.assertEqual(RSS, response.read(100) + response.read())
+        self.assertEqual(len(gzip.compress(RSS)), response.bytes_received)
+
+    def test_redirect_and_not_modified(self):
+        """Checks that redirects are followed and 304 responses keep the connection"""
+        self.assertEqual((200, RSS), self.get('/redirect'))
+        self.assertEqual((304, b''), self.get('/feed', {'If-None-Match': '"v1"'}))
+        self.assertEqual(1, FeedHandler.connections)
+
+    def test_server_error_is_retried(self):
+        """Checks that a temporary error of the server is retried"""
+        self.assertEqual((200, RSS), self.get('/flaky'))
+        self.assertEqual(['/flaky', '/flaky'], FeedHandler.requests)
+
+    def test_read_timeout(self):
+        """Checks that a server which does not answer fails the request after the read timeout"""
+        self.transport = transport.Transport(read_timeout=0.2, retries=1, backoff=0)
+        self.addCleanup(self.transport.close)
+        started = time.monotonic()
+        with self.assertRaises(transport.TransportError):
+            self.get('/slow')
+        self.assertLess(time.monotonic() - started, 0.9)
+
+    def test_per_host_limit(self):
+        """Checks that no more than per_host requests are sent to one host at a time"""
+        self.transport = transport.Transport(per_host=2)
+        self.addCleanup(self.transport.close)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
+            statuses = list(executor.map(lambda _: self.get('/busy')[0], range(6)))
+        self.assertEqual([200] * 6, statuses)
+        self.assertEqual(2, FeedHandler.max_active)
+        self.assertLessEqual(FeedHandler.connections, 2)
+
+    def test_proxy_from_environment(self):
+        """Checks that http requests go to the proxy of the environment with absolute urls, except NO_PROXY hosts"""
+        with patch.dict(os.environ, {'http_proxy': self.base_url, 'no_proxy': 'direct.example.com'}):
+            self.transport = transport.Transport(backoff=0)
+        self.addCleanup(self.transport.close)
+        for _ in range(2):
+            with self.transport.open('http://feeds.example.com/feed') as response:
+                self.assertEqual((200, RSS), (response.status, response.read()))
+        self.assertEqual((1, ['http://feeds.example.com/feed'] * 2), (FeedHandler.connections, FeedHandler.requests))
+        self.assertIsNone(self.transport.proxy('http', 'direct.example.com'))
+        self.assertIsNone(self.transport.proxy('https', 'feeds.example.com'))
+
+    def test_proxy_credentials(self):
+        """Checks that credentials of the proxy url are sent as Proxy-Authorization and bypassed hosts are direct"""
+        port = self.server.server_address[1]
+        self.transport = transport.Transport(backoff=0, proxies={'http': f'user:p%40ss@127.0.0.1:{port}',
+                                                                 'no': 'localhost'})
+        self.addCleanup(self.transport.close)
+        with self.transport.open('http://feeds.example.com/feed') as response:
+            response.read()
+        self.assertEqual('Basic ' + base64.b64encode(b'user:p@ss').decode('ascii'), FeedHandler.proxy_authorization)
+        with self.transport.open(f'http://localhost:{port}/feed') as response:
+            response.read()
+        self.assertEqual(('/feed', None), (FeedHandler.requests[-1], FeedHandler.proxy_authorization))
+
+    def test_parse_feed_over_transport(self):
+        """Checks that feeds are parsed from the downloaded bytes with the validators of the response"""
+        rss_news = helper.parse_feed(self.base_url + '/feed')
+        self.assertEqual(('"v1"', 200, 'First'), (rss_news['etag'], rss_news['status'], rss_news.entries[0].title))
+        self.assertEqual((RSS, 'application/rss+xml'), (rss_news['payload'], rss_news['content_type']))
+        self.assertTrue(helper.is_not_modified(helper.parse_feed(self.base_url + '/feed', '"v1"')))
+
+    def test_unavailable_source(self):
+        """Checks that a refused connection makes the source unavailable"""
+        with self.assertRaises(errors.SourceUnavailableError) as cl:
+            helper.open_feed('http://127.0.0.1:1/feed')
+        self.assertEqual("Source isn't available", cl.exception.args[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
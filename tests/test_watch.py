@@ -0,0 +1,160 @@
+""" Test module for the watch mode scheduler. """
+import concurrent.futures
+import datetime
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from main_reader import feeds
+from main_reader import helper
+from main_reader import watch
+from main_reader.article import Article
+
+DATE = '2022-09-18T17:11:56Z'
+START = datetime.datetime(2022, 9, 18, 10, 30, tzinfo=datetime.timezone.utc).timestamp()
+
+
+def make_articles(*numbers):
+    """Articles of a feed"""
+    return [Article(f'News {number}', f'https://example.com/{number}', DATE, 'S', '---') for number in numbers]
+
+
+@patch('main_reader.watch.random.uniform', return_value=0)
+class TestScheduler(unittest.TestCase):
+    """Test cases to test the order of polls and adaptive intervals"""
+
+    def setUp(self):
+        self.scheduler = watch.Scheduler(['a', 'b'], START, interval=600)
+
+    def test_due_feeds_in_order(self, _):
+        """Checks that feeds come out of the queue by the time of their next poll"""
+        self.assertEqual(['a'], self.scheduler.pop_due(START, limit=1))
+        self.scheduler.success('a', START, 0)
+        self.assertEqual(['b'], self.scheduler.pop_due(START))
+        self.assertEqual([], self.scheduler.pop_due(START + 60))
+        self.assertEqual(900, self.scheduler.delay(START))
+
+    def test_interval_follows_publishing_rate(self, _):
+        """Checks that a busy feed is polled more often and a quiet one less often"""
+        self.scheduler.pop_due(START)
+        self.scheduler.success('a', START, 5)
+        self.scheduler.success('a', START + 600, 10)
+        self.assertEqual(330, self.scheduler.feeds['a'].interval)
+        self.scheduler.success('b', START, 0)
+        self.scheduler.success('b', START + 900, 0)
+        self.assertEqual(1350, self.scheduler.feeds['b'].interval)
+
+    def test_interval_is_bounded(self, _):
+        """Checks the minimal and the maximal interval and the ttl as the lower bound"""
+        for second in range(10):
+            schedule = self.scheduler.success('a', START + second, 100)
+        self.assertEqual(watch.MIN_INTERVAL, schedule.interval)
+        schedule = self.scheduler.success('a', START + 10, 100, ttl=60)
+        self.assertEqual(START + 10 + 3600, schedule.next_poll)
+        for _ in range(50):
+            schedule = self.scheduler.success('b', START, 0)
+        self.assertEqual(watch.MAX_INTERVAL, schedule.interval)
+
+    def test_skip_hours(self, _):
+        """Checks that a poll falling into skipHours is moved to the first allowed hour"""
+        schedule = self.scheduler.success('a', START, 0, skip_hours={10, 11})
+        self.assertEqual(datetime.datetime(2022, 9, 18, 12, tzinfo=datetime.timezone.utc).timestamp(),
+                         schedule.next_poll)
+
+    def test_exponential_backoff(self, _):
+        """Checks that every failure doubles the delay of the retry and a success resets it"""
+        delays = [self.scheduler.failure('a', START).next_poll - START for _ in range(3)]
+        self.assertEqual([120, 240, 480], delays)
+        self.scheduler.success('a', START, 0)
+        self.assertEqual(0, self.scheduler.feeds['a'].errors)
+
+
+class TestWatcher(unittest.TestCase):
+    """Test cases to test polling feeds from one process"""
+
+    def setUp(self):
+        self.connection = sqlite3.connect(':memory:')
+        helper.init_database(self.connection)
+        self.now = START
+        self.printed = []
+        self.watcher = watch.Watcher(['https://example.com/rss'], 2, self.connection, MagicMock(),
+                                     on_news=self.printed.append, clock=lambda: self.now)
+
+    def test_feed_hints(self):
+        """Checks that ttl and skipHours are read from the parsed feed"""
+        rss_news = {'feed': {'ttl': '60', 'skiphours': '', 'hour': '3'}}
+        self.assertEqual((60, {3}), helper.feed_hints(rss_news))
+        self.assertEqual((None, set()), helper.feed_hints({'feed': {}}))
+
+    def test_fetched_feed_skips_all_hours(self):
+        """Checks that every hour of skipHours of a fetched document is kept, not the last one only"""
+        hours = ''.join(f'<hour>{hour}</hour>' for hour in range(7))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feed.xml')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(f'<rss version="2.0"><channel><title>News</title><ttl>60</ttl><skipHours>{hours}'
+                           '</skipHours><item><title>News 1</title><link>https://example.com/1</link>'
+                           f'<pubDate>{DATE}</pubDate></item></channel></rss>')
+            result = feeds.fetch_feed(path)
+        self.assertEqual((60, set(range(7))), (result.ttl, result.skip_hours))
+
+    def test_only_new_news_are_reported(self):
+        """Checks that a poll caches news and reports the ones which were not seen before"""
+        results = [feeds.FeedResult('https://example.com/rss', make_articles(1, 2), ttl=30),
+                   feeds.FeedResult('https://example.com/rss', make_articles(2, 3))]
+        with patch('main_reader.feeds.fetch_feed', side_effect=results), \
+                concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            self.watcher.poll(executor)
+            schedule = self.watcher.scheduler.feeds['https://example.com/rss']
+            self.assertGreaterEqual(schedule.next_poll, START + 30 * 60 * (1 - watch.JITTER))
+            self.now = schedule.next_poll
+            self.watcher.poll(executor)
+
+        self.assertEqual([make_articles(1, 2), make_articles(3)], self.printed)
+        self.assertEqual(3, self.connection.execute('SELECT COUNT(*) FROM news').fetchone()[0])
+
+    def test_failed_poll_is_retried(self):
+        """Checks that an error schedules a retry instead of stopping the watch"""
+        with patch('main_reader.feeds.fetch_feed', return_value=feeds.FeedResult('https://example.com/rss',
+                                                                                 error='timed out')), \
+                concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            self.watcher.poll(executor)
+        self.assertEqual(1, self.watcher.scheduler.feeds['https://example.com/rss'].errors)
+        self.assertEqual([], self.printed)
+
+    def test_not_modified_feed_is_not_read_from_cache(self):
+        """Checks that a 304 poll does not load the cached news of the feed"""
+        with patch('main_reader.feeds.fetch_feed', return_value=feeds.FeedResult('https://example.com/rss',
+                                                                                 not_modified=True)), \
+                patch('main_reader.helper.get_cashed_feed') as get_cashed_feed, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            self.watcher.poll(executor)
+        get_cashed_feed.assert_not_called()
+        self.assertIsNotNone(self.watcher.scheduler.feeds['https://example.com/rss'].last_poll)
+
+    def test_saturated_executor_waits_for_a_poll(self):
+        """Checks that with more feeds due than polls in flight a poll waits for one to finish instead of spinning"""
+        urls = [f'https://example.com/{number}' for number in range(5)]
+        watcher = watch.Watcher(urls, 1, self.connection, MagicMock(), clock=lambda: self.now)
+        started = []
+
+        def fetch_feed(url, *args, **kwargs):
+            started.append(url)
+            time.sleep(0.05)
+            return feeds.FeedResult(url, not_modified=True)
+
+        with patch('main_reader.feeds.fetch_feed', side_effect=fetch_feed), \
+                patch('main_reader.watch.concurrent.futures.wait', wraps=concurrent.futures.wait) as wait, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            for _ in range(3):
+                watcher.poll(executor)
+        self.assertEqual([None] * 3, [call.kwargs['timeout'] for call in wait.call_args_list])
+        self.assertEqual(urls[:4], started)
+        self.assertEqual(3, sum(schedule.last_poll is not None for schedule in watcher.scheduler.feeds.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()